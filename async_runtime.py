@@ -0,0 +1,224 @@
+# uasyncio runtime mode.
+# Connection management, MQTT receive, sensor sampling and rendering run as
+# separate coroutines, so a missing WiFi network, broker or NTP server never
+# freezes the UI. Every network step has a timeout and exponential backoff.
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+from clock import ticks_ms, ticks_diff
+
+
+class Backoff:
+    """Exponential retry delay between min_ms and max_ms"""
+
+    def __init__(self, min_ms=1000, max_ms=60000):
+        self.min = min_ms
+        self.max = max_ms
+        self.delay = min_ms
+
+    def reset(self):
+        self.delay = self.min
+
+    def next(self):
+        delay = self.delay
+        self.delay = min(self.delay * 2, self.max)
+        return delay
+
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(awaitable, timeout_ms):
+    if hasattr(asyncio, 'wait_for_ms'):
+        return await asyncio.wait_for_ms(awaitable, timeout_ms)
+    return await asyncio.wait_for(awaitable, timeout_ms / 1000)
+
+
+async def tcp_probe(host, port, timeout_ms):
+    """Check that a TCP server accepts connections without blocking the loop"""
+    try:
+        reader, writer = await wait_for_ms(asyncio.open_connection(host, port), timeout_ms)
+    except Exception:
+        return False
+    try:
+        writer.close()
+        await writer.wait_closed()
+    except Exception:
+        pass
+    return True
+
+
+async def ntp_probe(host, timeout_ms, port=123):
+    """Check that an NTP server answers a query without blocking the loop"""
+    sock = None
+    try:
+        addr = socket.getaddrinfo(host, port)[0][-1]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        query = bytearray(48)
+        query[0] = 0x1b  # client request, NTP version 3
+        sock.sendto(query, addr)
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < timeout_ms:
+            try:
+                if sock.recv(48):
+                    return True
+            except OSError:
+                pass
+            await sleep_ms(50)
+        return False
+    except Exception:
+        return False
+    finally:
+        if sock is not None:
+            sock.close()
+
+
+class AsyncRuntime:
+    """Run the station as cooperating coroutines.
+
+    hooks maps step names to plain functions supplied by main.py:
+      wifi_begin()      start a non-blocking WiFi association
+      wifi_connected()  -> bool
+      mqtt_connect()    -> bool, only called once the broker answers a probe
+      mqtt_poll()       receive pending messages, False or raise when dead
+      ntp_sync()        -> bool, only called once the NTP server answers a
+                        probe (when ntp_server is given)
+      sample(), render(), rgb()
+      drain()           optional, publish buffered readings
+      batch()           optional, publish a partial batch that is due
+      diag()            optional, publish the heap statistics
+      set_status(name, value)
+    status and codes are the status dict and Status class from main.py.
+    """
+
+    def __init__(self, hooks, status, codes, timing, mqtt_server, mqtt_port=1883,
+                 ntp_server=None, ntp_port=123):
+        self.hooks = hooks
+        self.status = status
+        self.codes = codes
+        self.intervals = timing['intervals']
+        self.timeouts = timing['timeouts']
+        self.mqtt_server = mqtt_server
+        self.mqtt_port = mqtt_port
+        self.ntp_server = ntp_server
+        self.ntp_port = ntp_port
+        self.stats = {'wifi_attempts': 0, 'mqtt_attempts': 0, 'ntp_attempts': 0, 'renders': 0}
+
+    def _set(self, name, value):
+        self.hooks['set_status'](name, value)
+
+    async def wifi_task(self):
+        backoff = Backoff(self.timeouts['backoff_min'], self.timeouts['backoff_max'])
+        while True:
+            if self.hooks['wifi_connected']():
+                self._set('wifi', self.codes.CONNECTED)
+                backoff.reset()
+                await sleep_ms(self.intervals['wifi'])
+                continue
+            self.stats['wifi_attempts'] += 1
+            self._set('wifi', self.codes.CONNECTING)
+            self.hooks['wifi_begin']()
+            start = ticks_ms()
+            while (not self.hooks['wifi_connected']() and
+                   ticks_diff(ticks_ms(), start) < self.timeouts['wifi']):
+                await sleep_ms(100)
+            if self.hooks['wifi_connected']():
+                self._set('wifi', self.codes.CONNECTED)
+                backoff.reset()
+            else:
+                self._set('wifi', self.codes.FAILED)
+                await sleep_ms(backoff.next())
+
+    async def mqtt_task(self):
+        backoff = Backoff(self.timeouts['backoff_min'], self.timeouts['backoff_max'])
+        while True:
+            if self.status['wifi'] != self.codes.CONNECTED:
+                if self.status['mqtt'] != self.codes.NO_WIFI:
+                    self._set('mqtt', self.codes.NO_WIFI)
+                await sleep_ms(500)
+                continue
+            if self.status['mqtt'] == self.codes.CONNECTED:
+                await sleep_ms(500)
+                continue
+            self.stats['mqtt_attempts'] += 1
+            self._set('mqtt', self.codes.CONNECTING)
+            # The client connect is blocking, so only call it once the broker
+            # is known to be reachable
+            if (await tcp_probe(self.mqtt_server, self.mqtt_port, self.timeouts['mqtt'])
+                    and self.hooks['mqtt_connect']()):
+                self._set('mqtt', self.codes.CONNECTED)
+                backoff.reset()
+            else:
+                self._set('mqtt', self.codes.FAILED)
+                await sleep_ms(backoff.next())
+
+    async def mqtt_rx_task(self):
+        while True:
+            if self.status['mqtt'] == self.codes.CONNECTED:
+                try:
+                    alive = self.hooks['mqtt_poll']()
+                except Exception:
+                    alive = False
+                if alive is False:
+                    self._set('mqtt', self.codes.FAILED)
+            await sleep_ms(self.intervals['mqtt_poll'])
+
+    async def ntp_task(self):
+        backoff = Backoff(self.timeouts['backoff_min'], self.timeouts['backoff_max'])
+        while True:
+            if self.status['wifi'] == self.codes.CONNECTED:
+                self.stats['ntp_attempts'] += 1
+                # The NTP client blocks without a timeout, so only call it
+                # once the server is known to answer
+                if ((self.ntp_server is None
+                     or await ntp_probe(self.ntp_server, self.timeouts['ntp'], self.ntp_port))
+                        and self.hooks['ntp_sync']()):
+                    return
+                await sleep_ms(backoff.next())
+            else:
+                await sleep_ms(500)
+
+    async def periodic(self, name, interval):
+        fn = self.hooks[name]
+        intervals = self.intervals
+        while True:
+            try:
+                fn()
+            except Exception as e:
+                print("Task {} error: {}".format(name, e))
+            if name == 'render':
+                self.stats['renders'] += 1
+            # Read every time round, so a retuned period applies next run
+            await sleep_ms(intervals[interval])
+
+    async def main(self, duration_ms=None):
+        tasks = [
+            asyncio.create_task(self.wifi_task()),
+            asyncio.create_task(self.mqtt_task()),
+            asyncio.create_task(self.mqtt_rx_task()),
+            asyncio.create_task(self.ntp_task()),
+            asyncio.create_task(self.periodic('sample', 'sample')),
+            asyncio.create_task(self.periodic('render', 'ui')),
+            asyncio.create_task(self.periodic('rgb', 'rgb')),
+        ]
+        for name in ('drain', 'batch', 'diag'):
+            if name in self.hooks:
+                tasks.append(asyncio.create_task(self.periodic(name, name)))
+        if duration_ms is None:
+            while True:
+                await sleep_ms(60000)
+        await sleep_ms(duration_ms)
+        for task in tasks:
+            task.cancel()
+
+    def run(self, duration_ms=None):
+        """Run the runtime forever, or for duration_ms on a host"""
+        asyncio.run(self.main(duration_ms))
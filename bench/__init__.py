@@ -0,0 +1 @@
+# Benchmarks for the firmware hot paths. suite.py also runs on the device.
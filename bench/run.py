@@ -0,0 +1,129 @@
+# Run the benchmark suite against the simulator and check for regressions.
+#
+#     python -m bench.run                      # compare with bench/baseline.json
+#     python -m bench.run --save               # record a new baseline
+#     python -m bench.run --compare device.json --baseline device_baseline.json
+#
+# --compare checks the output of `mpremote run bench/suite.py` instead of
+# running on the host. Exits with status 1 when any case regresses beyond
+# the thresholds stored with the baseline.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from bench import suite
+from sim.harness import Simulation
+from tools import build_icons, pack_resources
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+
+# Allowed growth over the baseline per metric: (relative, absolute). Host
+# timings vary run to run far more than the memory figures do, so time only
+# fails on a doubling; tighten it in a device baseline file.
+THRESHOLDS = {'us': (1.0, 5.0), 'blocks': (0.1, 2), 'peak': (0.1, 64)}
+
+
+def run_host(only=None, warmup_ms=15000):
+    """Let the station connect in the simulator, then run the suite on it"""
+    flash = tempfile.TemporaryDirectory()
+    sim = Simulation(duration_ms=warmup_ms, root=flash.name)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        icons = os.path.join(flash.name, 'w32')
+        build_icons.main([os.path.join(os.path.dirname(HERE), 'img', 'w32'), '-o', icons])
+        pack_resources.main([icons + '=w32', '-o', os.path.join(flash.name, 'res.bin')])
+        station = sim.run()
+        # Any wait from here on just advances the clock
+        sim.duration_ms = float('inf')
+        return suite.run(types.SimpleNamespace(**station), only, sim.broker.held)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        sim.close()
+        flash.cleanup()
+
+
+def load_results(path):
+    """Results from a saved baseline or captured device output"""
+    with open(path) as f:
+        text = f.read()
+    try:
+        return json.loads(text)
+    except ValueError:
+        # Device output has the firmware's console lines before the report
+        for line in reversed(text.splitlines()):
+            if line.startswith('{'):
+                return json.loads(line)
+        raise
+
+
+def compare(results, baseline, thresholds):
+    """Print a comparison table, return the names of regressed cases"""
+    regressed = []
+    print("{:<22}{:>12}{:>12}{:>9}{:>9}{:>9}".format(
+        "case", "us", "baseline", "change", "blocks", "peak"))
+    for name, current in results.items():
+        base = baseline.get(name)
+        flags = []
+        if base:
+            for metric, (rel, slack) in thresholds.items():
+                if current[metric] > base[metric] * (1 + rel) + slack:
+                    flags.append(metric)
+            change = "{:+.0f}%".format((current['us'] / base['us'] - 1) * 100) if base['us'] else "-"
+            base_us = base['us']
+        else:
+            change = "new"
+            base_us = "-"
+        print("{:<22}{:>12}{:>12}{:>9}{:>9}{:>9}  {}".format(
+            name, current['us'], base_us, change, current['blocks'], current['peak'],
+            "REGRESSION " + ",".join(flags) if flags else ""))
+        if flags:
+            regressed.append(name)
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the firmware hot paths")
+    parser.add_argument('--baseline', default=BASELINE, help="baseline file to compare against")
+    parser.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--compare', help="check saved device output instead of running on the host")
+    parser.add_argument('--case', action='append', help="only run the named case")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        results = load_results(args.compare)['results']
+    else:
+        results = run_host(args.case)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'thresholds': THRESHOLDS, 'results': results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Saved baseline to {}".format(args.baseline))
+        return 0
+
+    if os.path.exists(args.baseline):
+        saved = load_results(args.baseline)
+        baseline = saved['results']
+        thresholds = dict(THRESHOLDS)
+        thresholds.update((k, tuple(v)) for k, v in saved.get('thresholds', {}).items())
+    else:
+        print("No baseline at {}, run with --save first".format(args.baseline))
+        baseline = {}
+        thresholds = THRESHOLDS
+    regressed = compare(results, baseline, thresholds)
+    if regressed:
+        print("{} case(s) regressed: {}".format(len(regressed), ", ".join(regressed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+# Benchmark cases for the firmware hot paths.
+#
+# Runs unchanged on MicroPython and CPython. On the device:
+#
+#     mpremote run bench/suite.py > device.json
+#
+# imports main.py without starting its loop, brings up the connections in
+# the foreground and prints the results as one JSON object. On a PC, python -m bench.run drives
+# the same cases against the simulator and checks them against a baseline.
+#
+# Per case: us is the wall time per call, blocks the heap allocations per
+# call and peak the heap growth during one call. On MicroPython both memory
+# figures come from gc.mem_alloc() with the collector off (blocks are the
+# 16-byte GC blocks); on CPython from tracemalloc and the net change in
+# allocated blocks.
+import gc
+import sys
+import time
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Host runs patch time.ticks_us with the simulator's virtual clock, so the
+# real clock has to be preferred there. CPU time of the calling thread keeps
+# the broker thread and other processes out of the figures.
+if hasattr(time, 'thread_time'):
+    def now_us():
+        return int(time.thread_time() * 1000000)
+
+    def elapsed_us(start):
+        return now_us() - start
+else:
+    now_us = time.ticks_us
+
+    def elapsed_us(start):
+        return time.ticks_diff(time.ticks_us(), start)
+
+GC_BLOCK = 16
+ROUNDS = 5
+
+
+class Nothing:
+    """Default for the quiet context of measure()"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def weather_payload():
+    """A weather/data message shaped like sample_weather_data.json"""
+    days = ("TODAY", "SAT", "SUN", "MON", "TUE", "WED", "THU")
+    icons = ("01d", "03d", "10d", "10d", "02d")
+    forecast = []
+    for i in range(5):
+        forecast.append({"day": days[i], "date": "{:02d}/07".format(4 + i),
+                         "temp": 28.3 - i * 2.1, "humidity": 39 + i * 9, "icon": icons[i]})
+    history = []
+    for i in range(7):
+        history.append({"day": days[(i + 1) % 7], "date": "{:02d}/06".format(27 + i),
+                        "temp": 32.0 - (i % 3) * 2.5, "humidity": 85 - i * 4})
+    return json.dumps({
+        "location": "LAT: 48.7758, LON: 9.1829", "gps_lat": 48.7758, "gps_lon": 9.1829,
+        "condition": "scattered clouds", "current_icon": "03n", "wind_speed": 1.4,
+        "wind_direction": "NW", "current_temp": 17.62, "humidity": 84, "pressure": 1024,
+        "forecast": forecast, "history": history, "timestamp": "2025-07-04T00:47:36Z"
+    })
+
+
+def alert_rules():
+    """Rules shaped like sample_rules.json: thresholds, a rate and hysteresis"""
+    return [
+        {"id": "frost", "key": "temp", "below": 2.0, "clear": 3.0, "level": "warning"},
+        {"id": "heat", "key": "heat_index", "above": 40.0, "clear": 38.0, "level": "emergency"},
+        {"id": "storm", "key": "press", "rate": True, "window": 1800, "below": -2.0, "clear": -1.0,
+         "level": "emergency"},
+        {"id": "falling", "key": "tendency", "below": -3.0, "clear": -2.0},
+        {"id": "humid", "key": "hum", "above": 85.0, "clear": 80.0, "level": "info"},
+    ]
+
+
+def cases(station):
+    """(name, fn, calls per round) for every benchmark.
+
+    station is the main module (or its globals); the firmware modules it
+    loaded are imported by name.
+    """
+    import connection
+    import screens
+    import telemetry
+    import weather_data
+    from state import history_data
+    payload = weather_payload()
+    message = payload.encode()
+    data = json.loads(payload)
+    weather_data.parse_weather_data(data)
+    history = [h for h in history_data if h]
+    scheduler = station.create_scheduler()
+
+    def history_bars():
+        for day in history:
+            weather_data.get_bar_height(day[2], "temp", 66)
+            weather_data.get_bar_height(day[3], "humidity", 66)
+            weather_data.get_temp_color(day[2])
+            weather_data.get_humidity_color(day[3])
+
+    cache = screens.get_text_cache()
+
+    def home_texts():
+        for key, text_fn in screens.HOME_FIELDS:
+            text_fn(cache)
+
+    control = telemetry.get_rate_controller()
+    rate_epoch = [0]
+    rate_values = (21.5, 45.0, 1013.2)
+
+    def rate_update():
+        rate_epoch[0] += 1
+        control.volatile(rate_epoch[0], rate_values)
+
+    metrics = telemetry.get_derived()
+    derived_fixed = [2150, 4500, 10132]
+
+    def derived_metrics():
+        metrics.update(derived_fixed)
+
+    rules = connection.get_rule_engine()
+    rules.load(alert_rules())
+    rule_epoch = [0]
+
+    def rules_update():
+        rule_epoch[0] += 1
+        rules.update(rule_epoch[0])
+
+    # The diag report runs every few minutes and is measured on its own
+    tasks = [task for task in scheduler.tasks if task.name != 'diag']
+
+    def loop_iteration():
+        # Worst case: every task falls due in the same wakeup
+        now = scheduler.clock()
+        for task in tasks:
+            task.deadline = now
+        scheduler.run_pending()
+
+    return (
+        ('format_temperature', lambda: weather_data.format_temperature(21.37), 500),
+        ('parse_weather_data', lambda: weather_data.parse_weather_data(data), 50),
+        ('mqtt_callback', lambda: connection.mqtt_callback(b'weather/data', message), 20),
+        ('history_bars', history_bars, 50),
+        ('update_history_scale', weather_data.update_history_scale, 50),
+        ('get_weather_icon', lambda: weather_data.get_weather_icon('50n'), 500),
+        ('home_texts', home_texts, 500),
+        ('show_forecast_screen', screens.show_forecast_screen, 10),
+        ('show_history_screen', screens.show_history_screen, 10),
+        ('rate_update', rate_update, 500),
+        ('derived_metrics', derived_metrics, 500),
+        ('rules_update', rules_update, 500),
+        ('send_mqtt_data', lambda: telemetry.send_mqtt_data(time.time(), 21.5, 45.0, 1013.2), 20),
+        ('loop_iteration', loop_iteration, 10),
+        ('publish_diag', connection.publish_diag, 5),
+    )
+
+
+def measure(fn, calls, quiet=None):
+    """Time calls to fn (best of ROUNDS) and the heap cost of one call.
+
+    The memory figures are taken inside a quiet() context, which the host
+    runner uses to hold the simulator's broker thread.
+    """
+    # Warm up lazy imports and caches
+    fn()
+    best = None
+    for _ in range(ROUNDS):
+        gc.collect()
+        start = now_us()
+        for _ in range(calls):
+            fn()
+        us = elapsed_us(start) / calls
+        if best is None or us < best:
+            best = us
+    gc.collect()
+    gc.disable()
+    try:
+        with (quiet or Nothing)():
+            blocks, peak = heap_cost(fn)
+    finally:
+        gc.enable()
+    return {'us': round(best, 1), 'blocks': blocks, 'peak': peak}
+
+
+def heap_cost(fn):
+    """(blocks, peak bytes) for one call, collector already off"""
+    if tracemalloc is not None:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        blocks = sys.getallocatedblocks()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] - base
+        blocks = sys.getallocatedblocks() - blocks
+        tracemalloc.stop()
+        return blocks, peak
+    base = gc.mem_alloc()
+    fn()
+    peak = gc.mem_alloc() - base
+    return peak // GC_BLOCK, peak
+
+
+def run(station, only=None, quiet=None):
+    results = {}
+    for name, fn, calls in cases(station):
+        if only and name not in only:
+            continue
+        results[name] = measure(fn, calls, quiet)
+    return results
+
+
+if __name__ == '__main__':
+    import main
+    main.bring_up()
+    main.wait_for_network()
+    results = run(main)
+    print(json.dumps({'platform': sys.platform, 'results': results}))
@@ -0,0 +1,27 @@
+# Tick helpers shared by the firmware modules.
+# MicroPython provides these in the time module; on CPython equivalent
+# fallbacks are used so the modules can be run and measured on a host.
+import time
+
+try:
+    ticks_ms = time.ticks_ms
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+    ticks_add = time.ticks_add
+    sleep_ms = time.sleep_ms
+except AttributeError:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_us():
+        return int(time.monotonic() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def sleep_ms(ms):
+        if ms > 0:
+            time.sleep(ms / 1000)
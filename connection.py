@@ -0,0 +1,381 @@
+# Connections: WiFi, the ENV III unit, MQTT and NTP.
+# Every check returns straight away - WiFi association is started and then
+# polled by the scheduler - so bring-up runs in the background while the
+# screens and sampling are already live.
+import wifiCfg
+import time
+from clock import ticks_ms, ticks_diff
+import ujson
+from state import Status, ui, device, config, status, sensor, derived, timing, store, mark_boot, boot_time, get_heap_monitor
+# navigate_to_screen is called through the module so the profiler's hook
+# on it sees these calls too
+import screens
+from screens import handle_rgb_alert, wake_screen
+from weather_data import parse_weather_data, get_weather_parser
+
+# An RTC reading an earlier year has not been set since power-up
+CLOCK_MIN_YEAR = 2024
+
+def clock_set():
+    """Whether time.time() can stamp readings: NTP has synced, or the RTC
+    kept the time (e.g. across deep sleep)"""
+    return device['ntp'] is not None or time.localtime()[0] >= CLOCK_MIN_YEAR
+
+def fetch_time():
+    print("Fetching NTP time...")
+    try:
+        # Runtime imports for time functionality
+        import ntptime
+        from machine import RTC
+        
+        before = time.time()
+        device['ntp'] = ntptime.client(host=config['ntp_server'], timezone=config['timezone'])
+        device['rtc'] = RTC()
+        print("NTP time fetched successfully")
+        mark_boot('ntp')
+        # Readings held since boot carry the unset clock's time
+        offset = time.time() - before
+        if offset and device['send_buffer'] is not None:
+            print("Restamped {} buffered readings".format(device['send_buffer'].restamp(boot_time, before, offset)))
+        return True
+    except Exception as e:
+        print("Failed to fetch NTP time")
+        return False
+
+STATUS_NAMES = {'wifi': "WiFi", 'env': "ENV", 'mqtt': "MQTT"}
+
+def set_status(name, value):
+    """Record a connection status and fall back to the status screen on failure"""
+    if store.set('status', name, value):
+        print("{} status changed".format(STATUS_NAMES[name]))
+        if value == Status.CONNECTED:
+            mark_boot(name)
+        if value == Status.FAILED and ui['screen'] != "status":
+            screens.navigate_to_screen("status")
+
+def start_wifi_connect():
+    """Start a non-blocking WiFi association"""
+    try:
+        wifiCfg.wlan_sta.active(True)
+        wifiCfg.wlan_sta.connect(config['wifi_ssid'], config['wifi_password'])
+    except Exception as e:
+        print("WiFi connect error: {}".format(e))
+
+def get_radio_schedule():
+    if device['radio'] is None:
+        from power import RadioSchedule
+        device['radio'] = RadioSchedule(
+            config['power_burst'],
+            config['power_linger_s'] * 1000,
+            config['power_burst_timeout_s'] * 1000
+        )
+    return device['radio']
+
+def radio_wanted():
+    """False between publish bursts in the low-power modes"""
+    if config['power_mode'] == "normal":
+        return True
+    buffer = device['send_buffer']
+    pending = len(buffer) if buffer is not None else 0
+    return get_radio_schedule().wanted(pending, device['ntp'] is None, status['mqtt'] == Status.CONNECTED)
+
+def stop_radio():
+    """Close MQTT and switch WiFi off until the next burst"""
+    if device['mqtt_session'] is not None:
+        device['mqtt_session'].close()
+    try:
+        wifiCfg.wlan_sta.disconnect()
+        wifiCfg.wlan_sta.active(False)
+    except Exception as e:
+        print("WiFi off error: {}".format(e))
+    set_status('mqtt', Status.DISCONNECTED)
+    set_status('wifi', Status.DISCONNECTED)
+    print("Radio off")
+
+def check_wifi_connection():
+    """Poll WiFi, starting an association when needed; never blocks.
+
+    An association that is not up within timeouts['wifi'] fails and is
+    retried after intervals['wifi']. Between low-power publish bursts the
+    radio is switched off instead.
+    """
+    if not radio_wanted():
+        if status['wifi'] != Status.DISCONNECTED:
+            stop_radio()
+        return False
+    if wifiCfg.wlan_sta.isconnected():
+        set_status('wifi', Status.CONNECTED)
+        return True
+    now = ticks_ms()
+    if status['wifi'] == Status.CONNECTING:
+        if ticks_diff(now, device['wifi_started']) >= timing['timeouts']['wifi']:
+            set_status('wifi', Status.FAILED)
+        return False
+    if status['wifi'] == Status.FAILED and ticks_diff(now, device['wifi_started']) < timing['intervals']['wifi']:
+        return False
+    device['wifi_started'] = now
+    start_wifi_connect()
+    set_status('wifi', Status.CONNECTING)
+    return False
+
+def check_env_connection():
+    try:
+        # Runtime import for unit functionality
+        import unit
+        
+        if device['env3_0'] is None:
+            device['env3_0'] = unit.get(unit.ENV3, unit.PORTA)
+        temp = device['env3_0'].temperature
+        result = True
+    except:
+        device['env3_0'] = None
+        result = False
+    
+    set_status('env', Status.CONNECTED if result else Status.FAILED)
+    return result
+
+def mqtt_callback(topic, msg):
+    try:
+        topic_str = topic.decode('utf-8')
+        
+        print("MQTT received topic: {} ({} bytes)".format(topic_str, len(msg)))
+        
+        if topic_str == 'weather/data':
+            # Parsed straight from the payload bytes, keeping only what the UI shows
+            parse_weather_data(get_weather_parser().parse(msg))
+        elif topic_str == 'weather/alert_trigger':
+            print("Processing weather alert...")
+            raise_alert(ujson.loads(msg))
+        elif topic_str == 'weather/rules':
+            handle_rules(msg)
+        elif topic_str == 'weather/profile':
+            handle_profile_command(msg)
+    except Exception as e:
+        print("MQTT callback error: {}".format(e))
+        pass
+
+def raise_alert(alert):
+    """Show an alert from the broker or a local rule"""
+    device['weather_alert'] = alert
+    print("Alert parsed: {}".format(alert))
+    # Handle RGB alert based on level
+    handle_rgb_alert(alert.get("level", "info"))
+    wake_screen()
+    # Navigate to alert screen when alert is received
+    print("Navigating to alert screen...")
+    screens.navigate_to_screen("alert")
+
+def get_rule_engine():
+    """Local alert rules, loaded from the flash copy of the last weather/rules"""
+    if device['rules'] is None:
+        from rules import RuleEngine
+        sources = {'temp': sensor, 'hum': sensor, 'press': sensor}
+        for key in derived:
+            sources[key] = derived
+        # Derived metrics are held in tenths
+        device['rules'] = RuleEngine(sources, dict((key, 10) for key in derived))
+        try:
+            with open(config['rules_path']) as f:
+                device['rules'].load(ujson.loads(f.read()))
+            print("Loaded {} alert rules".format(len(device['rules'])))
+        except OSError:
+            pass
+        except ValueError as e:
+            print("Cached alert rules invalid: {}".format(e))
+    return device['rules']
+
+def handle_rules(msg):
+    """weather/rules payloads: a JSON list of rules, replacing the current ones"""
+    engine = get_rule_engine()
+    try:
+        engine.load(ujson.loads(msg))
+    except ValueError as e:
+        print("Alert rules rejected: {}".format(e))
+        return False
+    print("Loaded {} alert rules".format(len(engine)))
+    try:
+        with open(config['rules_path'], 'wb') as f:
+            f.write(msg)
+    except OSError as e:
+        print("Could not save alert rules: {}".format(e))
+    return True
+
+def get_mqtt_client_id():
+    """Client id for the persistent session, unique per station"""
+    if config['mqtt_client_id']:
+        return config['mqtt_client_id']
+    try:
+        import machine
+        import ubinascii
+        return "m5go_env_{}".format(ubinascii.hexlify(machine.unique_id()).decode())
+    except:
+        return "m5go_env"
+
+def create_mqtt_client(keepalive):
+    # Runtime import for MQTT functionality
+    from umqtt.simple import MQTTClient
+    return MQTTClient(get_mqtt_client_id(), config['mqtt_server'], keepalive=keepalive)
+
+def get_mqtt_session():
+    if device['mqtt_session'] is None:
+        from mqtt_session import MQTTSession
+        device['mqtt_session'] = MQTTSession(
+            create_mqtt_client,
+            ("weather/data", "weather/alert_trigger", "weather/rules", "weather/profile"),
+            mqtt_callback,
+            keepalive_s=config['mqtt_keepalive'],
+            backoff_min_ms=timing['timeouts']['backoff_min'],
+            backoff_max_ms=timing['timeouts']['backoff_max'],
+            on_connect=on_mqtt_connect,
+            topics_path=config['mqtt_topics_path']
+        )
+    return device['mqtt_session']
+
+def publish_capabilities():
+    """Advertise the payload formats on a retained per-station topic"""
+    from sensor_payload import capabilities
+    client_id = get_mqtt_client_id()
+    names = ()
+    if config['derived_metrics']:
+        from derived import METRICS
+        names = METRICS + ("pressure_tendency",)
+    message = capabilities(client_id, config['sensor_format'], config['publish_batch'], config['publish_format'], names)
+    device['mqtt_session'].publish("weather/capabilities/{}".format(client_id), message, True)
+
+def publish_diag():
+    """Publish the heap and GC statistics on weather/diag"""
+    # The session, not status['mqtt'], so this also works from on_connect
+    if not config['diagnostics'] or device['mqtt_session'] is None or not device['mqtt_session'].connected:
+        return False
+    heap = get_heap_monitor()
+    report = heap.report(config['diag_probe'])
+    report['client_id'] = get_mqtt_client_id()
+    report['uptime_ms'] = ticks_ms()
+    try:
+        import machine
+        report['reset_cause'] = machine.reset_cause()
+    except:
+        pass
+    if not device['mqtt_session'].publish(b"weather/diag", ujson.dumps(report)):
+        set_status('mqtt', Status.FAILED)
+        return False
+    # A MemoryError snapshot from before the last reset is reported once
+    heap.last_crash = None
+    return True
+
+def get_profiler():
+    if device['profiler'] is None:
+        from profiler import Profiler
+        device['profiler'] = Profiler(config['profile_window'])
+    return device['profiler']
+
+def set_profiling(enabled):
+    """Hook the profiler into the loop, or take it out again"""
+    profiler = get_profiler()
+    if enabled == profiler.enabled:
+        return
+    if enabled:
+        # Scheduler tasks (and their start latency) and the busy time per
+        # wakeup; the async runtime only gets the screen sections
+        scheduler = device['scheduler']
+        if scheduler is not None:
+            profiler.hook(scheduler, 'run_pending', 'loop')
+            for task in scheduler.tasks:
+                profiler.hook_task(task)
+        profiler.hook(store, 'flush', 'ui_flush')
+        profiler.hook(screens, 'navigate_to_screen', 'navigate')
+    else:
+        profiler.unhook()
+    profiler.enabled = enabled
+    print("Profiling {}".format("on" if enabled else "off"))
+
+def publish_profile():
+    """Publish the section timings on weather/profile/report"""
+    if device['mqtt_session'] is None or not device['mqtt_session'].connected:
+        return False
+    profiler = get_profiler()
+    message = ujson.dumps({
+        'client_id': get_mqtt_client_id(),
+        'enabled': profiler.enabled,
+        'uptime_ms': ticks_ms(),
+        'sections': profiler.report()
+    })
+    if not device['mqtt_session'].publish(b"weather/profile/report", message):
+        set_status('mqtt', Status.FAILED)
+        return False
+    return True
+
+def handle_profile_command(msg):
+    """weather/profile payloads: on, off, reset or report"""
+    command = msg.strip()
+    if command == b"on":
+        set_profiling(True)
+    elif command == b"off":
+        set_profiling(False)
+    elif command == b"reset":
+        get_profiler().reset()
+    elif command == b"report":
+        publish_profile()
+    else:
+        print("Unknown profile command")
+
+def on_mqtt_connect():
+    publish_capabilities()
+    # Report straight away after a reset instead of one diag period later
+    if get_heap_monitor().last_crash is not None:
+        publish_diag()
+
+def connect_mqtt():
+    """Open the persistent MQTT session (subscribes only for a new session)"""
+    return get_mqtt_session().connect()
+
+def check_mqtt_connection():
+    if not wifiCfg.wlan_sta.isconnected():
+        set_status('mqtt', Status.NO_WIFI)
+        return False
+    
+    # A healthy session is left alone; reconnect only after a failure,
+    # once its backoff delay has passed
+    session = get_mqtt_session()
+    if session.connected:
+        set_status('mqtt', Status.CONNECTED)
+        return True
+    if not session.due():
+        return False
+    
+    set_status('mqtt', Status.CONNECTING)
+    result = session.connect()
+    set_status('mqtt', Status.CONNECTED if result else Status.FAILED)
+    return result
+
+def get_date_string():
+    # NTP is synced in the background, never block for it here
+    return device['ntp'].formatDate('-') if device['ntp'] else "unknown"
+
+def poll_mqtt():
+    """Receive MQTT messages and keep the session alive"""
+    if device['mqtt_session'] is None or status['mqtt'] != Status.CONNECTED:
+        return True
+    alive = device['mqtt_session'].poll()
+    if not alive:
+        set_status('mqtt', Status.FAILED)
+    return alive
+
+def get_ntp_sync():
+    if device['ntp_sync'] is None:
+        from ntp_sync import NtpSync
+        device['ntp_sync'] = NtpSync(
+            config['ntp_server'],
+            fetch_time,
+            port=config['ntp_port'],
+            timeout_ms=timing['timeouts']['ntp'],
+            backoff_min_ms=timing['timeouts']['backoff_min'],
+            backoff_max_ms=timing['timeouts']['backoff_max']
+        )
+    return device['ntp_sync']
+
+def sync_time():
+    """Step the NTP probe until the first sync succeeds; the blocking
+    ntptime client only runs once the server has answered"""
+    if device['ntp'] is None and wifiCfg.wlan_sta.isconnected():
+        get_ntp_sync().poll()
@@ -1,9 +1,12 @@
 # M5Stack Deployment Script
-# This script compiles Python to .mpy format and deploys to M5Stack device
+# This script compiles the firmware modules to .mpy format and deploys them to
+# the M5Stack device. main.py is copied as source, since the device only runs
+# main.py (not main.mpy) at boot.
 
 param(
     [string]$ComPort = "COM19",
-    [string]$MainFile = "main.py"
+    [string]$MainFile = "main.py",
+    [string[]]$Modules = @("state.py", "weather_data.py", "screens.py", "connection.py", "telemetry.py", "clock.py", "scheduler.py", "async_runtime.py", "mqtt_session.py", "ntp_sync.py", "record_buffer.py", "sensor_payload.py", "timeseries.py", "report_filter.py", "sampler.py", "weather_parser.py", "icons.py", "resources.py", "heap_monitor.py", "profiler.py", "render_text.py", "observable.py", "rate_control.py", "power.py", "derived.py", "rules.py")
 )
 
 Write-Host "M5Stack Deployment Script (with .mpy compilation)" -ForegroundColor Green
@@ -19,12 +22,9 @@ Write-Host "Using COM port: $ComPort" -ForegroundColor Yellow
 Write-Host "Source file: $MainFile" -ForegroundColor Yellow
 Write-Host ""
 
-# Get the base filename without extension
-$BaseName = [System.IO.Path]::GetFileNameWithoutExtension($MainFile)
-$MpyFile = "$BaseName.mpy"
-
-# Step 1: Compile Python to .mpy
-Write-Host "Step 1: Compiling $MainFile to $MpyFile..." -ForegroundColor Cyan
+# Step 1: Find the mpy-cross compiler for the modules
+Write-Host "Step 1: Looking for mpy-cross..." -ForegroundColor Cyan
+$Compile = $true
 try {
     # Check if mpy-cross is available
     $mpyCrossPath = Get-Command mpy-cross -ErrorAction SilentlyContinue
@@ -51,34 +51,26 @@ try {
         if (-not $mpyCrossFound) {
             Write-Host "Error: mpy-cross compiler not found!" -ForegroundColor Red
             Write-Host "Please install it with: pip install mpy-cross" -ForegroundColor Yellow
-            Write-Host "Falling back to deploying .py file directly..." -ForegroundColor Yellow
-            $MpyFile = $MainFile
+            Write-Host "Falling back to deploying .py files directly..." -ForegroundColor Yellow
+            $Compile = $false
         } else {
             Write-Host "Found mpy-cross at: $mpyCrossPath" -ForegroundColor Green
         }
-    }
-    
-    if ($MpyFile -ne $MainFile) {
-        & $mpyCrossPath $MainFile
-        if ($LASTEXITCODE -eq 0 -and (Test-Path $MpyFile)) {
-            Write-Host "✓ Compilation successful! Created $MpyFile" -ForegroundColor Green
-        } else {
-            Write-Host "✗ Compilation failed! Falling back to .py file" -ForegroundColor Yellow
-            $MpyFile = $MainFile
-        }
+    } else {
+        Write-Host "Found mpy-cross at: $($mpyCrossPath.Source)" -ForegroundColor Green
     }
 } catch {
-    Write-Host "✗ Compilation error: $_" -ForegroundColor Yellow
+    Write-Host "✗ mpy-cross lookup error: $_" -ForegroundColor Yellow
     Write-Host "Falling back to .py file deployment..." -ForegroundColor Yellow
-    $MpyFile = $MainFile
+    $Compile = $false
 }
 
 Write-Host ""
 
-# Step 2: Copy the file to the device
-Write-Host "Step 2: Copying $MpyFile to M5Stack..." -ForegroundColor Cyan
+# Step 2: Copy main.py to the device - kept as source so it runs at boot
+Write-Host "Step 2: Copying $MainFile to M5Stack..." -ForegroundColor Cyan
 try {
-    & mpremote connect $ComPort fs cp $MpyFile :
+    & mpremote connect $ComPort fs cp $MainFile :
     if ($LASTEXITCODE -eq 0) {
         Write-Host "✓ File copied successfully!" -ForegroundColor Green
     } else {
@@ -92,13 +84,43 @@ try {
 
 Write-Host ""
 
+# Step 2b: Copy the support modules imported by main.py
+Write-Host "Step 2b: Copying support modules..." -ForegroundColor Cyan
+foreach ($Module in $Modules) {
+    if (-not (Test-Path $Module)) {
+        Write-Host "✗ $Module not found!" -ForegroundColor Red
+        exit 1
+    }
+    $ModuleFile = $Module
+    if ($Compile) {
+        $ModuleMpy = [System.IO.Path]::ChangeExtension($Module, ".mpy")
+        & $mpyCrossPath $Module
+        if ($LASTEXITCODE -eq 0 -and (Test-Path $ModuleMpy)) {
+            $ModuleFile = $ModuleMpy
+        } else {
+            Write-Host "✗ Compiling $Module failed! Copying the .py file" -ForegroundColor Yellow
+        }
+    }
+    & mpremote connect $ComPort fs cp $ModuleFile :
+    if ($LASTEXITCODE -eq 0) {
+        Write-Host "✓ $ModuleFile copied" -ForegroundColor Green
+    } else {
+        Write-Host "✗ Failed to copy $ModuleFile!" -ForegroundColor Red
+        exit 1
+    }
+    if ($ModuleFile -ne $Module) {
+        # A stale .py copy would be imported instead of the .mpy
+        & mpremote connect $ComPort fs rm ":$Module" 2>$null | Out-Null
+        Remove-Item $ModuleFile -Force
+    }
+}
+
+Write-Host ""
+
 # Step 3: Run the file on the device
 Write-Host "Step 3: Running the application on M5Stack..." -ForegroundColor Cyan
 try {
-    # Determine which file to run based on what was deployed
-    $RunFile = if ($MpyFile -eq $MainFile) { $MainFile } else { $BaseName }
-    
-    & mpremote connect $ComPort run $RunFile
+    & mpremote connect $ComPort run $MainFile
     if ($LASTEXITCODE -eq 0) {
         Write-Host "✓ Application started successfully!" -ForegroundColor Green
     } else {
@@ -112,9 +134,3 @@ try {
 
 Write-Host ""
 Write-Host "Deployment completed!" -ForegroundColor Green
-
-# Cleanup: Remove the .mpy file if it was created
-if ($MpyFile -ne $MainFile -and (Test-Path $MpyFile)) {
-    Write-Host "Cleaning up temporary $MpyFile file..." -ForegroundColor Gray
-    Remove-Item $MpyFile -Force
-}
@@ -6,7 +6,11 @@ param(
     [string]$ComPort = "COM19",
     [string]$BaseDir = ".",
     [string]$RemoteDir = "res",
-    [switch]$ForceAll
+    [switch]$ForceAll,
+    # Deploy the RGB565 blobs from tools/build_icons.py instead of the PNGs
+    [switch]$Raw,
+    # Deploy a resource bundle from tools/pack_resources.py instead of single files
+    [string]$Bundle = ""
 )
 
 $StatusFile = "deploy_status.json"
@@ -59,6 +63,28 @@ $AllWeatherIcons = @(
     'unknown.png'
 )
 
+# A bundle is one copy, renamed over the old bundle only once it is complete
+if ($Bundle) {
+    if (-not (Test-Path $Bundle)) {
+        Write-Host "Error: $Bundle not found!" -ForegroundColor Red
+        exit 1
+    }
+    $RemoteBundle = [System.IO.Path]::GetFileName($Bundle)
+    Write-Host "Deploying bundle $Bundle as /$RemoteBundle..." -ForegroundColor Cyan
+    & mpremote connect $ComPort fs cp $Bundle ":$RemoteBundle.new"
+    if ($LASTEXITCODE -ne 0) {
+        Write-Host "✗ Failed to copy $Bundle" -ForegroundColor Red
+        exit 1
+    }
+    & mpremote connect $ComPort exec "import os; os.rename('$RemoteBundle.new', '$RemoteBundle')"
+    if ($LASTEXITCODE -ne 0) {
+        Write-Host "✗ Failed to replace $RemoteBundle" -ForegroundColor Red
+        exit 1
+    }
+    Write-Host "✓ Bundle deployed" -ForegroundColor Green
+    exit 0
+}
+
 # Load previous deployment status
 $DeploymentStatus = @{}
 $WeatherIcons = @()
@@ -110,11 +136,12 @@ try {
 Write-Host ""
 
 foreach ($icon in $WeatherIcons) {
-    $LocalIconPath = Join-Path $BaseDir $icon
+    $IconFile = if ($Raw) { [System.IO.Path]::ChangeExtension($icon, ".565") } else { $icon }
+    $LocalIconPath = Join-Path $BaseDir $IconFile
     if (Test-Path $LocalIconPath) {
-        Write-Host "Deploying $icon from $BaseDir..." -ForegroundColor Cyan
+        Write-Host "Deploying $IconFile from $BaseDir..." -ForegroundColor Cyan
         try {
-            & mpremote connect $ComPort fs cp $LocalIconPath `:$RemoteDir/$icon
+            & mpremote connect $ComPort fs cp $LocalIconPath `:$RemoteDir/$IconFile
             if ($LASTEXITCODE -eq 0) {
                 Write-Host "✓ $icon deployed successfully" -ForegroundColor Green
                 $DeploymentStatus[$icon] = "Success"
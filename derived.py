@@ -0,0 +1,161 @@
+# Derived weather metrics from one ENV III reading.
+# Dew point, absolute humidity, heat index and sea-level pressure, computed
+# in integer fixed point from the time series' fixed-point sample (0.01 C,
+# 0.01 %, 0.1 hPa) into a preallocated array, in tenths. MicroPython boxes
+# every float result on the heap while small ints are free, so a sample
+# costs no allocation. The exp()-based parts are tabulated once: saturation
+# vapour pressure (Magnus) and the sea-level reduction factor for the
+# configured altitude per degree from T_MIN to T_MAX, and the NWS heat
+# index per degree and 5 % RH from HI_MIN. Lookups interpolate linearly; the
+# dew point is found by searching the vapour pressure table backwards.
+# Intermediate products stay below 2**30, the small int range.
+import math
+from array import array
+
+from timeseries import TEMPERATURE, HUMIDITY, PRESSURE, to_fixed
+
+T_MIN = -40
+T_MAX = 60
+HI_MIN = 20  # C; below it the NWS simple formula is linear and computed directly
+HI_MAX = 50
+HI_RH_STEP = 5  # %
+SLP_SHIFT = 15  # sea-level factor scale, 2**15
+
+DEW_POINT = 0
+ABS_HUMIDITY = 1
+HEAT_INDEX = 2
+SEA_LEVEL = 3
+METRICS = ("dew_point", "abs_humidity", "heat_index", "sea_level_pressure")
+
+
+def magnus(t):
+    """Saturation vapour pressure over water in hPa (table building only)"""
+    return 6.112 * math.exp(17.62 * t / (243.12 + t))
+
+
+def heat_index(t, rh):
+    """NWS heat index in C (table building only)"""
+    f = t * 1.8 + 32
+    hi = 0.5 * (f + 61.0 + (f - 68.0) * 1.2 + rh * 0.094)
+    if (hi + f) / 2 >= 80:
+        hi = (-42.379 + 2.04901523 * f + 10.14333127 * rh - 0.22475541 * f * rh
+              - 0.00683783 * f * f - 0.05481717 * rh * rh + 0.00122874 * f * f * rh
+              + 0.00085282 * f * rh * rh - 0.00000199 * f * f * rh * rh)
+        if rh < 13 and 80 <= f <= 112:
+            hi -= (13 - rh) / 4 * math.sqrt((17 - abs(f - 95)) / 17)
+        elif rh > 85 and 80 <= f <= 87:
+            hi += (rh - 85) / 10 * (87 - f) / 5
+    return (hi - 32) / 1.8
+
+
+class Derived:
+    """Lookup tables for one station altitude (m)"""
+
+    def __init__(self, altitude=0):
+        self.altitude = altitude
+        size = T_MAX - T_MIN + 1
+        # 0.001 hPa, up to about 200000 at T_MAX
+        self.es = array('i', [int(magnus(T_MIN + i) * 1000 + 0.5) for i in range(size)])
+        # Hypsometric reduction to sea level at each station temperature
+        lapse = 0.0065 * altitude
+        self.slp = array('i', [int((1 - lapse / (T_MIN + i + lapse + 273.15)) ** -5.257 * (1 << SLP_SHIFT) + 0.5)
+                               for i in range(size)])
+        rh_steps = 100 // HI_RH_STEP + 1
+        self.hi_cols = rh_steps
+        self.hi = array('h', [int(round(heat_index(HI_MIN + i // rh_steps, i % rh_steps * HI_RH_STEP) * 10))
+                              for i in range((HI_MAX - HI_MIN + 1) * rh_steps)])
+        self.values = array('h', [0] * len(METRICS))
+        self.fixed = [0] * 3
+
+    def _lookup(self, table, t):
+        """Table value at t (0.01 C), interpolated"""
+        x = t - T_MIN * 100
+        if x <= 0:
+            return table[0]
+        last = len(table) - 1
+        if x >= last * 100:
+            return table[last]
+        i = x // 100
+        return table[i] + (table[i + 1] - table[i]) * (x - i * 100) // 100
+
+    def vapour_pressure(self, t, rh):
+        """Actual vapour pressure in 0.001 hPa from t (0.01 C) and rh (0.01 %)"""
+        es = self._lookup(self.es, t)
+        # es * rh can pass 2**30; split rh into 0.1 % and 0.01 % parts
+        return (es * (rh // 10) + es * (rh % 10) // 10) // 1000
+
+    def dew_point(self, e):
+        """Dew point in 0.1 C for vapour pressure e (0.001 hPa)"""
+        es = self.es
+        low = 0
+        high = len(es) - 1
+        if e <= es[low]:
+            return T_MIN * 10
+        if e >= es[high]:
+            return T_MAX * 10
+        # es rises with temperature; find es[low] <= e < es[low + 1]
+        while high - low > 1:
+            mid = (low + high) // 2
+            if es[mid] <= e:
+                low = mid
+            else:
+                high = mid
+        return (T_MIN + low) * 10 + ((e - es[low]) * 20 // (es[high] - es[low]) + 1) // 2
+
+    def abs_humidity(self, t, e):
+        """Water vapour density in 0.1 g/m3: 216.7 * e / T(K)"""
+        kelvin = t + 27315
+        return (2167 * e + 5 * kelvin) // (10 * kelvin)
+
+    def heat_index(self, t, rh):
+        """NWS heat index in 0.1 C from t (0.01 C) and rh (0.01 %)"""
+        if t < HI_MIN * 100:
+            # Simple formula, 1.1 t - 3.944 + 0.02611 rh, in C
+            return (11 * t - 3944 + 2611 * rh // 10000 + 50) // 100
+        x = t - HI_MIN * 100
+        i = x // 100
+        if i >= HI_MAX - HI_MIN:
+            i = HI_MAX - HI_MIN - 1
+            ft = 100
+        else:
+            ft = x - i * 100
+        y = rh if rh < 10000 else 10000
+        j = y // (HI_RH_STEP * 100)
+        if j >= self.hi_cols - 1:
+            j = self.hi_cols - 2
+        fr = y - j * HI_RH_STEP * 100
+        cols = self.hi_cols
+        hi = self.hi
+        base = i * cols + j
+        span = HI_RH_STEP * 100
+        # Bilinear, weights in 0.01 C and 0.01 %
+        return ((hi[base] * (100 - ft) + hi[base + cols] * ft) * (span - fr)
+                + (hi[base + 1] * (100 - ft) + hi[base + cols + 1] * ft) * fr
+                + 50 * span) // (100 * span)
+
+    def sea_level(self, p, t):
+        """Pressure p (0.1 hPa) reduced to sea level, in 0.1 hPa"""
+        if not self.altitude:
+            return p
+        return (p * self._lookup(self.slp, t) + (1 << (SLP_SHIFT - 1))) >> SLP_SHIFT
+
+    def update(self, fixed):
+        """All metrics in 0.1 units, in METRICS order, from a fixed-point
+        (temperature, humidity, pressure) sample, in a reused array"""
+        t = fixed[TEMPERATURE]
+        rh = fixed[HUMIDITY]
+        e = self.vapour_pressure(t, rh)
+        values = self.values
+        values[DEW_POINT] = self.dew_point(e)
+        values[ABS_HUMIDITY] = self.abs_humidity(t, e)
+        values[HEAT_INDEX] = self.heat_index(t, rh)
+        values[SEA_LEVEL] = self.sea_level(fixed[PRESSURE], t)
+        return values
+
+    def metrics(self, temperature, humidity, pressure):
+        """update() for a reading in float units (publishing buffered readings)"""
+        fixed = self.fixed
+        fixed[TEMPERATURE] = to_fixed(temperature, TEMPERATURE)
+        fixed[HUMIDITY] = to_fixed(humidity, HUMIDITY)
+        fixed[PRESSURE] = to_fixed(pressure, PRESSURE)
+        return self.update(fixed)
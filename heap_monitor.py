@@ -0,0 +1,193 @@
+# Heap and garbage collector instrumentation.
+# Tracks the free and allocated heap with their high-water marks, times the
+# collections the firmware runs, counts the ones the allocator runs by itself
+# and measures the heap each scheduler task allocates per run. The adaptive
+# policy keeps gc.threshold() at a fraction of the heap left free after a
+# collection, so collections stay short without forcing one on every screen
+# change. A MemoryError seen by a wrapped task is written to flash, so the
+# snapshot survives the reset that usually follows and is reported next boot.
+import gc
+import os
+from clock import ticks_ms, ticks_us, ticks_diff
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    mem_free = gc.mem_free
+    mem_alloc = gc.mem_alloc
+except AttributeError:
+    # CPython (simulator, benchmarks) has no MicroPython heap to report
+    def mem_free():
+        return 0
+
+    def mem_alloc():
+        return 0
+
+
+class HeapMonitor:
+    """Heap statistics, per-task allocation deltas and the GC policy.
+
+    threshold_pct of the free heap (at least threshold_min bytes) may be
+    allocated before the next automatic collection; maybe_collect() only
+    collects once the free heap is below low_water bytes.
+    """
+
+    def __init__(self, threshold_pct=25, threshold_min=4096, low_water=16384, crash_path=None):
+        self.threshold_pct = threshold_pct
+        self.threshold_min = threshold_min
+        self.low_water = low_water
+        self.crash_path = crash_path
+        self.stats = {
+            'free': 0,
+            'alloc': 0,
+            'min_free': 0,
+            'max_alloc': 0,
+            'largest_free': 0,
+            'collects': 0,
+            'auto_collects': 0,
+            'gc_us': 0,
+            'gc_max_us': 0,
+            'threshold': 0,
+            'memory_errors': 0
+        }
+        self.tasks = {}  # name -> [runs, bytes allocated, largest run]
+        self.last_crash = self.load_crash()
+        self.sample()
+        self.stats['min_free'] = self.stats['free']
+        self.tune()
+
+    def sample(self, alloc=None):
+        """Refresh the heap figures and high-water marks"""
+        stats = self.stats
+        free = mem_free()
+        if alloc is None:
+            alloc = mem_alloc()
+        stats['free'] = free
+        stats['alloc'] = alloc
+        if free < stats['min_free']:
+            stats['min_free'] = free
+        if alloc > stats['max_alloc']:
+            stats['max_alloc'] = alloc
+
+    def tune(self):
+        """Set gc.threshold() from the heap that is free right now"""
+        threshold = max(self.threshold_min, self.stats['free'] * self.threshold_pct // 100)
+        try:
+            gc.threshold(threshold)
+            self.stats['threshold'] = threshold
+        except AttributeError:
+            pass
+
+    def collect(self):
+        """Run a timed collection"""
+        start = ticks_us()
+        gc.collect()
+        elapsed = ticks_diff(ticks_us(), start)
+        stats = self.stats
+        stats['collects'] += 1
+        stats['gc_us'] += elapsed
+        if elapsed > stats['gc_max_us']:
+            stats['gc_max_us'] = elapsed
+        self.sample()
+        self.tune()
+
+    def maybe_collect(self):
+        """Collect only when the free heap has dropped below low_water"""
+        if mem_free() < self.low_water:
+            self.collect()
+            return True
+        return False
+
+    def wrap(self, name, fn):
+        """fn with its heap allocation recorded under name"""
+        entry = self.tasks[name] = [0, 0, 0]
+
+        def run(*args):
+            before = mem_alloc()
+            try:
+                return fn(*args)
+            except MemoryError:
+                self.memory_error(name)
+                raise
+            finally:
+                after = mem_alloc()
+                entry[0] += 1
+                if after >= before:
+                    used = after - before
+                    entry[1] += used
+                    if used > entry[2]:
+                        entry[2] = used
+                    self.sample(after)
+                else:
+                    # The allocator collected during the call; the heap is
+                    # as compact as it gets, so retune the threshold now
+                    self.stats['auto_collects'] += 1
+                    self.sample(after)
+                    self.tune()
+        return run
+
+    def largest_free(self):
+        """Largest block that can be allocated, found by trial allocations"""
+        self.collect()
+        low = 0
+        high = mem_free()
+        while low < high:
+            size = (low + high + 1) // 2
+            try:
+                # Dropped straight away; only whether it fits matters
+                bytearray(size)
+                low = size
+            except MemoryError:
+                high = size - 1
+        self.collect()
+        self.stats['largest_free'] = low
+        return low
+
+    def memory_error(self, name):
+        """Count a MemoryError and keep a snapshot on flash"""
+        stats = self.stats
+        stats['memory_errors'] += 1
+        if self.crash_path is None:
+            return
+        try:
+            gc.collect()
+            self.sample()
+            with open(self.crash_path, 'w') as f:
+                f.write(json.dumps({'task': name, 'free': stats['free'], 'min_free': stats['min_free'],
+                                    'max_alloc': stats['max_alloc'], 'uptime_ms': ticks_ms()}))
+        except Exception:
+            pass
+
+    def load_crash(self):
+        """Snapshot left by a MemoryError before the last reset, or None"""
+        if self.crash_path is None:
+            return None
+        try:
+            with open(self.crash_path) as f:
+                crash = json.loads(f.read())
+            os.remove(self.crash_path)
+            return crash
+        except (OSError, ValueError):
+            return None
+
+    def fragmentation(self):
+        """Percent of the free heap outside the largest free block"""
+        free = self.stats['free']
+        if not free or not self.stats['largest_free']:
+            return 0
+        return max(0, 100 - self.stats['largest_free'] * 100 // free)
+
+    def report(self, probe=True):
+        """Snapshot for the weather/diag topic; probe also measures fragmentation"""
+        if probe:
+            self.largest_free()
+        self.sample()
+        report = dict(self.stats)
+        report['fragmentation'] = self.fragmentation()
+        report['tasks'] = self.tasks
+        if self.last_crash is not None:
+            report['last_crash'] = self.last_crash
+        return report
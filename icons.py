@@ -0,0 +1,119 @@
+# Weather icon cache.
+# Icons are built on the host (tools/build_icons.py) from img/w32/*.png into
+# raw RGB565 blobs, so the device never decodes a PNG. Blobs come from the
+# resource bundle or loose files through a read callback. A blob is turned into
+# horizontal runs of one color once, when it is first drawn, and kept in an
+# LRU cache bounded by a byte budget. Drawing a cached icon is one filled
+# rectangle per run; transparent pixels are skipped.
+import struct
+from array import array
+
+# Blob layout: header, then width * height little-endian RGB565 pixels
+MAGIC = b'I565'
+HEADER = "<4sHHHH"  # magic, width, height, flags, transparent key
+HEADER_SIZE = struct.calcsize(HEADER)
+FLAG_KEYED = 1
+EXTENSION = ".565"
+
+
+def rgb565_to_rgb(value):
+    """RGB565 to the 0xRRGGBB colors the lcd takes"""
+    r = (value >> 11) & 0x1F
+    g = (value >> 5) & 0x3F
+    b = value & 0x1F
+    return ((r << 3 | r >> 2) << 16) | ((g << 2 | g >> 4) << 8) | (b << 3 | b >> 2)
+
+
+def blob_name(name):
+    """Blob file name for an icon file name such as 'rain.png'"""
+    return name.rsplit('.', 1)[0] + EXTENSION
+
+
+def decode_runs(blob):
+    """Decode a blob into (width, height, runs), runs packed as x, y, length, color"""
+    magic, width, height, flags, key = struct.unpack_from(HEADER, blob)
+    if magic != MAGIC:
+        raise ValueError("not an icon blob")
+    pixels = memoryview(blob)[HEADER_SIZE:]
+    keyed = flags & FLAG_KEYED
+    runs = array('H')
+    for y in range(height):
+        row = y * width * 2
+        x = 0
+        while x < width:
+            i = row + x * 2
+            value = pixels[i] | (pixels[i + 1] << 8)
+            start = x
+            x += 1
+            while x < width:
+                i += 2
+                if (pixels[i] | (pixels[i + 1] << 8)) != value:
+                    break
+                x += 1
+            if not (keyed and value == key):
+                runs.append(start)
+                runs.append(y)
+                runs.append(x - start)
+                runs.append(value)
+    return width, height, runs
+
+
+class IconCache:
+    """LRU cache of decoded icons, drawn through fill(x, y, w, h, color).
+
+    read(name) returns the blob for an icon file name, or None.
+    """
+
+    def __init__(self, fill, read, budget=8192):
+        self.fill = fill
+        self.read = read
+        self.budget = budget
+        self.entries = {}
+        self.order = []  # least recently used first
+        self.size = 0
+        self.missing = set()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, name):
+        """Decoded runs for an icon, or None when it has no blob"""
+        runs = self.entries.get(name)
+        if runs is not None:
+            self.stats['hits'] += 1
+            self.order.remove(name)
+            self.order.append(name)
+            return runs
+        if name in self.missing:
+            return None
+        self.stats['misses'] += 1
+        try:
+            blob = self.read(name)
+            runs = decode_runs(blob)[2] if blob is not None else None
+        except (OSError, ValueError):
+            runs = None
+        if runs is None:
+            self.missing.add(name)
+            return None
+        size = len(runs) * 2
+        while self.order and self.size + size > self.budget:
+            oldest = self.order.pop(0)
+            self.size -= len(self.entries.pop(oldest)) * 2
+            self.stats['evictions'] += 1
+        self.entries[name] = runs
+        self.order.append(name)
+        self.size += size
+        return runs
+
+    def draw(self, x, y, name):
+        """Draw an icon at x, y; False if there is no blob for it"""
+        runs = self.get(name)
+        if runs is None:
+            return False
+        fill = self.fill
+        color = -1
+        rgb = 0
+        for i in range(0, len(runs), 4):
+            if runs[i + 3] != color:
+                color = runs[i + 3]
+                rgb = rgb565_to_rgb(color)
+            fill(x + runs[i], y + runs[i + 1], runs[i + 2], 1, rgb)
+        return True
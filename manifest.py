@@ -0,0 +1,37 @@
+# Freeze the firmware modules into a MicroPython image.
+#
+#     make -C ports/esp32 BOARD=<board> FROZEN_MANIFEST=/path/to/manifest.py
+#
+# Frozen modules run from flash as bytecode, so importing them costs no
+# filesystem lookup, compilation or heap for the code. main.py is not frozen:
+# it stays on the filesystem as the entry point, as does the configuration in
+# state.py when it should be editable without a firmware rebuild (drop it from
+# the list and deploy it as a file).
+include("$(PORT_DIR)/boards/manifest.py")
+
+module("state.py")
+module("weather_data.py")
+module("screens.py")
+module("connection.py")
+module("telemetry.py")
+module("clock.py")
+module("scheduler.py")
+module("async_runtime.py")
+module("mqtt_session.py")
+module("ntp_sync.py")
+module("record_buffer.py")
+module("sensor_payload.py")
+module("timeseries.py")
+module("report_filter.py")
+module("sampler.py")
+module("weather_parser.py")
+module("icons.py")
+module("resources.py")
+module("heap_monitor.py")
+module("profiler.py")
+module("render_text.py")
+module("observable.py")
+module("rate_control.py")
+module("power.py")
+module("derived.py")
+module("rules.py")
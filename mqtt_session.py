@@ -0,0 +1,177 @@
+# Persistent MQTT session management.
+# The client connects with clean_session=False. The topics the stored session
+# holds are remembered on flash, so a reconnect subscribes only when the
+# broker has no session or the topic set has grown since. Liveness is checked with PINGREQ/PINGRESP
+# over the keepalive interval, and the connection is only re-established
+# after an actual failure, with exponential backoff.
+from clock import ticks_ms, ticks_diff, ticks_add
+
+
+class _RxStamp:
+    """Socket wrapper that records when the broker last sent anything"""
+
+    def __init__(self, sock, session):
+        self._sock = sock
+        self._session = session
+
+    def read(self, n):
+        data = self._sock.read(n)
+        if data:
+            self._session.last_rx = self._session.clock()
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class MQTTSession:
+    """Keep one MQTT connection alive and reconnect only when it fails.
+
+    client_factory(keepalive_s) must return an unconnected umqtt client.
+    on_connect() is called after every successful connect. topics_path is a
+    file keeping the topics subscribed in the broker's session across
+    reboots; None keeps them in RAM only.
+    """
+
+    def __init__(self, client_factory, topics, callback, keepalive_s=60,
+                 ping_timeout_ms=10000, backoff_min_ms=1000,
+                 backoff_max_ms=60000, on_connect=None, clock=ticks_ms,
+                 topics_path=None):
+        self.client_factory = client_factory
+        self.topics = topics
+        self.topics_path = topics_path
+        self.subscribed = self._load_subscribed()
+        self.callback = callback
+        self.keepalive = keepalive_s * 1000
+        self.ping_timeout = ping_timeout_ms
+        self.backoff_min = backoff_min_ms
+        self.backoff_max = backoff_max_ms
+        self.on_connect = on_connect
+        self.clock = clock
+        self.client = None
+        self.connected = False
+        self.delay = backoff_min_ms
+        self.next_attempt = clock()
+        self.last_rx = 0
+        self.last_tx = 0
+        self.ping_sent = None
+        self.stats = {'connects': 0, 'failures': 0, 'subscribes': 0, 'pings': 0}
+
+    def due(self):
+        """True when disconnected and the backoff delay has elapsed"""
+        return not self.connected and ticks_diff(self.clock(), self.next_attempt) >= 0
+
+    def connect(self):
+        try:
+            if self.client is None:
+                self.client = self.client_factory(self.keepalive // 1000)
+                self.client.set_callback(self.callback)
+            self.stats['connects'] += 1
+            session_present = self.client.connect(clean_session=False)
+            self.client.sock = _RxStamp(self.client.sock, self)
+            # The broker keeps subscriptions for persistent sessions, but
+            # only those made before; topics added since need subscribing
+            if not session_present:
+                self.subscribed = ()
+            missing = [topic for topic in self.topics if topic not in self.subscribed]
+            for topic in missing:
+                self.client.subscribe(topic)
+                self.stats['subscribes'] += 1
+            if missing:
+                self._save_subscribed()
+            now = self.clock()
+            self.last_rx = now
+            self.last_tx = now
+            self.ping_sent = None
+            self.connected = True
+            self.delay = self.backoff_min
+            if self.on_connect is not None:
+                self.on_connect()
+            return self.connected
+        except Exception as e:
+            print("MQTT connect error: {}".format(e))
+            self._fail()
+            return False
+
+    def poll(self):
+        """Receive pending messages and keep the link alive.
+
+        Returns False when the connection is found dead.
+        """
+        if not self.connected:
+            return False
+        try:
+            self.client.check_msg()
+            now = self.clock()
+            if self.ping_sent is not None:
+                if ticks_diff(self.last_rx, self.ping_sent) >= 0:
+                    self.ping_sent = None
+                elif ticks_diff(now, self.ping_sent) > self.ping_timeout:
+                    print("MQTT keepalive timed out")
+                    self._fail()
+                    return False
+            elif ticks_diff(now, self.last_tx) >= self.keepalive // 2:
+                self.client.ping()
+                self.stats['pings'] += 1
+                self.ping_sent = now
+                self.last_tx = now
+            return True
+        except Exception as e:
+            print("MQTT poll error: {}".format(e))
+            self._fail()
+            return False
+
+    def publish(self, topic, msg, retain=False):
+        if not self.connected:
+            return False
+        try:
+            self.client.publish(topic, msg, retain)
+            self.last_tx = self.clock()
+            return True
+        except Exception as e:
+            print("MQTT publish error: {}".format(e))
+            self._fail()
+            return False
+
+    def close(self):
+        """Disconnect on purpose; the next connect() may follow at once"""
+        if self.connected:
+            try:
+                self.client.disconnect()
+            except Exception:
+                pass
+        self.connected = False
+        self.ping_sent = None
+        self.delay = self.backoff_min
+        self.next_attempt = self.clock()
+
+    def _load_subscribed(self):
+        if self.topics_path is None:
+            return ()
+        try:
+            with open(self.topics_path) as f:
+                return tuple(f.read().split())
+        except OSError:
+            return ()
+
+    def _save_subscribed(self):
+        self.subscribed = tuple(self.topics)
+        if self.topics_path is None:
+            return
+        try:
+            with open(self.topics_path, 'w') as f:
+                f.write("\n".join(self.topics))
+        except OSError as e:
+            print("Could not save MQTT topics: {}".format(e))
+
+    def _fail(self):
+        self.stats['failures'] += 1
+        self.connected = False
+        self.ping_sent = None
+        if self.client is not None:
+            try:
+                self.client.sock.close()
+            except Exception:
+                pass
+        self.next_attempt = ticks_add(self.clock(), self.delay)
+        self.delay = min(self.delay * 2, self.backoff_max)
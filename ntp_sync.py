@@ -0,0 +1,95 @@
+# Non-blocking NTP sync for the scheduler runtime.
+# ntptime.client waits on its socket without a timeout, so an unreachable
+# server would freeze the scheduler, the screens and the buttons. NtpSync
+# first sends its own query on a non-blocking UDP socket and checks for the
+# reply on later ticks; the blocking client only runs once the server has
+# answered. A probe without a reply, or a sync that fails, is retried with
+# exponential backoff.
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+from clock import ticks_ms, ticks_diff, ticks_add
+
+
+class NtpSync:
+    """Poll-style NTP probe; sync() sets the clock and returns True"""
+
+    def __init__(self, host, sync, port=123, timeout_ms=3000,
+                 backoff_min_ms=1000, backoff_max_ms=60000, clock=ticks_ms):
+        self.host = host
+        self.port = port
+        self.sync = sync
+        self.timeout = timeout_ms
+        self.backoff_min = backoff_min_ms
+        self.backoff_max = backoff_max_ms
+        self.clock = clock
+        self.addr = None
+        self.sock = None
+        self.sent = 0
+        self.synced = False
+        self.delay = backoff_min_ms
+        self.next_attempt = clock()
+        self.query = bytearray(48)
+        self.query[0] = 0x1b  # client request, NTP version 3
+        self.stats = {'probes': 0, 'failures': 0}
+
+    def probing(self):
+        """True while a query is out and its reply is still awaited"""
+        return self.sock is not None
+
+    def poll(self):
+        """Take one step: send a query when due, or check for its reply.
+        Returns True once the clock has been synced."""
+        if self.synced:
+            return True
+        now = self.clock()
+        if self.sock is None:
+            if ticks_diff(now, self.next_attempt) >= 0:
+                self._send(now)
+            return False
+        try:
+            answered = bool(self.sock.recv(48))
+        except OSError:
+            answered = False
+        if answered:
+            self._close()
+            if self.sync():
+                self.synced = True
+                self.delay = self.backoff_min
+                return True
+            self._fail(now)
+        elif ticks_diff(now, self.sent) >= self.timeout:
+            print("NTP server did not answer")
+            self._close()
+            self._fail(now)
+        return False
+
+    def _send(self, now):
+        self.stats['probes'] += 1
+        try:
+            # Resolved once: the lookup itself can block on a dead network
+            if self.addr is None:
+                self.addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+            self.sock.sendto(self.query, self.addr)
+            self.sent = now
+        except Exception as e:
+            print("NTP probe error: {}".format(e))
+            self._close()
+            self._fail(now)
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _fail(self, now):
+        self.stats['failures'] += 1
+        self.next_attempt = ticks_add(now, self.delay)
+        self.delay = min(self.delay * 2, self.backoff_max)
@@ -0,0 +1,70 @@
+# Change notifications for the shared state.
+# Writers update the status, sensor, derived, weather and config dicts through
+# Store.set(), which only notifies when the value actually changed. Watchers
+# are not called right away: each one is queued once, however many of its
+# keys changed, and flush() runs the queue once per UI frame. Screens watch
+# the keys they display and drop their watches when the screen is cleared,
+# so an idle screen costs nothing per frame.
+
+
+class Store:
+    """Watchers per dict and key, and the queue of watchers due to run"""
+
+    def __init__(self, data):
+        self.data = data  # name -> shared dict
+        self.watchers = dict((name, {}) for name in data)  # name -> key -> [(owner, fn)]
+        self.pending = []
+        self.stats = {'changes': 0, 'runs': 0}
+
+    def set(self, name, key, value):
+        """Write data[name][key]; True (and watchers queued) if it changed"""
+        data = self.data[name]
+        old = data.get(key)
+        data[key] = value
+        if old is value or old == value:
+            return False
+        self.changed(name, key)
+        return True
+
+    def changed(self, name, key):
+        """Queue the watchers of a key written without set()"""
+        self.stats['changes'] += 1
+        watchers = self.watchers[name].get(key)
+        if watchers:
+            pending = self.pending
+            for owner, fn in watchers:
+                if fn not in pending:
+                    pending.append(fn)
+
+    def watch(self, owner, fn, name, keys):
+        """Call fn on the next flush after any of keys in data[name] changes"""
+        watchers = self.watchers[name]
+        entry = (owner, fn)
+        for key in keys:
+            if key not in watchers:
+                watchers[key] = [entry]
+            elif entry not in watchers[key]:
+                watchers[key].append(entry)
+
+    def unwatch(self, owner):
+        """Drop every watch made by owner, and its queued calls"""
+        dropped = []
+        for watchers in self.watchers.values():
+            for key in watchers:
+                kept = [w for w in watchers[key] if w[0] != owner]
+                if len(kept) != len(watchers[key]):
+                    dropped.extend(w[1] for w in watchers[key] if w[0] == owner)
+                    watchers[key] = kept
+        if dropped and self.pending:
+            self.pending = [fn for fn in self.pending if fn not in dropped]
+
+    def flush(self):
+        """Run each queued watcher once, in the order they were queued"""
+        runs = 0
+        # Taken one at a time: a watcher may queue others, or drop the rest
+        # of the queue by changing screens
+        while self.pending:
+            self.pending.pop(0)()
+            runs += 1
+        self.stats['runs'] += runs
+        return runs
@@ -0,0 +1,192 @@
+# Low-power operation.
+# Backlight dims, then switches off, after a spell without button presses.
+# RadioSchedule keeps WiFi and MQTT down between publish bursts: readings
+# collect in the store-and-forward buffer, and once enough are waiting (or
+# the clock has never been set) the radio comes up until the buffer is
+# drained, then goes down again. RtcLog keeps readings in RTC memory, which
+# survives deep sleep, so a timer wake only has to read the ENV III, append
+# one record and go back to sleep (sleep_cycle(), run before anything else
+# is imported); the whole station only boots once the log is full or a
+# button woke it.
+import struct
+import time
+
+from clock import ticks_ms, ticks_diff
+from record_buffer import RECORD_SIZE, pack_into, unpack_from
+
+MAGIC = b"RL"
+HEADER = "<2sH"  # magic, count
+HEADER_SIZE = struct.calcsize(HEADER)
+
+
+class Backlight:
+    """LCD brightness from the time since the last button press.
+
+    levels is (normal, dimmed) in percent; dim_ms and off_ms of 0 never dim
+    or switch off.
+    """
+
+    def __init__(self, set_level, levels=(80, 20), dim_ms=30000, off_ms=120000):
+        self.set_level = set_level
+        self.levels = levels
+        self.dim_ms = dim_ms
+        self.off_ms = off_ms
+        self.last_activity = ticks_ms()
+        self.level = None
+        self.stats = {'dims': 0, 'offs': 0}
+        self.show(levels[0])
+
+    def show(self, level):
+        if level != self.level:
+            self.level = level
+            try:
+                self.set_level(level)
+            except Exception as e:
+                print("Backlight error: {}".format(e))
+
+    def touch(self):
+        """Note activity; True if the screen was off (the press only wakes it)"""
+        was_off = self.level == 0
+        self.last_activity = ticks_ms()
+        self.show(self.levels[0])
+        return was_off
+
+    def idle_ms(self):
+        return ticks_diff(ticks_ms(), self.last_activity)
+
+    def update(self):
+        """Dim or switch off after inactivity; True while the screen is off"""
+        idle = self.idle_ms()
+        if self.off_ms and idle >= self.off_ms:
+            if self.level:
+                self.stats['offs'] += 1
+            self.show(0)
+        elif self.dim_ms and idle >= self.dim_ms:
+            if self.level == self.levels[0]:
+                self.stats['dims'] += 1
+            self.show(self.levels[1])
+        return self.level == 0
+
+
+class RadioSchedule:
+    """When WiFi and MQTT should be up between low-power publish bursts.
+
+    A burst starts once burst readings are buffered (the first one also
+    when the clock needs setting), and ends linger_ms after the buffer was
+    drained, or after timeout_ms when the network cannot be reached.
+    """
+
+    def __init__(self, burst, linger_ms=10000, timeout_ms=60000):
+        self.burst = burst
+        self.linger = linger_ms
+        self.timeout = timeout_ms
+        self.started = None
+        self.drained = None
+        self.stats = {'bursts': 0, 'timeouts': 0}
+
+    def wanted(self, pending, need_sync, connected):
+        """True while the radio should be on"""
+        now = ticks_ms()
+        if self.started is None:
+            if pending < self.burst and not (need_sync and not self.stats['bursts']):
+                return False
+            self.started = now
+            self.drained = None
+            self.stats['bursts'] += 1
+            return True
+        if ticks_diff(now, self.started) >= self.timeout and not (connected and pending):
+            # Still draining is worth finishing; never connecting is not
+            if not connected:
+                self.stats['timeouts'] += 1
+            self.started = None
+            return False
+        if connected and not pending and not need_sync:
+            if self.drained is None:
+                self.drained = now
+            elif ticks_diff(now, self.drained) >= self.linger:
+                self.started = None
+                return False
+        else:
+            self.drained = None
+        return True
+
+
+class RtcLog:
+    """Readings kept in RTC memory as packed buffer records"""
+
+    def __init__(self, rtc, capacity):
+        self.rtc = rtc
+        self.capacity = capacity
+        self.data = bytearray(HEADER_SIZE + capacity * RECORD_SIZE)
+        self.count = 0
+        try:
+            saved = rtc.memory()
+        except Exception:
+            saved = b""
+        if len(saved) >= HEADER_SIZE:
+            magic, count = struct.unpack_from(HEADER, saved, 0)
+            if magic == MAGIC:
+                self.count = min(count, capacity, (len(saved) - HEADER_SIZE) // RECORD_SIZE)
+                size = HEADER_SIZE + self.count * RECORD_SIZE
+                self.data[:size] = saved[:size]
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, temperature, humidity, pressure):
+        """Add a reading, dropping the oldest when full; False once full"""
+        if self.count == self.capacity:
+            self.data[HEADER_SIZE:-RECORD_SIZE] = self.data[HEADER_SIZE + RECORD_SIZE:]
+            self.count -= 1
+        pack_into(self.data, HEADER_SIZE + self.count * RECORD_SIZE, timestamp, temperature, humidity, pressure)
+        self.count += 1
+        return self.count < self.capacity
+
+    def reading(self, i):
+        return unpack_from(self.data, HEADER_SIZE + i * RECORD_SIZE)
+
+    def clear(self):
+        self.count = 0
+        self.save()
+
+    def save(self):
+        struct.pack_into(HEADER, self.data, 0, MAGIC, self.count)
+        self.rtc.memory(self.data[:HEADER_SIZE + self.count * RECORD_SIZE])
+
+
+def enable_button_wake(config):
+    """Let the (active low) wake button end a light or deep sleep"""
+    try:
+        import machine
+        import esp32
+        esp32.wake_on_ext0(machine.Pin(config['power_wake_pin'], machine.Pin.IN), esp32.WAKEUP_ALL_LOW)
+    except Exception as e:
+        print("Button wake unavailable: {}".format(e))
+
+
+def deep_sleep(config):
+    """Deep-sleep until the next sample, or until the wake button is pressed"""
+    import machine
+    enable_button_wake(config)
+    machine.deepsleep(config['power_sample_s'] * 1000)
+
+
+def sleep_cycle(config):
+    """Deep mode timer wake: log a reading to RTC memory and sleep again.
+
+    Returns (so the station boots fully) after a cold boot, a button wake,
+    or once power_burst readings are waiting to be published.
+    """
+    import machine
+    if machine.reset_cause() != machine.DEEPSLEEP_RESET or machine.wake_reason() != machine.TIMER_WAKE:
+        return
+    log = RtcLog(machine.RTC(), config['power_rtc_records'])
+    try:
+        import unit
+        env = unit.get(unit.ENV3, unit.PORTA)
+        log.append(time.time(), env.temperature, env.humidity, env.pressure)
+        log.save()
+    except Exception as e:
+        print("Sleep sample failed: {}".format(e))
+    if len(log) < config['power_burst']:
+        deep_sleep(config)
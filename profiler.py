@@ -0,0 +1,114 @@
+# Section timing profiler.
+# Times named sections of the loop with ticks_us() into fixed rings holding
+# the last N durations of each section; p50/p95/max are computed only when a
+# report is requested. Sections are hooked by swapping a function, a task's fn
+# or a bound method for a timed wrapper when profiling is switched on, and
+# the originals are put back when it is switched off, so a profiler that is
+# off costs nothing on the hot paths.
+from array import array
+from clock import ticks_ms, ticks_us, ticks_diff
+
+
+class Section:
+    """Ring of the last durations of one section (us)"""
+    __slots__ = ('ring', 'head', 'count', 'max')
+
+    def __init__(self, window):
+        self.ring = array('L', [0]) * window
+        self.head = 0
+        self.count = 0
+        self.max = 0
+
+    def add(self, us):
+        if us < 0:
+            us = 0
+        self.ring[self.head] = us
+        self.head = (self.head + 1) % len(self.ring)
+        self.count += 1
+        if us > self.max:
+            self.max = us
+
+    def summary(self):
+        """{'n', 'p50', 'p95', 'max'}; percentiles over the window, max since reset"""
+        filled = min(self.count, len(self.ring))
+        if not filled:
+            return {'n': 0, 'p50': 0, 'p95': 0, 'max': 0}
+        values = sorted(self.ring[:filled])
+        return {
+            'n': self.count,
+            'p50': values[filled // 2],
+            'p95': values[min(filled - 1, filled * 95 // 100)],
+            'max': self.max
+        }
+
+
+class Profiler:
+    """Named timing sections and the hooks that feed them"""
+
+    def __init__(self, window=32):
+        self.window = window
+        self.sections = {}
+        self.hooks = []  # (target, attribute, original, set on target itself)
+        self.enabled = False
+
+    def section(self, name):
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self.window)
+        return section
+
+    def timed(self, name, fn):
+        """fn with every call timed into section name"""
+        section = self.section(name)
+
+        def run(*args):
+            start = ticks_us()
+            try:
+                return fn(*args)
+            finally:
+                section.add(ticks_diff(ticks_us(), start))
+        return run
+
+    def hook(self, target, attr, name=None):
+        """Replace target.attr (a module function or method) with a timed wrapper"""
+        original = getattr(target, attr)
+        # Methods found on the class are removed again instead of restored
+        own = not hasattr(target, '__dict__') or attr in target.__dict__
+        self.hooks.append((target, attr, original, own))
+        setattr(target, attr, self.timed(name or attr, original))
+
+    def hook_task(self, task):
+        """Time a scheduler task, and how late it starts, as name and name.late"""
+        original = task.fn
+        section = self.section(task.name)
+        late = self.section(task.name + ".late")
+
+        def run():
+            late.add(ticks_diff(ticks_ms(), task.deadline) * 1000)
+            start = ticks_us()
+            try:
+                return original()
+            finally:
+                section.add(ticks_diff(ticks_us(), start))
+        self.hooks.append((task, 'fn', original, True))
+        task.fn = run
+
+    def unhook(self):
+        """Put every original back, newest first"""
+        while self.hooks:
+            target, attr, original, own = self.hooks.pop()
+            if own:
+                setattr(target, attr, original)
+            else:
+                delattr(target, attr)
+
+    def reset(self):
+        """Clear the figures; hooked wrappers keep feeding the same sections"""
+        for section in self.sections.values():
+            section.head = 0
+            section.count = 0
+            section.max = 0
+
+    def report(self):
+        """Summary of every section"""
+        return dict((name, section.summary()) for name, section in self.sections.items())
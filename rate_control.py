@@ -0,0 +1,96 @@
+# Adaptive sampling and reporting rate.
+# Tracks, per channel, exponentially weighted means over roughly tau and
+# tau / 10 seconds and the variance over tau. On a steady trend the short
+# mean leads the long one by 0.9 * tau * rate, so that gap estimates the
+# rate of change with most of the sensor noise averaged out. A rate above
+# the channel's rate limit or a variance above its noise limit counts as a
+# fast change. A fast change drops straight back to the shortest sample
+# period and heartbeat; every run of calm samples doubles both, up to the
+# configured bounds. State is kept in preallocated arrays.
+from array import array
+
+
+class RateController:
+    """Sample period (ms) and heartbeat (s) from recent signal volatility.
+
+    sample_ms and heartbeat_s are (fastest, slowest) bounds; rate_limit is
+    the change per hour and noise_limit the standard deviation per channel
+    that mark a fast change; backoff calm samples are needed per step.
+    """
+
+    def __init__(self, sample_ms, heartbeat_s, rate_limit, noise_limit, tau_s=300, backoff=10):
+        self.sample_ms = sample_ms
+        self.heartbeat_s = heartbeat_s
+        channels = len(rate_limit)
+        # Compared against the gap between the means and the variance directly
+        self.gap_limit = array('f', [r * 0.9 * tau_s / 3600 for r in rate_limit])
+        self.var_limit = array('f', [n * n for n in noise_limit])
+        self.tau = tau_s
+        self.backoff = backoff
+        self.mean = array('f', [0.0]) * channels
+        self.short = array('f', [0.0]) * channels
+        self.var = array('f', [0.0]) * channels
+        self.last_epoch = None
+        self.level = 0
+        self.calm = 0
+        self.stats = {'fast': 0, 'slower': 0}
+
+    def reset(self):
+        self.last_epoch = None
+        self.level = 0
+        self.calm = 0
+
+    def volatile(self, epoch, values):
+        """Fold a reading into the averages; True if it marks a fast change"""
+        mean = self.mean
+        short = self.short
+        var = self.var
+        if self.last_epoch is None:
+            for ch in range(len(values)):
+                mean[ch] = short[ch] = values[ch]
+                var[ch] = 0.0
+            self.last_epoch = epoch
+            return False
+        dt = epoch - self.last_epoch
+        self.last_epoch = epoch
+        if dt <= 0:
+            # Same second, or the clock was set back
+            return False
+        alpha = dt / (self.tau + dt)
+        alpha_short = dt / (self.tau / 10 + dt)
+        fast = False
+        for ch in range(len(values)):
+            value = values[ch]
+            diff = value - mean[ch]
+            # Exponentially weighted variance, updated before the mean moves
+            var[ch] = (1 - alpha) * (var[ch] + alpha * diff * diff)
+            mean[ch] += alpha * diff
+            short[ch] += alpha_short * (value - short[ch])
+            if abs(short[ch] - mean[ch]) > self.gap_limit[ch] or var[ch] > self.var_limit[ch]:
+                fast = True
+        return fast
+
+    def update(self, epoch, values):
+        """Feed a reading; True when the sample period or heartbeat changed"""
+        if self.volatile(epoch, values):
+            self.calm = 0
+            if self.level:
+                self.level = 0
+                self.stats['fast'] += 1
+                return True
+            return False
+        self.calm += 1
+        if self.calm < self.backoff or (self.period() >= self.sample_ms[1] and self.heartbeat() >= self.heartbeat_s[1]):
+            return False
+        self.calm = 0
+        self.level += 1
+        self.stats['slower'] += 1
+        return True
+
+    def period(self):
+        """Sample period in ms for the current level"""
+        return min(self.sample_ms[0] << self.level, self.sample_ms[1])
+
+    def heartbeat(self):
+        """Seconds without a publish before a heartbeat, for the current level"""
+        return min(self.heartbeat_s[0] << self.level, self.heartbeat_s[1])
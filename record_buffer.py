@@ -0,0 +1,203 @@
+# Store-and-forward buffer for sensor readings.
+# Readings that cannot be published are kept as packed 10-byte records in a
+# fixed RAM ring. When the RAM ring fills up it is spilled to a fixed-size
+# ring file on the SD card, so memory and disk use stay bounded however long
+# the outage lasts; the oldest records are dropped once both are full.
+import struct
+
+# epoch seconds, temperature (0.01 C), humidity (0.01 %), pressure (0.1 hPa)
+RECORD = "<IhHH"
+RECORD_SIZE = struct.calcsize(RECORD)
+STAMP = "<I"
+
+HEADER = "<4sIII"  # magic, capacity, head, count
+HEADER_SIZE = struct.calcsize(HEADER)
+MAGIC = b"SFB1"
+
+
+def _clamp(value, low, high):
+    return low if value < low else (high if value > high else value)
+
+
+def pack_into(buf, offset, timestamp, temperature, humidity, pressure):
+    struct.pack_into(RECORD, buf, offset, int(timestamp),
+                     _clamp(int(round(temperature * 100)), -32768, 32767),
+                     _clamp(int(round(humidity * 100)), 0, 65535),
+                     _clamp(int(round(pressure * 10)), 0, 65535))
+
+
+def unpack_from(buf, offset=0):
+    timestamp, temp, hum, press = struct.unpack_from(RECORD, buf, offset)
+    return timestamp, temp / 100, hum / 100, press / 10
+
+
+class FileRing:
+    """Fixed-capacity ring of records in a file"""
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+        self.header = bytearray(HEADER_SIZE)
+        try:
+            with open(path, 'rb') as f:
+                f.readinto(self.header)
+            magic, capacity, head, count = struct.unpack_from(HEADER, self.header)
+            if magic == MAGIC and capacity == self.capacity:
+                self.head = head
+                self.count = count
+                return
+        except OSError:
+            pass
+        with open(path, 'wb') as f:
+            f.write(self._pack_header())
+
+    def _pack_header(self):
+        struct.pack_into(HEADER, self.header, 0, MAGIC, self.capacity, self.head, self.count)
+        return self.header
+
+    def write(self, buf, records):
+        """Append records from buf, dropping the oldest ones when full"""
+        with open(self.path, 'r+b') as f:
+            for i in range(records):
+                slot = (self.head + self.count) % self.capacity
+                f.seek(HEADER_SIZE + slot * RECORD_SIZE)
+                f.write(buf[i * RECORD_SIZE:(i + 1) * RECORD_SIZE])
+                if self.count == self.capacity:
+                    self.head = (self.head + 1) % self.capacity
+                else:
+                    self.count += 1
+            f.seek(0)
+            f.write(self._pack_header())
+
+    def read(self, buf, records):
+        """Copy up to records oldest entries into buf, return how many"""
+        n = min(records, self.count)
+        with open(self.path, 'rb') as f:
+            for i in range(n):
+                f.seek(HEADER_SIZE + ((self.head + i) % self.capacity) * RECORD_SIZE)
+                f.readinto(buf[i * RECORD_SIZE:(i + 1) * RECORD_SIZE])
+        return n
+
+    def restamp(self, since, until, offset):
+        """Add offset to the newest records stamped from since to until,
+        stopping at the first one outside; returns how many changed"""
+        changed = 0
+        stamp = bytearray(4)
+        with open(self.path, 'r+b') as f:
+            while changed < self.count:
+                position = HEADER_SIZE + ((self.head + self.count - 1 - changed) % self.capacity) * RECORD_SIZE
+                f.seek(position)
+                f.readinto(stamp)
+                timestamp = struct.unpack_from(STAMP, stamp)[0]
+                if timestamp < since or timestamp > until:
+                    break
+                struct.pack_into(STAMP, stamp, 0, timestamp + offset)
+                f.seek(position)
+                f.write(stamp)
+                changed += 1
+        return changed
+
+    def discard(self, records):
+        """Drop the records returned by the last read"""
+        records = min(records, self.count)
+        self.head = (self.head + records) % self.capacity
+        self.count -= records
+        with open(self.path, 'r+b') as f:
+            f.write(self._pack_header())
+
+
+class RecordBuffer:
+    """RAM ring of readings with optional spill to an SD card file"""
+
+    def __init__(self, ram_records=64, path=None, file_records=8640, batch=10):
+        self.capacity = ram_records
+        self.ram = bytearray(ram_records * RECORD_SIZE)
+        self.ram_view = memoryview(self.ram)
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.batch = bytearray(batch * RECORD_SIZE)
+        self.batch_view = memoryview(self.batch)
+        self.file = None
+        if path:
+            try:
+                self.file = FileRing(path, file_records)
+            except OSError as e:
+                print("Buffer file unavailable: {}".format(e))
+
+    def __len__(self):
+        return self.count + (self.file.count if self.file else 0)
+
+    def append(self, timestamp, temperature, humidity, pressure):
+        if self.count == self.capacity:
+            self._spill()
+        slot = (self.head + self.count) % self.capacity
+        pack_into(self.ram, slot * RECORD_SIZE, timestamp, temperature, humidity, pressure)
+        self.count += 1
+
+    def _spill(self):
+        """Make room in the RAM ring, moving its records to the file if possible"""
+        if self.file is not None:
+            try:
+                # Records are written in order, so straighten a wrapped ring
+                first = min(self.count, self.capacity - self.head)
+                self.file.write(self.ram_view[self.head * RECORD_SIZE:], first)
+                self.file.write(self.ram_view, self.count - first)
+                self.head = 0
+                self.count = 0
+                return
+            except OSError as e:
+                print("Buffer spill failed: {}".format(e))
+                self.file = None
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+        self.dropped += 1
+
+    def restamp(self, since, until, offset):
+        """Add offset to the timestamps of the newest readings stamped from
+        since to until (taken before the clock was set); returns how many
+        changed. Readings are appended in time order, so these are the tail.
+        """
+        changed = 0
+        while changed < self.count:
+            position = ((self.head + self.count - 1 - changed) % self.capacity) * RECORD_SIZE
+            timestamp = struct.unpack_from(STAMP, self.ram, position)[0]
+            if timestamp < since or timestamp > until:
+                return changed
+            struct.pack_into(STAMP, self.ram, position, timestamp + offset)
+            changed += 1
+        if self.file is not None:
+            changed += self.file.restamp(since, until, offset)
+        return changed
+
+    def drain(self, send, limit):
+        """Send up to limit of the oldest readings with send(ts, t, h, p).
+
+        Stops at the first send that returns False and keeps that reading.
+        Returns the number of readings sent.
+        """
+        sent = 0
+        limit = min(limit, len(self.batch) // RECORD_SIZE)
+        # File records are always older than the RAM ones
+        if self.file is not None and self.file.count:
+            n = self.file.read(self.batch_view, limit)
+            for i in range(n):
+                if not send(*unpack_from(self.batch, i * RECORD_SIZE)):
+                    break
+                sent += 1
+            self.file.discard(sent)
+            return sent
+        return self.drain_ram(send, limit)
+
+    def drain_ram(self, send, limit):
+        """drain() from the RAM ring only, leaving the file records in place"""
+        sent = 0
+        while sent < limit and self.count:
+            if not send(*unpack_from(self.ram, self.head * RECORD_SIZE)):
+                break
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+            sent += 1
+        return sent
@@ -0,0 +1,111 @@
+# Cached label text.
+# Screens rebuild the same labels from the same few values on every refresh.
+# TextCache keeps the last string made for each field with the key it was
+# made from (the quantized value, or the value string itself) and hands back
+# that same object while the key is unchanged, so a steady reading costs no
+# allocation and the widget update is skipped. Numbers are written digit by
+# digit into one preallocated bytearray, and a str is only created when the
+# text actually changes.
+
+MINUS = 0x2D
+DOT = 0x2E
+ZERO = 0x30
+DASHES = b'--'
+SCALES = (1, 10, 100, 1000)
+
+
+class TextCache:
+    """Last text per field, rebuilt only when its key changes"""
+
+    def __init__(self, size=48):
+        self.buf = bytearray(size)
+        self.keys = {}
+        self.units = {}
+        self.texts = {}
+        self.encoded = {}
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def cached(self, field, key, unit=None):
+        """Text stored for field if it was made from key and unit, else None"""
+        old = self.keys.get(field)
+        if old is not None and (old is key or old == key) and self.units[field] == unit:
+            self.stats['hits'] += 1
+            return self.texts[field]
+        self.stats['misses'] += 1
+        return None
+
+    def store(self, field, key, text, unit=None):
+        self.keys[field] = key
+        self.units[field] = unit
+        self.texts[field] = text
+        return text
+
+    def label(self, field, prefix, value):
+        """prefix + value, for string values"""
+        text = self.cached(field, value)
+        if text is None:
+            text = self.store(field, value, prefix + value)
+        return text
+
+    def join(self, field, first, second):
+        """first + second, rebuilt only when either part changed"""
+        text = self.cached(field, first, second)
+        if text is None:
+            text = self.store(field, first, first + second, second)
+        return text
+
+    def number(self, field, prefix, value, decimals, suffix):
+        """prefix, value with decimals places (or -- for None), suffix"""
+        if value is None:
+            return self.fixed(field, prefix, None, decimals, suffix)
+        scale = SCALES[decimals]
+        q = int(value * scale + 0.5) if value >= 0 else -int(-value * scale + 0.5)
+        return self.fixed(field, prefix, q, decimals, suffix)
+
+    def fixed(self, field, prefix, q, decimals, suffix):
+        """number() for a value already scaled to an int q (or None)"""
+        key = -1 << 30 if q is None else q
+        text = self.cached(field, key, suffix)
+        if text is not None:
+            return text
+        pos = self._put(0, prefix)
+        if q is None:
+            pos = self._put(pos, DASHES)
+        else:
+            pos = self._put_fixed(pos, q, decimals)
+        pos = self._put(pos, suffix)
+        return self.store(field, key, str(self.buf[:pos], 'utf-8'), suffix)
+
+    def _put(self, pos, text):
+        data = self.encoded.get(text)
+        if data is None:
+            data = self.encoded[text] = text.encode() if isinstance(text, str) else text
+        buf = self.buf
+        for c in data:
+            buf[pos] = c
+            pos += 1
+        return pos
+
+    def _put_fixed(self, pos, q, decimals):
+        """Write the scaled integer q as a decimal with decimals places"""
+        buf = self.buf
+        if q < 0:
+            buf[pos] = MINUS
+            pos += 1
+            q = -q
+        # Digits needed, at least one before the point
+        digits = decimals + 1
+        limit = SCALES[decimals] * 10
+        while q >= limit:
+            digits += 1
+            limit *= 10
+        end = pos + digits + (1 if decimals else 0)
+        i = end
+        for n in range(digits):
+            if decimals and n == decimals:
+                i -= 1
+                buf[i] = DOT
+            i -= 1
+            buf[i] = ZERO + q % 10
+            q //= 10
+        return end
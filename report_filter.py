@@ -0,0 +1,117 @@
+# Reporting filter deciding which readings are published.
+# Each channel has an absolute and a percent deadband and an optional
+# swinging-door compression deviation. On top of that a minimum interval
+# rate-limits publishes and a maximum silence forces a heartbeat.
+#
+# With swinging-door compression enabled the filter may report the previous
+# reading rather than the current one (the last point that still fitted the
+# door), so callers publish the returned timestamp and values.
+
+
+class SwingingDoor:
+    """Swinging-door trending state for one channel"""
+
+    def __init__(self, deviation):
+        self.deviation = deviation
+        self.reset(None, None)
+
+    def reset(self, epoch, value):
+        self.t0 = epoch
+        self.v0 = value
+        self.upper = None
+        self.lower = None
+
+    def fits(self, epoch, value):
+        """Narrow the door with a new point; False once the door opens"""
+        dt = epoch - self.t0
+        if dt <= 0:
+            return True
+        upper = (value + self.deviation - self.v0) / dt
+        lower = (value - self.deviation - self.v0) / dt
+        if self.upper is None or upper < self.upper:
+            self.upper = upper
+        if self.lower is None or lower > self.lower:
+            self.lower = lower
+        return self.lower <= self.upper
+
+
+class ReportFilter:
+    """Decide which readings to publish.
+
+    deadband, deadband_pct and swing are per-channel tuples; 0 disables a
+    criterion. min_interval and max_silence are seconds, 0 disables them.
+    """
+
+    def __init__(self, deadband, deadband_pct=None, swing=None,
+                 min_interval=0, max_silence=0):
+        channels = len(deadband)
+        self.deadband = deadband
+        self.deadband_pct = deadband_pct or (0,) * channels
+        swing = swing or (0,) * channels
+        self.doors = [SwingingDoor(d) if d else None for d in swing]
+        self.min_interval = min_interval
+        self.max_silence = max_silence
+        self.last_epoch = None
+        self.last_values = [0.0] * channels
+        self.prev_epoch = None
+        self.prev_values = [0.0] * channels
+        self.stats = {'samples': 0, 'reported': 0}
+
+    def _outside_deadband(self, values):
+        for ch in range(len(values)):
+            last = self.last_values[ch]
+            band = self.deadband[ch]
+            pct = self.deadband_pct[ch]
+            if pct:
+                band = max(band, abs(last) * pct / 100)
+            if band and abs(values[ch] - last) > band:
+                return True
+        return False
+
+    def _door_opened(self, epoch, values):
+        opened = False
+        for ch in range(len(values)):
+            door = self.doors[ch]
+            if door is not None and not door.fits(epoch, values[ch]):
+                opened = True
+        return opened
+
+    def update(self, epoch, values):
+        """Feed a reading; return (epoch, values) to publish or None"""
+        self.stats['samples'] += 1
+        report = None
+        if self.last_epoch is None:
+            report = (epoch, tuple(values))
+        else:
+            elapsed = epoch - self.last_epoch
+            if self.min_interval and elapsed < self.min_interval:
+                pass
+            elif self.max_silence and elapsed >= self.max_silence:
+                report = (epoch, tuple(values))
+            elif self._door_opened(epoch, values):
+                # Archive the last point that fitted, or this one if none did
+                if self.prev_epoch is not None and self.prev_epoch != self.last_epoch:
+                    report = (self.prev_epoch, tuple(self.prev_values))
+                else:
+                    report = (epoch, tuple(values))
+            elif self._outside_deadband(values):
+                report = (epoch, tuple(values))
+
+        if report is not None:
+            self._reported(report, epoch, values)
+        self.prev_epoch = epoch
+        for ch in range(len(values)):
+            self.prev_values[ch] = values[ch]
+        return report
+
+    def _reported(self, report, epoch, values):
+        self.stats['reported'] += 1
+        self.last_epoch, reported = report
+        for ch in range(len(values)):
+            self.last_values[ch] = reported[ch]
+            door = self.doors[ch]
+            if door is not None:
+                door.reset(self.last_epoch, reported[ch])
+                # Restart the door from the archived point through this one
+                if self.last_epoch != epoch:
+                    door.fits(epoch, values[ch])
@@ -0,0 +1,95 @@
+# Packed resource bundle reader.
+# tools/pack_resources.py packs icon blobs (and any other asset) into one
+# file: a header, an index of (name hash, offset, length, name check) sorted
+# by hash, the data, and a name table used only by the host tools. The check
+# (name length and a second hash) tells a name that only shares the hash of
+# a packed one from the real entry. The bundle stays
+# open; a read seeks to one entry and fills a single reused buffer, so
+# looking up an asset costs no directory walk, no file open and no
+# allocation beyond the first read.
+import struct
+from array import array
+
+MAGIC = b'RES1'
+VERSION = 2
+HEADER = "<4sHHI"  # magic, version, entry count, name table offset
+HEADER_SIZE = struct.calcsize(HEADER)
+ENTRY = "<IIII"  # name hash, offset, length, name check
+FIELDS = 4  # words per index entry
+ENTRY_SIZE = struct.calcsize(ENTRY)
+
+
+def name_hash(name):
+    """32-bit FNV-1a of an asset name"""
+    h = 0x811C9DC5
+    for c in name.encode() if isinstance(name, str) else name:
+        h = ((h ^ c) * 0x01000193) & 0xFFFFFFFF
+    return h
+
+
+def name_check(name):
+    """Name length in the top byte over a 24-bit djb2 of the name"""
+    data = name.encode() if isinstance(name, str) else name
+    h = 5381
+    for c in data:
+        h = (h * 33 + c) & 0xFFFFFF
+    return (len(data) & 0xFF) << 24 | h
+
+
+class Bundle:
+    """Read-only access to a packed resource bundle"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            magic, version, count, self.names_offset = struct.unpack(HEADER, self.file.read(HEADER_SIZE))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("not a resource bundle")
+            self.index = array('I', self.file.read(count * ENTRY_SIZE))
+        except:
+            self.file.close()
+            raise
+        self.count = count
+        self.buffer = None
+        self.stats = {'reads': 0, 'bytes': 0}
+
+    def find(self, name):
+        """(offset, length) of an asset, or None"""
+        h = name_hash(name)
+        index = self.index
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if index[mid * FIELDS] < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        entry = lo * FIELDS
+        # Packed hashes are unique, so one check settles a hash match
+        if lo < self.count and index[entry] == h and index[entry + 3] == name_check(name):
+            return index[entry + 1], index[entry + 2]
+        return None
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    def read(self, name):
+        """Asset contents as a memoryview, valid until the next read; None if absent"""
+        entry = self.find(name)
+        if entry is None:
+            return None
+        offset, length = entry
+        if self.buffer is None or len(self.buffer) < length:
+            # Sized for the largest entry so later reads never reallocate
+            largest = max(self.index[i * FIELDS + 2] for i in range(self.count))
+            self.buffer = bytearray(largest)
+        view = memoryview(self.buffer)[:length]
+        self.file.seek(offset)
+        self.file.readinto(view)
+        self.stats['reads'] += 1
+        self.stats['bytes'] += length
+        return view
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,140 @@
+# Local alert rules.
+# Each rule watches one value (a sensor reading or a derived metric) and
+# raises an alert when it goes above or below a threshold. With "rate" the
+# rule watches the change per hour instead, estimated like rate_control.py
+# from the gap between exponentially weighted means over window and window /
+# 10 seconds. A rule fires once when it trips, and is armed again only once
+# the value is back past its "clear" level (the threshold when not given),
+# so a value sitting on the threshold does not keep raising alerts. Rules
+# are compiled into flat arrays when loaded, with thresholds scaled to the
+# units the value is held in (the derived metrics are ints in tenths);
+# update() is one pass over them per sample with its state kept in those
+# arrays.
+from array import array
+
+LEVELS = ("info", "warning", "emergency")
+
+
+def severity(level):
+    """Rank of an alert level, unknown levels ranking as info"""
+    return LEVELS.index(level) if level in LEVELS else 0
+
+
+class RuleEngine:
+    """Alert rules over the values in sources (key -> dict holding it).
+
+    scales maps keys held as scaled ints to their factor, e.g. 10 for
+    tenths; rule thresholds are always in the value's real units.
+    """
+
+    def __init__(self, sources, scales=None):
+        self.sources = sources
+        self.scales = scales or {}
+        self.ids = []
+        self.stats = {'evaluations': 0, 'fired': 0}
+        self.load([])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self, rules):
+        """Replace the rules; ValueError (and the old rules kept) if one is invalid"""
+        ids = []
+        holders = []
+        keys = []
+        sign = bytearray(len(rules))  # 1 above, 0 below
+        rate = bytearray(len(rules))
+        level = bytearray(len(rules))
+        trip = array('f', [0.0]) * len(rules)
+        clear = array('f', [0.0]) * len(rules)
+        tau = array('f', [0.0]) * len(rules)
+        scale = array('f', [1.0]) * len(rules)
+        messages = []
+        for i, rule in enumerate(rules):
+            try:
+                key = rule['key']
+                if key not in self.sources:
+                    raise ValueError("unknown key {}".format(key))
+                if ('above' in rule) == ('below' in rule):
+                    raise ValueError("needs one of above or below")
+                sign[i] = 1 if 'above' in rule else 0
+                trip[i] = rule['above'] if sign[i] else rule['below']
+                clear[i] = rule.get('clear', trip[i])
+                if (clear[i] > trip[i]) if sign[i] else (clear[i] < trip[i]):
+                    raise ValueError("clear is past the threshold")
+                rate[i] = 1 if rule.get('rate') else 0
+                tau[i] = rule.get('window', 900)
+                if tau[i] <= 0:
+                    raise ValueError("window must be positive")
+                if rule.get('level', "warning") not in LEVELS:
+                    raise ValueError("unknown level {}".format(rule.get('level')))
+                level[i] = severity(rule.get('level', "warning"))
+                message = rule.get('message', "{} {} {{:.1f}}".format(key, "above" if sign[i] else "below"))
+                message.format(0.0)
+                scale[i] = self.scales.get(key, 1)
+                trip[i] *= scale[i]
+                clear[i] *= scale[i]
+            except (KeyError, TypeError, IndexError, AttributeError, ValueError) as e:
+                raise ValueError("rule {}: {}".format(i, e))
+            ids.append(rule.get('id', str(i)))
+            holders.append(self.sources[key])
+            keys.append(key)
+            messages.append(message)
+        self.ids = ids
+        self.holders = holders
+        self.keys = keys
+        self.sign = sign
+        self.rate = rate
+        self.level = level
+        self.trip = trip
+        self.clear = clear
+        self.tau = tau
+        self.scale = scale
+        self.messages = messages
+        self.active = bytearray(len(rules))
+        self.value = array('f', [0.0]) * len(rules)
+        self.mean = array('f', [0.0]) * len(rules)
+        self.short = array('f', [0.0]) * len(rules)
+        self.seen = bytearray(len(rules))
+        self.last_epoch = None
+
+    def update(self, epoch):
+        """Evaluate every rule; the index of the most severe one that fired, or -1"""
+        self.stats['evaluations'] += 1
+        dt = 0 if self.last_epoch is None else epoch - self.last_epoch
+        self.last_epoch = epoch
+        fired = -1
+        for i in range(len(self.ids)):
+            value = self.holders[i][self.keys[i]]
+            if value is None:
+                continue
+            if self.rate[i]:
+                if not self.seen[i]:
+                    self.mean[i] = self.short[i] = value
+                    self.seen[i] = 1
+                elif dt > 0:
+                    tau = self.tau[i]
+                    self.mean[i] += dt / (tau + dt) * (value - self.mean[i])
+                    self.short[i] += dt / (tau / 10 + dt) * (value - self.short[i])
+                # On a steady trend the short mean leads by 0.9 * tau * rate
+                value = (self.short[i] - self.mean[i]) * 3600 / (0.9 * self.tau[i])
+            self.value[i] = value
+            if self.active[i]:
+                if (value < self.clear[i]) if self.sign[i] else (value > self.clear[i]):
+                    self.active[i] = 0
+            elif (value > self.trip[i]) if self.sign[i] else (value < self.trip[i]):
+                self.active[i] = 1
+                self.stats['fired'] += 1
+                if fired < 0 or self.level[i] > self.level[fired]:
+                    fired = i
+        return fired
+
+    def alert(self, i, timestamp):
+        """Alert dict for rule i, shaped like a weather/alert_trigger payload"""
+        return {
+            'level': LEVELS[self.level[i]],
+            'message': self.messages[i].format(self.value[i] / self.scale[i]),
+            'timestamp': timestamp,
+            'source': "local",
+            'rule': self.ids[i]
+        }
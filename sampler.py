@@ -0,0 +1,94 @@
+# Sensor sampling stage.
+# Reads temperature, humidity and pressure from the ENV III in one burst per
+# tick, runs each channel through a sliding median-of-N and an optional EMA,
+# and fills a single reused Reading. All buffers are preallocated, so a
+# sample does not allocate.
+from array import array
+
+
+class Reading:
+    """Timestamped, filtered reading of all three channels"""
+    __slots__ = ('epoch', 'temperature', 'humidity', 'pressure', 'count')
+
+    def __init__(self):
+        self.epoch = 0
+        self.temperature = 0.0
+        self.humidity = 0.0
+        self.pressure = 0.0
+        self.count = 0
+
+
+class MedianFilter:
+    """Median of the last n values followed by an optional EMA"""
+
+    def __init__(self, n, alpha=0.0):
+        self.n = n
+        self.alpha = alpha
+        self.ring = array('d', [0.0]) * n
+        self.scratch = array('d', [0.0]) * n
+        self.head = 0
+        self.count = 0
+        self.ema = None
+
+    def reset(self):
+        self.count = 0
+        self.head = 0
+        self.ema = None
+
+    def add(self, value):
+        self.ring[self.head] = value
+        self.head = (self.head + 1) % self.n
+        if self.count < self.n:
+            self.count += 1
+        # Insertion sort into the scratch buffer; n is small
+        scratch = self.scratch
+        count = self.count
+        for i in range(count):
+            v = self.ring[i]
+            j = i - 1
+            while j >= 0 and scratch[j] > v:
+                scratch[j + 1] = scratch[j]
+                j -= 1
+            scratch[j + 1] = v
+        mid = count // 2
+        if count & 1:
+            median = scratch[mid]
+        else:
+            median = (scratch[mid - 1] + scratch[mid]) / 2
+        if not self.alpha:
+            return median
+        if self.ema is None:
+            self.ema = median
+        else:
+            self.ema += self.alpha * (median - self.ema)
+        return self.ema
+
+
+class Sampler:
+    """Burst-read the ENV III and emit one filtered Reading per tick"""
+
+    def __init__(self, median=3, ema_alpha=0.0):
+        self.temperature = MedianFilter(median, ema_alpha)
+        self.humidity = MedianFilter(median, ema_alpha)
+        self.pressure = MedianFilter(median, ema_alpha)
+        self.reading = Reading()
+
+    def reset(self):
+        """Forget the filter history, e.g. after the sensor was reconnected"""
+        self.temperature.reset()
+        self.humidity.reset()
+        self.pressure.reset()
+        self.reading.count = 0
+
+    def sample(self, env, epoch):
+        # Read the three channels back to back before any processing
+        temperature = env.temperature
+        humidity = env.humidity
+        pressure = env.pressure
+        reading = self.reading
+        reading.epoch = epoch
+        reading.temperature = self.temperature.add(temperature)
+        reading.humidity = self.humidity.add(humidity)
+        reading.pressure = self.pressure.add(pressure)
+        reading.count += 1
+        return reading
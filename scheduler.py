@@ -0,0 +1,105 @@
+# Deadline-based cooperative task scheduler for the main loop.
+# Every periodic job (sensor sampling, MQTT polling, connection checks, RGB
+# effects, UI refresh) is a task with its own period and jitter budget. The
+# loop sleeps until the earliest deadline instead of spinning.
+from clock import ticks_ms, ticks_diff, ticks_add, sleep_ms
+
+
+class Task:
+    """A periodic job and its timing statistics"""
+    __slots__ = ('name', 'fn', 'period', 'jitter', 'deadline', 'runs',
+                 'overruns', 'max_late')
+
+    def __init__(self, name, fn, period_ms, jitter_ms, deadline):
+        self.name = name
+        self.fn = fn
+        self.period = period_ms
+        self.jitter = jitter_ms
+        self.deadline = deadline
+        self.runs = 0
+        self.overruns = 0
+        self.max_late = 0
+
+
+class Scheduler:
+    """Run tasks at their deadlines and sleep in between.
+
+    clock and sleep default to the tick functions but can be replaced with a
+    fake clock so the schedule can be run deterministically on CPython.
+    """
+
+    def __init__(self, clock=ticks_ms, sleep=sleep_ms, max_sleep_ms=1000):
+        self.clock = clock
+        self.sleep = sleep
+        self.max_sleep = max_sleep_ms
+        self.tasks = []
+
+    def add(self, name, fn, period_ms, jitter_ms=0, delay_ms=0):
+        """Register fn to run every period_ms, first after delay_ms"""
+        task = Task(name, fn, period_ms, jitter_ms, ticks_add(self.clock(), delay_ms))
+        self.tasks.append(task)
+        return task
+
+    def get(self, name):
+        for task in self.tasks:
+            if task.name == name:
+                return task
+        return None
+
+    def set_period(self, name, period_ms):
+        """Change a task period; the new period applies from its next run"""
+        task = self.get(name)
+        if task is not None:
+            if ticks_diff(task.deadline, ticks_add(self.clock(), period_ms)) > 0:
+                task.deadline = ticks_add(self.clock(), period_ms)
+            task.period = period_ms
+
+    def time_to_next(self):
+        """Milliseconds until the earliest deadline (0 if one is due)"""
+        now = self.clock()
+        wait = self.max_sleep
+        for task in self.tasks:
+            remaining = ticks_diff(task.deadline, now)
+            if remaining < wait:
+                wait = remaining
+        return wait if wait > 0 else 0
+
+    def run_pending(self):
+        """Run every task that is due; return how many ran.
+
+        A task whose deadline is within its jitter budget also runs now, so
+        nearby deadlines are served by one wakeup instead of several.
+        """
+        ran = 0
+        for task in self.tasks:
+            now = self.clock()
+            late = ticks_diff(now, task.deadline)
+            if late < -task.jitter:
+                continue
+            try:
+                task.fn()
+            except Exception as e:
+                print("Task {} error: {}".format(task.name, e))
+            task.runs += 1
+            ran += 1
+            if late > task.jitter:
+                task.overruns += 1
+            if late > task.max_late:
+                task.max_late = late
+            # Keep the cadence anchored to the original deadlines unless the
+            # task fell more than a whole period behind
+            task.deadline = ticks_add(task.deadline, task.period)
+            if ticks_diff(now, task.deadline) >= 0:
+                task.deadline = ticks_add(now, task.period)
+        return ran
+
+    def run_once(self):
+        """Run due tasks, then sleep until the next deadline"""
+        self.run_pending()
+        wait = self.time_to_next()
+        if wait > 0:
+            self.sleep(wait)
+
+    def run_forever(self):
+        while True:
+            self.run_once()
@@ -0,0 +1,629 @@
+# Screens, buttons and the RGB alert LED.
+# Every screen is drawn from the shared state in state.py; navigate_to_screen()
+# clears the LCD and builds the new screen. Each screen watches the state
+# keys it displays (state.store), and refresh_ui() runs the updates queued
+# by changes since the last frame, so nothing is redrawn while nothing
+# changes. The status, home and settings screens retain their widgets and
+# take their label text from the render_text cache, so an update with
+# unchanged values allocates nothing and touches no widget.
+from m5stack import lcd, btnA, btnB, btnC
+from m5ui import M5TextBox, M5Rect, M5Img, setScreenColor
+try:
+    from m5ui import rgb
+except ImportError:
+    try:
+        import rgb
+    except ImportError:
+        rgb = None
+from clock import ticks_ms
+import math
+from state import (Status, status_to_string, screen_navigation, ui, device, config, status,
+                   sensor, derived, weather, store, forecast_data, history_data, history_scale, HISTORY_BAR_HEIGHT,
+                   get_heap_monitor)
+from weather_data import format_temperature, get_temperature_unit_symbol
+
+# Widget activity counter - every widget construction, widget update and
+# direct icon blit goes through here, so redraw work can be read back on the
+# host or serial console. These are UI operations, not LCD draw calls: one
+# widget can take several (the simulator reports those separately)
+widget_stats = {'created': 0, 'updated': 0, 'blits': 0}
+
+def _counted_widget(widget_class):
+    def create(*args, **kwargs):
+        widget_stats['created'] += 1
+        return widget_class(*args, **kwargs)
+    return create
+
+M5TextBox = _counted_widget(M5TextBox)
+M5Rect = _counted_widget(M5Rect)
+M5Img = _counted_widget(M5Img)
+
+# Initialize RGB LED - using UIFlow rgb object
+# RGB is available globally in UIFlow framework
+
+# Color constants
+COLOR_GREEN = 0x00ff00
+COLOR_RED = 0xff0000
+COLOR_YELLOW = 0xffff00
+
+def fill_rect(x, y, w, h, color):
+    lcd.rect(x, y, w, h, color, color)
+
+def get_resources():
+    """Open resource bundle, or False when none is deployed"""
+    if device['resources'] is None:
+        try:
+            from resources import Bundle
+            device['resources'] = Bundle(config['resource_bundle'])
+        except (OSError, ValueError):
+            device['resources'] = False
+    return device['resources']
+
+def read_icon(name):
+    """Icon blob from the resource bundle, falling back to a loose file"""
+    from icons import blob_name
+    blob = blob_name(name)
+    bundle = get_resources()
+    if bundle:
+        return bundle.read("w32/" + blob)
+    try:
+        with open("{}/{}".format(config['icon_dir'], blob), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def get_icon_cache():
+    if device['icons'] is None:
+        from icons import IconCache
+        device['icons'] = IconCache(fill_rect, read_icon, config['icon_cache_bytes'])
+    return device['icons']
+
+def get_backlight():
+    if device['backlight'] is None:
+        from power import Backlight
+        device['backlight'] = Backlight(
+            lcd.setBrightness,
+            config['backlight_levels'],
+            config['backlight_dim_s'] * 1000,
+            config['backlight_off_s'] * 1000
+        )
+    return device['backlight']
+
+def wake_screen():
+    """Backlight back on after activity; True if it was off"""
+    if config['power_mode'] == "normal":
+        return False
+    return get_backlight().touch()
+
+def update_backlight():
+    """Dim after inactivity in the low-power modes; True while the screen is off"""
+    if config['power_mode'] == "normal":
+        return False
+    return get_backlight().update()
+
+def get_text_cache():
+    if device['text_cache'] is None:
+        from render_text import TextCache
+        device['text_cache'] = TextCache()
+    return device['text_cache']
+
+# Retained widgets of the current screen with the text and color each one
+# shows. Populated by the show_* functions, emptied whenever the screen is
+# cleared.
+widgets = {}
+widget_text = {}
+widget_color = {}
+
+def set_widget_text(key, text):
+    """Update a retained text widget only if its text changed"""
+    old = widget_text.get(key)
+    if old is not text and old != text:
+        widgets[key].setText(text)
+        widget_text[key] = text
+        widget_stats['updated'] += 1
+
+def set_widget_color(key, color):
+    if widget_color.get(key) != color:
+        widgets[key].setColor(color)
+        widget_color[key] = color
+        widget_stats['updated'] += 1
+
+def add_text_widget(key, x, y, text, color):
+    widgets[key] = M5TextBox(x, y, text, lcd.FONT_DejaVu18, color, rotate=0)
+    widget_text[key] = text
+    widget_color[key] = color
+
+# Label text per field; cached, so the same string object comes back while
+# the value (to the decimals shown) and the unit are unchanged
+def temp_text(cache):
+    temp = sensor['temp']
+    if temp is not None and config['temperature_unit'] == "F":
+        temp = temp * 1.8 + 32.0
+    return cache.number('temp', "Temp: ", temp, 1, get_temperature_unit_symbol())
+
+def hum_text(cache):
+    return cache.number('hum', "Humidity: ", sensor['hum'], 1, "%")
+
+def press_text(cache):
+    if config['altitude_m'] and config['derived_metrics']:
+        return cache.fixed('sea_level', "Sea level: ", derived['sea_level'], 1, "hPa")
+    return cache.number('press', "Pressure: ", sensor['press'], 1, "hPa")
+
+def derived_text(cache):
+    """Dew point (feels-like once the heat index applies) and the 3-hour tendency"""
+    if not config['derived_metrics']:
+        return ""
+    temp = sensor['temp']
+    if temp is not None and temp >= HEAT_INDEX_FROM:
+        field, prefix, value = 'feels', "Feels ", derived['heat_index']
+    else:
+        field, prefix, value = 'dew', "Dew ", derived['dew_point']
+    # Derived values are ints in tenths
+    if value is not None and config['temperature_unit'] == "F":
+        value = (value * 18 + 5) // 10 + 320
+    first = cache.fixed(field, prefix, value, 1, get_temperature_unit_symbol())
+    tendency = derived['tendency']
+    # The sign is part of the cached text's key, so it stays consistent
+    prefix = "  3h +" if tendency is not None and tendency > 0 else "  3h "
+    second = cache.fixed('tendency', prefix, tendency, 1, "hPa")
+    return cache.join('derived', first, second)
+
+def status_text(cache, key, prefix):
+    return cache.label(key, prefix, status_to_string(status[key]))
+
+def status_color(state):
+    if state == Status.CONNECTED:
+        return COLOR_GREEN
+    return COLOR_YELLOW if state == Status.CONNECTING else COLOR_RED
+
+def heap_text(cache):
+    heap = get_heap_monitor()
+    heap.sample()
+    free_k = heap.stats['free'] // 1024
+    low_k = heap.stats['min_free'] // 1024
+    key = free_k << 16 | low_k
+    text = cache.cached('heap', key)
+    if text is None:
+        text = cache.store('heap', key, "Heap: {}k free, {}k low".format(free_k, low_k))
+    return text
+
+HOME_FIELDS = (('temp', temp_text), ('hum', hum_text), ('press', press_text), ('derived', derived_text))
+HEAT_INDEX_FROM = 26.7  # C, below which the NWS heat index is about the temperature
+STATUS_FIELDS = (('wifi', "WiFi: "), ('env', "ENV: "), ('mqtt', "MQTT: "))
+STATUS_KEYS = ('wifi', 'env', 'mqtt')
+UNIT_KEYS = ('temperature_unit',)
+
+def watch(fn, name, keys):
+    """Run fn on the next frame after a displayed key changes, until the screen is cleared"""
+    store.watch("screen", fn, name, keys)
+
+def redraw_screen():
+    navigate_to_screen(ui['screen'])
+
+def update_home_display():
+    """Update home screen display elements"""
+    try:
+        if 'temp' not in widgets:
+            return
+        cache = get_text_cache()
+        for key, text_fn in HOME_FIELDS:
+            set_widget_text(key, text_fn(cache))
+        set_widget_text('description', weather['description'])
+        set_widget_text('wind', weather['wind'])
+        if widget_text.get('icon') != weather['icon']:
+            widgets['icon'].changeImg("res/{}".format(weather['icon']))
+            widget_text['icon'] = weather['icon']
+            widget_stats['updated'] += 1
+    except:
+        pass
+
+def update_status_display():
+    """Update the connection lines of the status screen"""
+    cache = get_text_cache()
+    for key, prefix in STATUS_FIELDS:
+        set_widget_text(key, status_text(cache, key, prefix))
+        set_widget_color(key, status_color(status[key]))
+    # Go on to the home screen once all required connections are ready
+    if can_navigate_from_status():
+        navigate_to_screen("home")
+
+def update_settings_display():
+    """Update the unit, connection and heap lines of the settings screen"""
+    cache = get_text_cache()
+    set_widget_text('unit', cache.label('unit', "Temperature Unit: ", get_temperature_unit_symbol()))
+    for key, prefix in STATUS_FIELDS:
+        set_widget_text(key, status_text(cache, key, prefix))
+    if 'heap' in widgets:
+        set_widget_text('heap', heap_text(cache))
+
+def clear_screen():
+    store.unwatch("screen")
+    widgets.clear()
+    widget_text.clear()
+    widget_color.clear()
+    lcd.clear()
+    setScreenColor(0x111111)
+    # gc.threshold() keeps collections going; only collect here when low
+    get_heap_monitor().maybe_collect()
+
+def get_page_name(screen_id):
+    page_names = {
+        "status": "Status",
+        "home": "Home", 
+        "forecast": "Forecast",
+        "history": "History",
+        "settings": "Settings",
+        "alert": "Alert"
+    }
+    return page_names.get(screen_id, "")
+
+def navigate_to_screen(screen_name):
+    if screen_name in screen_navigation:
+        ui['screen'] = screen_name
+        clear_screen()
+        if screen_name == "status":
+            show_status_screen()
+        elif screen_name == "home":
+            show_home_screen()
+        elif screen_name == "forecast":
+            show_forecast_screen()
+        elif screen_name == "history":
+            show_history_screen()
+        elif screen_name == "settings":
+            show_settings_screen()
+        elif screen_name == "alert":
+            show_alert_screen()
+
+def update_footer():
+    # With lazy UI creation, footer is created fresh each time in create_footer()
+    pass
+
+def show_header(name):
+    M5Rect(0, 0, 320, 32, 0x262626, 0x262626)
+    M5TextBox(8, 8, name, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+
+def show_alert_header(name, color):
+    M5Rect(0, 0, 320, 32, color, 0xffffff)
+    M5TextBox(8, 8, name, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+
+def create_footer():
+    M5Rect(0, 208, 320, 32, 0x262626, 0x262626)
+    
+    if ui['screen'] in screen_navigation:
+        nav = screen_navigation[ui['screen']]
+        
+        # Special case for status screen when navigation is blocked
+        if ui['screen'] == "status" and not can_navigate_from_status():
+            footer_a = footer_b = footer_c = ""
+        else:
+            footer_a = get_page_name(nav.get("A", ""))
+            footer_b = get_page_name(nav.get("B", ""))
+            footer_c = get_page_name(nav.get("C", ""))
+        
+        M5TextBox(32, 216, footer_a, lcd.FONT_DejaVu18, 0x888888, rotate=0)
+        M5TextBox(126, 216, footer_b, lcd.FONT_DejaVu18, 0x888888, rotate=0)
+        M5TextBox(222, 216, footer_c, lcd.FONT_DejaVu18, 0x888888, rotate=0)
+
+
+def show_status_screen():
+    show_header("System Status")
+
+    # Create the widgets once; update_status_display() only touches changed lines
+    cache = get_text_cache()
+    y_pos = 48
+    for key, prefix in STATUS_FIELDS:
+        add_text_widget(key, 8, y_pos, status_text(cache, key, prefix), status_color(status[key]))
+        y_pos += 30
+    # Removed SD status to save memory
+    watch(update_status_display, 'status', STATUS_KEYS)
+    
+    create_footer()
+    update_footer()
+
+def show_home_screen():
+    show_header("Home Screen")
+    
+    # Create the widgets once; update_home_display() only touches changed fields
+    cache = get_text_cache()
+    y_pos = 48
+    for key, text_fn in HOME_FIELDS:
+        add_text_widget(key, 8, y_pos, text_fn(cache), 0xffffff)
+        y_pos += 26
+    for key in ('description', 'wind'):
+        add_text_widget(key, 8, y_pos, weather[key], 0xffffff)
+        y_pos += 26
+    
+    widgets['icon'] = M5Img(248, 44, "res/{}".format(weather['icon']), True)
+    widget_text['icon'] = weather['icon']
+    watch(update_home_display, 'sensor', ('temp', 'hum', 'press'))
+    watch(update_home_display, 'derived', ('dew_point', 'heat_index', 'sea_level', 'tendency'))
+    watch(update_home_display, 'weather', ('description', 'wind', 'icon'))
+    watch(update_home_display, 'config', UNIT_KEYS)
+
+    create_footer()
+    update_footer()
+
+def show_forecast_screen():
+    show_header("5-Day Forecast")
+    
+    # Add degree symbol in top right
+    M5TextBox(280, 8, get_temperature_unit_symbol(), lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+    
+    # Layout for 5 days across 320px screen
+    col_width = 60
+    start_x = 8
+    
+    # Create forecast for 5 days using new data structure
+    for i in range(5):
+        x_pos = start_x + (i * col_width)
+        
+        if forecast_data[i]:
+            day, date, temp, humidity, icon = forecast_data[i]
+            
+            # Day name
+            day_text = "TOD" if day == "TOD" else day
+            M5TextBox(x_pos, 48, day_text, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+            
+            # Date
+            date_short = date.split('/')[0] if '/' in date else date
+            M5TextBox(x_pos, 74, date_short, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+            
+            # Weather icon - pre-decoded blob if deployed, PNG otherwise
+            try:
+                if get_icon_cache().draw(x_pos, 98, icon):
+                    widget_stats['blits'] += 1
+                else:
+                    M5Img(x_pos, 98, "res/w32/{}".format(icon), True)
+            except:
+                icon_char = "?" 
+                if "rain" in icon:
+                    icon_char = "R"
+                elif "sunny" in icon or "clear" in icon:
+                    icon_char = "S"
+                elif "cloud" in icon:
+                    icon_char = "C"
+                M5TextBox(x_pos, 106, icon_char, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+            
+            # Temperature and humidity
+            M5TextBox(x_pos, 150, temp, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+            M5TextBox(x_pos, 176, humidity, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+    
+    # Drawn in one go, so new data redraws the whole screen. The forecast
+    # temperatures are formatted when the data arrives, not on a unit change.
+    watch(redraw_screen, 'weather', ('forecast',))
+    
+    create_footer()
+    update_footer()
+
+def show_history_screen():
+    show_header("Past 5 Days")
+    
+    # Add symbols in top right
+    M5TextBox(260, 8, get_temperature_unit_symbol(), lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+    M5TextBox(290, 8, "%", lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+    
+    # Layout for 5 time periods
+    col_width = 60
+    start_x = 8
+    
+    # Create history display using new data structure
+    bars = history_scale['bars']
+    for i in range(5):
+        x_pos = start_x + (i * col_width)
+        
+        if history_data[i]:
+            day, date, temp, humidity = history_data[i]
+            temp_bar_height, humidity_bar_height, temp_bar_color, humidity_bar_color = bars[i]
+            
+            # Day abbreviation
+            day_text = "TOD" if day == "TOD" else day
+            M5TextBox(x_pos, 48, day_text, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+            
+            # Date
+            date_short = date.split('/')[0] if '/' in date else date
+            M5TextBox(x_pos, 74, date_short, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+            
+            # Temperature bar (left side)
+            temp_bar_x = x_pos + 8
+            temp_bar_y = 82 + (HISTORY_BAR_HEIGHT - temp_bar_height)
+            M5Rect(temp_bar_x, temp_bar_y, 10, temp_bar_height, temp_bar_color, temp_bar_color)
+            
+            # Humidity bar (right side)
+            humidity_bar_x = temp_bar_x + 12
+            humidity_bar_y = 82 + (HISTORY_BAR_HEIGHT - humidity_bar_height)
+            M5Rect(humidity_bar_x, humidity_bar_y, 10, humidity_bar_height, humidity_bar_color, humidity_bar_color)
+            
+            # Temperature and humidity values
+            temp_text = "{}°".format(format_temperature(temp, False))
+            M5TextBox(x_pos, 154, temp_text, lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+            M5TextBox(x_pos, 180, "{}%".format(humidity), lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+    
+    watch(redraw_screen, 'weather', ('history',))
+    watch(redraw_screen, 'config', UNIT_KEYS)
+    
+    create_footer()
+    update_footer()
+
+def show_settings_screen():
+    show_header("Settings")
+    
+    # Create the widgets once; update_settings_display() only touches changed lines
+    cache = get_text_cache()
+    add_text_widget('unit', 8, 48, cache.label('unit', "Temperature Unit: ", get_temperature_unit_symbol()), 0xffffff)
+    M5TextBox(8, 70, "Double-tap C to change unit", lcd.FONT_DejaVu18, 0x888888, rotate=0)
+    
+    # Show simplified connection status
+    y_pos = 100
+    for key, prefix in STATUS_FIELDS:
+        add_text_widget(key, 8, y_pos, status_text(cache, key, prefix), 0x888888)
+        y_pos += 25
+    
+    if config['diagnostics']:
+        add_text_widget('heap', 8, 175, heap_text(cache), 0x888888)
+    watch(update_settings_display, 'status', STATUS_KEYS)
+    watch(update_settings_display, 'config', UNIT_KEYS)
+    
+    create_footer()
+    update_footer()
+
+def show_alert_screen():
+    if device['weather_alert'] is None:
+        show_header("Weather Alert")
+        M5TextBox(10, 50, "No active alerts", lcd.FONT_DejaVu18, 0xffffff, rotate=0)
+        create_footer()
+        return
+    
+    # Get alert details
+    alert_message = device['weather_alert'].get("message", "Unknown alert")
+    alert_level = device['weather_alert'].get("level", "info")
+    alert_timestamp = device['weather_alert'].get("timestamp", "")
+    
+    # Get colors based on alert level
+    if alert_level == "emergency":
+        bg_color = 0x8B0000
+        text_color = 0xFFFFFF
+    elif alert_level == "warning":
+        bg_color = 0xB8860B
+        text_color = 0x000000
+    else:  # info or default
+        bg_color = 0x000080
+        text_color = 0xFFFFFF
+    
+    # Set background color
+    setScreenColor(bg_color)
+    
+    # Show header
+    show_alert_header("Alert - {}".format(alert_level.upper()), bg_color)
+    
+    # Display alert message - split into multiple lines if needed
+    if len(alert_message) > 40:
+        first_line = alert_message[:40]
+        second_line = alert_message[40:]
+        if len(second_line) > 35:
+            second_line = second_line[:32] + "..."
+        M5TextBox(8, 50, first_line, lcd.FONT_DejaVu18, text_color, rotate=0)
+        M5TextBox(8, 75, second_line, lcd.FONT_DejaVu18, text_color, rotate=0)
+        y_pos = 100
+    else:
+        M5TextBox(8, 50, alert_message, lcd.FONT_DejaVu18, text_color, rotate=0)
+        y_pos = 75
+    
+    # Display timestamp if available
+    if alert_timestamp:
+        M5TextBox(8, y_pos, "Time: {}".format(alert_timestamp), lcd.FONT_DejaVu18, text_color, rotate=0)
+    
+    # Display dismiss instruction
+    M5TextBox(8, 180, "Press B to dismiss", lcd.FONT_DejaVu18, text_color, rotate=0)
+    
+    create_footer()
+
+# RGB alert control - using UIFlow rgb methods
+def handle_rgb_alert(alert_level=None):
+    """Handle RGB lighting based on alert level"""
+    try:
+        if rgb is None:
+            return
+        if alert_level == "emergency":
+            rgb.setColorFrom(1, 10, 0xff0000)  # Red
+            rgb.setBrightness(255)
+        elif alert_level == "warning":
+            rgb.setColorFrom(1, 10, 0xffff00)  # Yellow
+            rgb.setBrightness(255)
+        elif alert_level == "info":
+            rgb.setColorFrom(1, 10, 0x0000ff)  # Blue
+            rgb.setBrightness(255)
+        else:
+            rgb.setColorFrom(1, 10, 0x000000)  # Off
+            rgb.setBrightness(0)
+    except Exception as e:
+        print("RGB error: {}".format(e))
+
+def update_rgb_emergency():
+    """Update RGB for emergency breathing effect"""
+    try:
+        if rgb is None:
+            return
+        if device['weather_alert'] and device['weather_alert'].get("level") == "emergency":
+            current_time = ticks_ms()
+            brightness = int(128 + 127 * math.sin(current_time / 500))
+            rgb.setColorFrom(1, 10, 0xff0000)
+            rgb.setBrightness(brightness)
+    except Exception as e:
+        print("RGB emergency update error: {}".format(e))
+
+def can_navigate_from_status():
+    return (status['wifi'] == Status.CONNECTED and 
+            status['env'] == Status.CONNECTED and 
+            status['mqtt'] == Status.CONNECTED)
+
+def buttonA_wasPressed():
+    # Block navigation from alert screen (only B button dismisses)
+    if ui['screen'] == "alert":
+        return
+    
+    if ui['screen'] == "status" and not can_navigate_from_status():
+        return
+    if ui['screen'] in screen_navigation and "A" in screen_navigation[ui['screen']]:
+        next_screen = screen_navigation[ui['screen']]["A"]
+        navigate_to_screen(next_screen)
+
+def buttonB_wasPressed():
+    # Special handling for alert screen - dismiss alert
+    if ui['screen'] == "alert":
+        device['weather_alert'] = None  # Clear the alert
+        handle_rgb_alert(None)  # Clear RGB alert
+        navigate_to_screen("home")  # Return to home screen
+        return
+    
+    # Normal navigation behavior for other screens
+    if ui['screen'] == "status" and not can_navigate_from_status():
+        return
+    if ui['screen'] in screen_navigation and "B" in screen_navigation[ui['screen']]:
+        next_screen = screen_navigation[ui['screen']]["B"]
+        navigate_to_screen(next_screen)
+
+def buttonC_wasDoublePress():
+    """Handle double-press of button C to toggle temperature unit"""
+    # Toggle temperature unit; the screens showing it redraw on the next frame
+    if config['temperature_unit'] == "C":
+        store.set('config', 'temperature_unit', "F")
+    else:
+        store.set('config', 'temperature_unit', "C")
+
+def buttonC_wasPressed():
+    # Block navigation from alert screen (only B button dismisses)
+    if ui['screen'] == "alert":
+        return
+    
+    # Normal navigation behavior
+    if ui['screen'] == "status" and not can_navigate_from_status():
+        return
+    if ui['screen'] in screen_navigation and "C" in screen_navigation[ui['screen']]:
+        next_screen = screen_navigation[ui['screen']]["C"]
+        navigate_to_screen(next_screen)
+
+def refresh_ui():
+    """Run the screen updates queued by state changes since the last frame"""
+    store.flush()
+    # The heap line follows no state key and is the only one polled
+    if 'heap' in widgets:
+        set_widget_text('heap', heap_text(get_text_cache()))
+
+def on_press(handler):
+    """Button callback that wakes the screen first; a press that wakes it does nothing else"""
+    def press():
+        if not wake_screen():
+            handler()
+    return press
+
+def register_buttons():
+    """Set up button callbacks"""
+    btnA.wasPressed(on_press(buttonA_wasPressed))
+    btnB.wasPressed(on_press(buttonB_wasPressed))
+    btnC.wasPressed(on_press(buttonC_wasPressed))
+    
+    # Try to set up double-press callback if available
+    try:
+        btnC.wasDoublePress(on_press(buttonC_wasDoublePress))
+    except:
+        pass
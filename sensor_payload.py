@@ -0,0 +1,153 @@
+# Compact payloads for weather/sensor_data.
+# A single reading can be sent as a 10-byte binary record instead of JSON,
+# and readings can be collected into a preallocated batch published as one
+# message, either as columnar JSON or as a packed binary struct. The format
+# in use is advertised on a retained capabilities topic; tools/sensor_decoder
+# decodes every variant on the ingest side.
+import struct
+import time
+
+from record_buffer import RECORD, RECORD_SIZE, pack_into
+
+VERSION = 1
+
+# Seconds between the Unix epoch and the board epoch (2000 on the ESP32)
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+# Every payload carries UTC: epoch seconds are Unix time, and the RTC's
+# local time is shifted back by utc_offset (seconds ahead of UTC)
+
+# Binary batch: version, flags, count, base Unix seconds, then per reading
+# seconds since base, temperature (0.01 C), humidity (0.01 %), pressure (0.1 hPa)
+BATCH_HEADER = "<BBHI"
+BATCH_HEADER_SIZE = struct.calcsize(BATCH_HEADER)
+BATCH_RECORD = "<HhHH"
+BATCH_RECORD_SIZE = struct.calcsize(BATCH_RECORD)
+BATCH_FLAGS = 0x01  # bit 0: binary batch
+BATCH_MAX_DELTA = 65535  # seconds from the first reading a record can carry
+
+# Single binary reading: Unix seconds, temperature (0.01 C), humidity
+# (0.01 %), pressure (0.1 hPa) - the same layout as the buffer records
+READING = RECORD
+READING_SIZE = RECORD_SIZE
+
+_reading = bytearray(READING_SIZE)
+
+
+def _clamp(value, low, high):
+    return low if value < low else (high if value > high else value)
+
+
+def _tenths(q):
+    """"{:.1f}" of q / 10 for an int q, without going through a float"""
+    return "{}{}.{}".format("-" if q < 0 else "", abs(q) // 10, abs(q) % 10)
+
+
+def to_unix(epoch, utc_offset=0):
+    """Unix seconds of an RTC time that runs utc_offset seconds ahead of UTC"""
+    return int(epoch) + EPOCH_OFFSET - utc_offset
+
+
+def from_unix(seconds, utc_offset=0):
+    """RTC time of Unix seconds, the inverse of to_unix"""
+    return seconds - EPOCH_OFFSET + utc_offset
+
+
+def encode_reading(epoch, temperature, humidity, pressure, utc_offset=0):
+    """Pack one reading into a reusable 10-byte buffer"""
+    pack_into(_reading, 0, to_unix(epoch, utc_offset), temperature, humidity, pressure)
+    return _reading
+
+
+def capabilities(client_id, sensor_format, batch, batch_format, derived=()):
+    """Retained description of how this station encodes its readings
+
+    derived names the extra metrics carried by JSON payloads.
+    """
+    return ('{{"v":{},"client_id":"{}","format":"{}","batch":{},"batch_format":"{}",'
+            '"fields":["temperature","humidity","pressure"],"scale":[0.01,0.01,0.1],"derived":[{}]}}').format(
+        VERSION, client_id, sensor_format, batch, batch_format, ",".join('"{}"'.format(name) for name in derived))
+
+
+class Batch:
+    """Collect up to size readings in fixed-point form"""
+
+    def __init__(self, size, utc_offset=0):
+        self.size = size
+        self.utc_offset = utc_offset
+        self.count = 0
+        self.started = None
+        self.times = [0] * size
+        self.fixed = bytearray(size * 6)
+        self.binary = bytearray(BATCH_HEADER_SIZE + size * BATCH_RECORD_SIZE)
+
+    def fits(self, epoch):
+        """Whether a reading at epoch can join the batch: its seconds since
+        the first reading must fit a binary record"""
+        if self.count == 0:
+            return True
+        delta = to_unix(epoch, self.utc_offset) - self.times[0]
+        return 0 <= delta <= BATCH_MAX_DELTA
+
+    def add(self, epoch, temperature, humidity, pressure, now_ms=None):
+        """Add a reading, return True when the batch is full
+
+        Check fits() first; a reading that does not fit starts the next batch.
+        """
+        if self.count == 0:
+            self.started = now_ms
+        struct.pack_into("<hHH", self.fixed, self.count * 6,
+                         _clamp(int(round(temperature * 100)), -32768, 32767),
+                         _clamp(int(round(humidity * 100)), 0, 65535),
+                         _clamp(int(round(pressure * 10)), 0, 65535))
+        self.times[self.count] = to_unix(epoch, self.utc_offset)
+        self.count += 1
+        return self.count >= self.size
+
+    def reading(self, i):
+        """Reading i as (unix seconds, temperature, humidity, pressure)"""
+        temp, hum, press = struct.unpack_from("<hHH", self.fixed, i * 6)
+        return self.times[i], temp / 100, hum / 100, press / 10
+
+    def clear(self):
+        self.count = 0
+        self.started = None
+
+    def encode_json(self, derive=None, names=()):
+        """Columnar JSON: one array per field
+
+        derive(temperature, humidity, pressure) returns one value per name,
+        in tenths, each added as a column.
+        """
+        n = self.count
+        ts = []
+        temps = []
+        hums = []
+        presses = []
+        extra = [[] for _ in names] if derive is not None else []
+        for i in range(n):
+            t, temp, hum, press = self.reading(i)
+            ts.append(str(t))
+            temps.append("{:.2f}".format(temp))
+            hums.append("{:.2f}".format(hum))
+            presses.append("{:.1f}".format(press))
+            if extra:
+                values = derive(temp, hum, press)
+                for j in range(len(extra)):
+                    extra[j].append(_tenths(values[j]))
+        columns = "".join(',"{}":[{}]'.format(names[j], ",".join(extra[j])) for j in range(len(extra)))
+        return '{{"v":{},"ts":[{}],"temperature":[{}],"humidity":[{}],"pressure":[{}]{}}}'.format(
+            VERSION, ",".join(ts), ",".join(temps), ",".join(hums), ",".join(presses), columns)
+
+    def encode_binary(self):
+        """Packed binary batch, returned as a view of a reusable buffer"""
+        n = self.count
+        base = self.times[0] if n else 0
+        struct.pack_into(BATCH_HEADER, self.binary, 0, VERSION, BATCH_FLAGS, n, base)
+        offset = BATCH_HEADER_SIZE
+        for i in range(n):
+            temp, hum, press = struct.unpack_from("<hHH", self.fixed, i * 6)
+            struct.pack_into(BATCH_RECORD, self.binary, offset,
+                             self.times[i] - base, temp, hum, press)
+            offset += BATCH_RECORD_SIZE
+        return memoryview(self.binary)[:offset]
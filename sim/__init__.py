@@ -0,0 +1,2 @@
+# Host-side simulation support for the weather station firmware.
+# Nothing in this package is deployed to the device.
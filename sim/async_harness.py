@@ -0,0 +1,138 @@
+# Run the async runtime on CPython against a local broker.
+#
+#     python -m sim.async_harness
+#
+# The broker is taken down part-way through the run. The report shows that
+# rendering and sampling keep their cadence during the outage while the MQTT
+# session backs off, recovers and resumes its stored subscriptions.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, os.path.join(HERE, 'modules'))
+
+from async_runtime import AsyncRuntime, asyncio
+from clock import ticks_ms, ticks_diff
+from sim.broker import LoopbackBroker
+from umqtt.simple import MQTTClient
+from mqtt_session import MQTTSession
+
+
+class Status:
+    DISCONNECTED = 0
+    CONNECTING = 1
+    CONNECTED = 2
+    FAILED = 3
+    NO_WIFI = 4
+
+
+TIMING = {
+    'intervals': {'wifi': 1000, 'mqtt_poll': 50, 'sample': 200, 'ui': 100, 'rgb': 100},
+    'timeouts': {'wifi': 2000, 'mqtt': 500, 'backoff_min': 100, 'backoff_max': 800},
+}
+
+
+class Station:
+    """Just enough station state to drive the runtime hooks"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.status = {'wifi': Status.DISCONNECTED, 'env': Status.CONNECTED,
+                       'mqtt': Status.DISCONNECTED}
+        self.session = None
+        self.wifi_up_at = None
+        self.samples = 0
+        self.render_gaps = []
+        self.last_render = None
+        self.messages = []
+
+    def wifi_begin(self):
+        # Association completes 300 ms after it is started
+        self.wifi_up_at = ticks_ms() + 300
+
+    def wifi_connected(self):
+        return self.wifi_up_at is not None and ticks_diff(ticks_ms(), self.wifi_up_at) >= 0
+
+    def mqtt_connect(self):
+        if self.session is None:
+            self.session = MQTTSession(
+                lambda keepalive: MQTTClient("harness", "127.0.0.1", self.broker.port, keepalive=keepalive),
+                ("weather/data",),
+                lambda t, m: self.messages.append((t, m)),
+                keepalive_s=1, ping_timeout_ms=300)
+        return self.session.connect()
+
+    def mqtt_poll(self):
+        return self.session.poll()
+
+    def sample(self):
+        self.samples += 1
+        if self.status['mqtt'] == Status.CONNECTED:
+            if not self.session.publish(b"weather/sensor_data", b'{"temperature":21.5}'):
+                self.status['mqtt'] = Status.FAILED
+
+    def render(self):
+        now = ticks_ms()
+        if self.last_render is not None:
+            self.render_gaps.append(ticks_diff(now, self.last_render))
+        self.last_render = now
+
+    def set_status(self, name, value):
+        self.status[name] = value
+
+    def hooks(self):
+        return {
+            'wifi_begin': self.wifi_begin,
+            'wifi_connected': self.wifi_connected,
+            'mqtt_connect': self.mqtt_connect,
+            'mqtt_poll': self.mqtt_poll,
+            'ntp_sync': lambda: True,
+            'sample': self.sample,
+            'render': self.render,
+            'rgb': lambda: None,
+            'set_status': self.set_status,
+        }
+
+
+async def outage(broker, start_ms, length_ms):
+    await asyncio.sleep(start_ms / 1000)
+    print("broker down")
+    broker.down()
+    await asyncio.sleep(length_ms / 1000)
+    print("broker up")
+    broker.up()
+
+
+def main(duration_ms=5000):
+    broker = LoopbackBroker().start()
+    station = Station(broker)
+    runtime = AsyncRuntime(station.hooks(), station.status, Status, TIMING,
+                           "127.0.0.1", broker.port)
+
+    async def run():
+        asyncio.create_task(outage(broker, 1500, 2000))
+        asyncio.create_task(_publish_weather(broker))
+        await runtime.main(duration_ms)
+
+    asyncio.run(run())
+    broker.close()
+
+    gaps = sorted(station.render_gaps)
+    print("renders: {}  max gap: {} ms  p50 gap: {} ms".format(
+        len(gaps) + 1, gaps[-1], gaps[len(gaps) // 2]))
+    print("samples: {}".format(station.samples))
+    print("runtime: {}".format(runtime.stats))
+    print("session: {}".format(station.session.stats))
+    print("broker: {}".format(broker.stats))
+    print("weather/data received: {}".format(len(station.messages)))
+    return station, runtime
+
+
+async def _publish_weather(broker):
+    await asyncio.sleep(1)
+    broker.publish("weather/data", '{"current_temp": 17.6}')
+
+
+if __name__ == '__main__':
+    main()
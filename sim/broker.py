@@ -0,0 +1,256 @@
+# Minimal local MQTT 3.1.1 broker for host runs.
+# Supports CONNECT (clean and persistent sessions), SUBSCRIBE, PUBLISH at
+# QoS 0/1 with retained messages, PINGREQ and DISCONNECT - enough to exercise
+# the firmware's connection handling against real sockets. The broker runs
+# on its own event loop thread so blocking clients in the caller's thread
+# can talk to it.
+import asyncio
+import threading
+from contextlib import contextmanager
+
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def encode_str(s):
+    if isinstance(s, str):
+        s = s.encode()
+    return len(s).to_bytes(2, 'big') + s
+
+
+def topic_matches(pattern, topic):
+    pat = pattern.split('/')
+    parts = topic.split('/')
+    for i, p in enumerate(pat):
+        if p == '#':
+            return True
+        if i >= len(parts) or (p != '+' and p != parts[i]):
+            return False
+    return len(pat) == len(parts)
+
+
+class Session:
+    def __init__(self, client_id, clean):
+        self.client_id = client_id
+        self.clean = clean
+        self.subscriptions = set()
+        self.writer = None
+
+
+class LoopbackBroker:
+    """MQTT broker bound to localhost, controlled from the calling thread"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.sessions = {}
+        self.retained = {}
+        self.received = []
+        self.stats = {'connects': 0, 'subscribes': 0, 'publishes': 0,
+                      'pings': 0, 'bytes_in': 0, 'bytes_out': 0}
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    # Thread control
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        self.up()
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def up(self):
+        """Start accepting connections"""
+        self._call(self._listen())
+
+    def down(self):
+        """Stop listening and drop every client, as if the broker died"""
+        self._call(self._shutdown())
+
+    def close(self):
+        self.down()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    @contextmanager
+    def held(self):
+        """Block the broker's event loop for the duration of the with block.
+
+        Clients can still write into their sockets, the broker just does not
+        read them until the block ends. Keeps the broker thread's allocations
+        out of host-side memory measurements.
+        """
+        release = threading.Event()
+        holding = threading.Event()
+
+        def hold():
+            holding.set()
+            release.wait()
+
+        self._loop.call_soon_threadsafe(hold)
+        holding.wait()
+        try:
+            yield self
+        finally:
+            release.set()
+
+    def publish(self, topic, payload, retain=False):
+        """Publish from the server side, e.g. a weather/data update"""
+        self._call(self._route(topic, payload, retain))
+
+    async def _listen(self):
+        if self._server is None:
+            self._server = await asyncio.start_server(self._client, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _shutdown(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for session in self.sessions.values():
+            if session.writer is not None:
+                session.writer.close()
+                session.writer = None
+
+    # Protocol
+
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        length = 0
+        shift = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        body = await reader.readexactly(length) if length else b''
+        self.stats['bytes_in'] += 2 + length
+        return header[0], body
+
+    def _send(self, writer, data):
+        self.stats['bytes_out'] += len(data)
+        writer.write(data)
+
+    async def _client(self, reader, writer):
+        session = None
+        try:
+            while True:
+                op, body = await self._read_packet(reader)
+                kind = op & 0xF0
+                if kind == 0x10:
+                    session = self._connect(body, writer)
+                elif kind == 0x80:
+                    await self._subscribe(session, body, writer)
+                elif kind == 0x30:
+                    await self._publish(op, body, writer)
+                elif kind == 0xC0:
+                    self.stats['pings'] += 1
+                    self._send(writer, b'\xd0\x00')
+                elif kind == 0xE0:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            if session is not None and session.writer is writer:
+                session.writer = None
+                if session.clean:
+                    self.sessions.pop(session.client_id, None)
+            writer.close()
+
+    def _connect(self, body, writer):
+        self.stats['connects'] += 1
+        name_len = int.from_bytes(body[0:2], 'big')
+        pos = 2 + name_len + 1
+        flags = body[pos]
+        pos += 3  # flags and keepalive
+        id_len = int.from_bytes(body[pos:pos + 2], 'big')
+        client_id = body[pos + 2:pos + 2 + id_len].decode()
+        clean = bool(flags & 0x02)
+        present = not clean and client_id in self.sessions
+        if clean or not present:
+            old = self.sessions.get(client_id)
+            if old is not None and old.writer is not None:
+                old.writer.close()
+            session = Session(client_id, clean)
+            self.sessions[client_id] = session
+        else:
+            session = self.sessions[client_id]
+            if session.writer is not None and session.writer is not writer:
+                session.writer.close()
+        session.writer = writer
+        self._send(writer, bytes((0x20, 0x02, 1 if present else 0, 0)))
+        return session
+
+    async def _subscribe(self, session, body, writer):
+        self.stats['subscribes'] += 1
+        pid = body[0:2]
+        pos = 2
+        granted = bytearray()
+        topics = []
+        while pos < len(body):
+            n = int.from_bytes(body[pos:pos + 2], 'big')
+            topic = body[pos + 2:pos + 2 + n].decode()
+            qos = body[pos + 2 + n]
+            pos += 3 + n
+            session.subscriptions.add(topic)
+            topics.append(topic)
+            granted.append(min(qos, 1))
+        self._send(writer, bytes((0x90, 2 + len(granted))) + pid + granted)
+        for topic, payload in list(self.retained.items()):
+            if any(topic_matches(t, topic) for t in topics):
+                self._send(writer, self._publish_packet(topic, payload, True))
+
+    async def _publish(self, op, body, writer):
+        self.stats['publishes'] += 1
+        n = int.from_bytes(body[0:2], 'big')
+        topic = body[2:2 + n].decode()
+        pos = 2 + n
+        qos = (op >> 1) & 0x03
+        if qos:
+            pid = body[pos:pos + 2]
+            pos += 2
+            self._send(writer, b'\x40\x02' + pid)
+        payload = body[pos:]
+        self.received.append((topic, payload))
+        await self._route(topic, payload, bool(op & 0x01))
+
+    def _publish_packet(self, topic, payload, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        body = encode_str(topic) + payload
+        return bytes((0x30 | (1 if retain else 0),)) + encode_length(len(body)) + body
+
+    async def _route(self, topic, payload, retain):
+        if retain:
+            self.retained[topic] = payload
+        packet = self._publish_packet(topic, payload)
+        for session in self.sessions.values():
+            if session.writer is None:
+                continue
+            if any(topic_matches(t, topic) for t in session.subscriptions):
+                self._send(session.writer, packet)
+                await session.writer.drain()
@@ -0,0 +1,58 @@
+# Scripted ENV III unit for simulated runs.
+# Readings follow a trace of (ms, temperature, humidity, pressure) points on
+# the virtual clock, linearly interpolated between points. Traces can be
+# loaded from the CSV format used by tools/replay_filter.py.
+import csv
+
+
+def load_csv(path):
+    """Load a recorded trace (epoch s, temperature, humidity, pressure)"""
+    points = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            try:
+                points.append(tuple(float(v) for v in row[:4]))
+            except (ValueError, IndexError):
+                continue
+    if not points:
+        return points
+    start = points[0][0]
+    return [((t - start) * 1000, temp, hum, press) for t, temp, hum, press in points]
+
+
+class Env3:
+    """Stand-in for unit.get(unit.ENV3, unit.PORTA)"""
+
+    def __init__(self, clock, trace=None):
+        self.clock = clock
+        self.trace = trace or [(0, 21.5, 45.0, 1013.2)]
+        self.connected = True
+        self.reads = 0
+        self._index = 0
+
+    def _value(self, channel):
+        if not self.connected:
+            raise OSError("ENV III not responding")
+        self.reads += 1
+        now = self.clock.now_ms
+        trace = self.trace
+        while self._index + 1 < len(trace) and trace[self._index + 1][0] <= now:
+            self._index += 1
+        point = trace[self._index]
+        if self._index + 1 >= len(trace) or now <= point[0]:
+            return point[channel]
+        nxt = trace[self._index + 1]
+        ratio = (now - point[0]) / (nxt[0] - point[0])
+        return point[channel] + (nxt[channel] - point[channel]) * ratio
+
+    @property
+    def temperature(self):
+        return self._value(1)
+
+    @property
+    def humidity(self):
+        return self._value(2)
+
+    @property
+    def pressure(self):
+        return self._value(3)
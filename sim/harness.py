@@ -0,0 +1,310 @@
+# Simulated M5GO for running the unmodified firmware on CPython.
+#
+#     sim = Simulation(duration_ms=60000)
+#     sim.press(5000, 'A')
+#     sim.publish(2000, 'weather/data', open('sample_weather_data.json').read())
+#     station = sim.run()       # globals of main.py once the run ends
+#     print(sim.report())
+#
+# The stand-in modules in sim/modules (m5stack, m5ui, uiflow, wifiCfg, unit,
+# umqtt.simple, ntptime, machine, ...) all talk to the active Simulation;
+# MQTT and the NTP probe go to loopback servers over real sockets.
+# Time is virtual: it only advances when the firmware calls wait_ms(), so a
+# run is deterministic and much faster than real time.
+import heapq
+import os
+import socket
+import sys
+import time
+import tracemalloc
+
+from sim.broker import LoopbackBroker
+from sim.env import Env3
+from sim.lcd import Lcd
+from sim.vclock import VirtualClock
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(SIM_DIR)
+MODULES = os.path.join(SIM_DIR, 'modules')
+
+# The active simulation, used by the stand-in modules
+current = None
+
+
+class SimulationEnd(BaseException):
+    """Raised from wait_ms() when the run is over.
+
+    A BaseException so the firmware's bare except clauses cannot swallow
+    it, which they could with an Exception.
+    """
+
+
+class Button:
+    def __init__(self, name):
+        self.name = name
+        self.on_press = None
+        self.on_double = None
+
+    def wasPressed(self, callback=None):
+        self.on_press = callback
+
+    def wasDoublePress(self, callback=None):
+        self.on_double = callback
+
+    def press(self):
+        if self.on_press is not None:
+            self.on_press()
+
+    def double_press(self):
+        if self.on_double is not None:
+            self.on_double()
+
+
+class Wlan:
+    """Station interface behind wifiCfg.wlan_sta"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.available = True
+        self.associated = False
+        self.associate_ms = 300
+        self._ready_at = None
+
+    def active(self, flag=None):
+        return True
+
+    def connect(self, ssid=None, password=None):
+        self._ready_at = self.clock.now_ms + self.associate_ms
+
+    def disconnect(self):
+        self.associated = False
+        self._ready_at = None
+
+    def isconnected(self):
+        if (not self.associated and self.available and self._ready_at is not None
+                and self.clock.now_ms >= self._ready_at):
+            self.associated = True
+        return self.associated and self.available
+
+
+class NtpResponder:
+    """Loopback UDP server answering the firmware's NTP probes.
+
+    Served from wait_ms() rather than a thread, so a query sent before a
+    wait has its reply waiting when the firmware next looks.
+    """
+
+    def __init__(self, wlan):
+        self.wlan = wlan
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.queries = 0
+
+    def serve(self):
+        while True:
+            try:
+                query, addr = self.sock.recvfrom(48)
+            except OSError:
+                return
+            self.queries += 1
+            if self.wlan.isconnected():
+                self.sock.sendto(bytes(48), addr)
+
+    def close(self):
+        self.sock.close()
+
+
+class Rgb:
+    def __init__(self):
+        self.color = 0
+        self.brightness = 0
+        self.updates = 0
+
+    def setColorFrom(self, start, end, color):
+        self.color = color
+        self.updates += 1
+
+    def setColorAll(self, color):
+        self.color = color
+        self.updates += 1
+
+    def setBrightness(self, brightness):
+        self.brightness = brightness
+        self.updates += 1
+
+
+class Simulation:
+    def __init__(self, duration_ms=60000, trace=None, start_epoch=None,
+                 start_ticks=0, broker=True, root=None):
+        self.duration_ms = duration_ms
+        self.root = root
+        self.clock = VirtualClock(start_epoch, start_ticks)
+        self.lcd = Lcd()
+        self.buttons = {'A': Button('A'), 'B': Button('B'), 'C': Button('C')}
+        self.env = Env3(self.clock, trace)
+        self.wlan = Wlan(self.clock)
+        self.rgb = Rgb()
+        self.use_broker = broker
+        self.broker = None
+        self.ntp = None
+        self.events = []
+        self._seq = 0
+        self.wakeups = 0
+        self.busy_us = []
+        self.sleep_ms = 0
+        self.light_sleep_ms = 0
+        self._last_wake = None
+        self.alloc = {}
+
+    # Scripting
+
+    def at(self, ms, fn):
+        """Run fn when the virtual clock reaches ms"""
+        self._seq += 1
+        heapq.heappush(self.events, (ms, self._seq, fn))
+
+    def press(self, ms, button, double=False):
+        btn = self.buttons[button]
+        self.at(ms, btn.double_press if double else btn.press)
+
+    def publish(self, ms, topic, payload, retain=False):
+        def send():
+            self.broker.publish(topic, payload, retain)
+            # Give the broker thread a moment to deliver it
+            time.sleep(0.05)
+
+        self.at(ms, send)
+
+    def broker_outage(self, start_ms, end_ms):
+        self.at(start_ms, lambda: self.broker.down())
+        self.at(end_ms, lambda: self.broker.up())
+
+    def wifi_outage(self, start_ms, end_ms):
+        def down():
+            self.wlan.available = False
+            self.wlan.associated = False
+
+        def up():
+            self.wlan.available = True
+
+        self.at(start_ms, down)
+        self.at(end_ms, up)
+
+    def sensor_outage(self, start_ms, end_ms):
+        self.at(start_ms, lambda: setattr(self.env, 'connected', False))
+        self.at(end_ms, lambda: setattr(self.env, 'connected', True))
+
+    # Running
+
+    def install(self):
+        """Make the stand-in modules and the virtual clock importable"""
+        global current
+        current = self
+        for path in (ROOT, MODULES):
+            if path in sys.path:
+                sys.path.remove(path)
+            sys.path.insert(0, path)
+        # Firmware modules must be imported fresh against this simulation
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, '__file__', None) or ''
+            if path.startswith(MODULES) or os.path.dirname(path) == ROOT:
+                del sys.modules[name]
+        self.clock.install()
+        if self.use_broker:
+            if self.broker is None:
+                self.broker = LoopbackBroker().start()
+            import umqtt.simple
+            umqtt.simple.SERVER_OVERRIDE = ('127.0.0.1', self.broker.port)
+        # The NTP probe talks UDP, so point it at the loopback responder
+        if self.ntp is None:
+            self.ntp = NtpResponder(self.wlan)
+        import state
+        state.config['ntp_server'] = '127.0.0.1'
+        state.config['ntp_port'] = self.ntp.port
+
+    def wait_ms(self, ms):
+        """Called by uiflow.wait_ms(): advance virtual time and run events"""
+        now = time.perf_counter()
+        if self._last_wake is not None:
+            self.busy_us.append(int((now - self._last_wake) * 1000000))
+        self.wakeups += 1
+        self.sleep_ms += ms
+        if self.ntp is not None:
+            self.ntp.serve()
+        target = self.clock.now_ms + ms
+        while self.events and self.events[0][0] <= target:
+            when, _, fn = heapq.heappop(self.events)
+            if when > self.clock.now_ms:
+                self.clock.advance_ms(when - self.clock.now_ms)
+            fn()
+        if target > self.clock.now_ms:
+            self.clock.advance_ms(target - self.clock.now_ms)
+        if self.clock.now_ms >= self.duration_ms:
+            raise SimulationEnd()
+        self._last_wake = time.perf_counter()
+
+    def light_sleep(self, ms):
+        """Called by machine.lightsleep(): a wait the CPU spends asleep"""
+        self.light_sleep_ms += ms
+        self.wait_ms(ms)
+
+    def run(self, path=None):
+        """Run main.py until the duration elapses, return its globals.
+
+        Relative paths the firmware opens (icons, buffer files) resolve
+        against root, the simulated flash, when one is given.
+        """
+        path = path or os.path.join(ROOT, 'main.py')
+        if self.root:
+            self._cwd = os.getcwd()
+            os.chdir(self.root)
+        self.install()
+        with open(path) as f:
+            code = compile(f.read(), path, 'exec')
+        station = {'__name__': '__main__', '__file__': path}
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        try:
+            exec(code, station)
+        except SimulationEnd:
+            pass
+        finally:
+            current_mem, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.alloc = {'peak_bytes': peak, 'live_bytes': current_mem,
+                          'blocks_delta': sys.getallocatedblocks() - blocks}
+        return station
+
+    _cwd = None
+
+    def close(self):
+        if self._cwd is not None:
+            os.chdir(self._cwd)
+            self._cwd = None
+        if self.broker is not None:
+            self.broker.close()
+            self.broker = None
+        if self.ntp is not None:
+            self.ntp.close()
+            self.ntp = None
+
+    def report(self):
+        busy = sorted(self.busy_us) or [0]
+        return {
+            'virtual_ms': self.clock.now_ms,
+            'wakeups': self.wakeups,
+            'busy_us_p50': busy[len(busy) // 2],
+            'busy_us_p95': busy[min(len(busy) - 1, int(len(busy) * 0.95))],
+            'busy_us_max': busy[-1],
+            'busy_us_total': sum(busy),
+            'duty_cycle': sum(busy) / 1000 / max(1, self.clock.now_ms),
+            'light_sleep_ms': self.light_sleep_ms,
+            'lcd': dict(self.lcd.stats, draw_calls=self.lcd.draw_calls, brightness=self.lcd.brightness),
+            'env_reads': self.env.reads,
+            'rgb_updates': self.rgb.updates,
+            'alloc': self.alloc,
+            'broker': dict(self.broker.stats) if self.broker else None,
+            'ntp_queries': self.ntp.queries if self.ntp else 0,
+        }
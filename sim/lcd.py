@@ -0,0 +1,100 @@
+# Framebuffer-recording LCD for simulated runs.
+# Every draw is counted by kind and by pixels touched, so redraw cost can be
+# compared between firmware versions. Filled areas are kept in an RGB565
+# framebuffer and text in a label map, which can be inspected after a run.
+from array import array
+
+WIDTH = 320
+HEIGHT = 240
+CHAR_WIDTH = 10
+FONT_HEIGHT = 18
+
+
+def rgb565(color):
+    return ((color >> 8) & 0xF800) | ((color >> 5) & 0x07E0) | ((color >> 3) & 0x001F)
+
+
+class Lcd:
+    FONT_Default = 0
+    FONT_DejaVu18 = 18
+    FONT_DejaVu24 = 24
+    FONT_DejaVu40 = 40
+    FONT_Ubuntu = 1
+    FONT_Comic = 2
+
+    def __init__(self):
+        self.framebuffer = array('H', [0]) * (WIDTH * HEIGHT)
+        self.texts = {}
+        self.images = {}
+        self.brightness = 100
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'clear': 0, 'fill': 0, 'text': 0, 'image': 0, 'pixels': 0, 'backlight': 0}
+
+    @property
+    def draw_calls(self):
+        return self.stats['clear'] + self.stats['fill'] + self.stats['text'] + self.stats['image']
+
+    def _fill(self, x, y, w, h, color):
+        x0 = max(0, x)
+        y0 = max(0, y)
+        x1 = min(WIDTH, x + w)
+        y1 = min(HEIGHT, y + h)
+        if x1 <= x0 or y1 <= y0:
+            return 0
+        value = rgb565(color)
+        row = array('H', [value]) * (x1 - x0)
+        for yy in range(y0, y1):
+            start = yy * WIDTH + x0
+            self.framebuffer[start:start + (x1 - x0)] = row
+        # Anything under the filled area is gone
+        for key in [k for k in self.texts if x0 <= k[0] < x1 and y0 <= k[1] < y1]:
+            del self.texts[key]
+        return (x1 - x0) * (y1 - y0)
+
+    def setBrightness(self, brightness):
+        self.brightness = brightness
+        self.stats['backlight'] += 1
+
+    def clear(self, color=0):
+        self.stats['clear'] += 1
+        self.texts.clear()
+        self.images.clear()
+        self.stats['pixels'] += self._fill(0, 0, WIDTH, HEIGHT, color)
+
+    def fill_rect(self, x, y, w, h, color):
+        self.stats['fill'] += 1
+        self.stats['pixels'] += self._fill(x, y, w, h, color)
+
+    def rect(self, x, y, w, h, color, fillcolor=None):
+        """UIFlow lcd.rect(): filled when fillcolor is given"""
+        self.fill_rect(x, y, w, h, color if fillcolor is None else fillcolor)
+
+    def text(self, x, y, text, color):
+        self.stats['text'] += 1
+        self.stats['pixels'] += len(text) * CHAR_WIDTH * FONT_HEIGHT
+        self.texts[(x, y)] = (text, color)
+
+    def image(self, x, y, path, width=32, height=32):
+        self.stats['image'] += 1
+        self.stats['pixels'] += width * height
+        self.images[(x, y)] = path
+
+    def pixel(self, x, y):
+        return self.framebuffer[y * WIDTH + x]
+
+    def screen_text(self):
+        """Text currently on screen, top to bottom"""
+        return [self.texts[k][0] for k in sorted(self.texts, key=lambda k: (k[1], k[0]))]
+
+    def save_ppm(self, path):
+        """Write the filled areas of the framebuffer as a PPM image"""
+        with open(path, 'wb') as f:
+            f.write("P6 {} {} 255\n".format(WIDTH, HEIGHT).encode())
+            out = bytearray(WIDTH * HEIGHT * 3)
+            for i, v in enumerate(self.framebuffer):
+                out[i * 3] = (v >> 8) & 0xF8
+                out[i * 3 + 1] = (v >> 3) & 0xFC
+                out[i * 3 + 2] = (v << 3) & 0xF8
+            f.write(out)
@@ -0,0 +1,7 @@
+# Simulated m5stack module: LCD and the three front buttons
+from sim import harness
+
+lcd = harness.current.lcd
+btnA = harness.current.buttons['A']
+btnB = harness.current.buttons['B']
+btnC = harness.current.buttons['C']
@@ -0,0 +1,52 @@
+# Simulated m5ui widgets drawing onto the recording LCD
+from sim import harness
+
+_lcd = harness.current.lcd
+rgb = harness.current.rgb
+
+
+def setScreenColor(color):
+    _lcd.clear(color)
+
+
+class M5TextBox:
+    def __init__(self, x, y, text, font, color, rotate=0):
+        self.x = x
+        self.y = y
+        self.text = text
+        self.font = font
+        self.color = color
+        _lcd.text(x, y, text, color)
+
+    def setText(self, text):
+        self.text = text
+        _lcd.text(self.x, self.y, text, self.color)
+
+    def setColor(self, color):
+        self.color = color
+        _lcd.text(self.x, self.y, self.text, color)
+
+
+class M5Rect:
+    def __init__(self, x, y, w, h, color, border_color):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        _lcd.fill_rect(x, y, w, h, color)
+
+    def setBgColor(self, color):
+        _lcd.fill_rect(self.x, self.y, self.w, self.h, color)
+
+
+class M5Img:
+    def __init__(self, x, y, path, visible=True):
+        self.x = x
+        self.y = y
+        self.path = path
+        if visible:
+            _lcd.image(x, y, path)
+
+    def changeImg(self, path):
+        self.path = path
+        _lcd.image(self.x, self.y, path)
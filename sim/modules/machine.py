@@ -0,0 +1,34 @@
+# Simulated machine module
+import time
+
+from sim import harness
+
+_UNIQUE_ID = b'\x24\x0a\xc4\x5e\x1f\x30'
+
+
+PWRON_RESET = 1
+DEEPSLEEP_RESET = 4
+TIMER_WAKE = 4
+EXT0_WAKE = 2
+
+
+def unique_id():
+    return _UNIQUE_ID
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+def wake_reason():
+    return 0
+
+
+def lightsleep(ms=None):
+    harness.current.light_sleep(ms or 0)
+
+
+class RTC:
+    def datetime(self, value=None):
+        t = time.gmtime(time.time())
+        return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
@@ -0,0 +1,22 @@
+# Simulated ntptime module reading the virtual wall clock
+import time
+
+from sim import harness
+
+
+class client:
+    def __init__(self, host='pool.ntp.org', timezone=0):
+        if not harness.current.wlan.isconnected():
+            raise OSError("no network")
+        self.timezone = timezone
+
+    def _local(self):
+        return time.gmtime(time.time() + self.timezone * 3600)
+
+    def formatDate(self, sep='-'):
+        t = self._local()
+        return "{:04d}{}{:02d}{}{:02d}".format(t[0], sep, t[1], sep, t[2])
+
+    def formatTime(self, sep=':'):
+        t = self._local()
+        return "{:02d}{}{:02d}{}{:02d}".format(t[3], sep, t[4], sep, t[5])
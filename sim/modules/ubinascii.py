@@ -0,0 +1,2 @@
+# MicroPython ubinascii on top of binascii
+from binascii import hexlify, unhexlify, a2b_base64, b2a_base64
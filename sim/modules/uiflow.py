@@ -0,0 +1,10 @@
+# Simulated uiflow module: waiting advances the virtual clock
+from sim import harness
+
+
+def wait_ms(ms):
+    harness.current.wait_ms(ms)
+
+
+def wait(s):
+    harness.current.wait_ms(int(s * 1000))
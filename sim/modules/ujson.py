@@ -0,0 +1,2 @@
+# MicroPython ujson on top of json
+from json import dumps, loads, dump, load
@@ -0,0 +1,11 @@
+# Simulated unit module, only the ENV III on port A is wired up
+from sim import harness
+
+ENV3 = 'ENV3'
+PORTA = (32, 33)
+
+
+def get(kind, port):
+    if kind != ENV3 or not harness.current.env.connected:
+        raise OSError("unit not found")
+    return harness.current.env
@@ -0,0 +1,11 @@
+# Simulated wifiCfg module
+from sim import harness
+
+wlan_sta = harness.current.wlan
+
+
+def doConnect(ssid, password):
+    # The real call blocks until associated or timed out
+    wlan_sta.connect(ssid, password)
+    harness.current.wait_ms(wlan_sta.associate_ms)
+    return wlan_sta.isconnected()
@@ -0,0 +1,88 @@
+# Run the unmodified main.py on CPython against simulated hardware.
+#
+#     python -m sim.run --duration 600000 --trace trace.csv \
+#         --press A@5000 --press C@9000 --publish weather/data=sample_weather_data.json@3000
+#
+# Prints the loop, display, sensor, broker and allocation figures for the run.
+# Add --screen to dump what is on the LCD at the end, --ppm to save it.
+import argparse
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from sim.env import load_csv
+from sim.harness import ROOT, Simulation
+
+
+def parse_event(value):
+    """Split 'WHAT@MS' into (WHAT, ms)"""
+    what, _, ms = value.rpartition('@')
+    if not what:
+        raise argparse.ArgumentTypeError("expected VALUE@MS, got {}".format(value))
+    return what, int(ms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run main.py against simulated M5GO hardware")
+    parser.add_argument('--duration', type=int, default=120000, help="virtual run time in ms")
+    parser.add_argument('--trace', help="sensor trace CSV (epoch, temperature, humidity, pressure)")
+    parser.add_argument('--press', type=parse_event, action='append', default=[],
+                        help="button press, e.g. A@5000 (C2@5000 for a double press)")
+    parser.add_argument('--publish', type=parse_event, action='append', default=[],
+                        help="publish a file to a topic, e.g. weather/data=FILE@3000")
+    parser.add_argument('--broker-outage', type=parse_event, action='append', default=[],
+                        help="take the broker down, e.g. 30000@40000 for 30 s to 40 s")
+    parser.add_argument('--root', help="directory standing in for the device flash")
+    parser.add_argument('--screen', action='store_true', help="print the text on screen at the end")
+    parser.add_argument('--ppm', help="save the final framebuffer to a PPM file")
+    parser.add_argument('--quiet', action='store_true', help="hide the firmware's console output")
+    args = parser.parse_args(argv)
+    if args.ppm:
+        args.ppm = os.path.abspath(args.ppm)
+
+    trace = load_csv(args.trace) if args.trace else None
+    sim = Simulation(duration_ms=args.duration, trace=trace, root=args.root)
+    for button, ms in args.press:
+        sim.press(ms, button[0].upper(), double=button.endswith('2'))
+    if not args.publish:
+        sample = os.path.join(ROOT, 'sample_weather_data.json')
+        args.publish.append(('weather/data=' + sample, 2000))
+    for spec, ms in args.publish:
+        topic, _, path = spec.partition('=')
+        with open(path, 'rb') as f:
+            sim.publish(ms, topic, f.read())
+    for start, end in args.broker_outage:
+        sim.broker_outage(int(start), end)
+
+    stdout = sys.stdout
+    if args.quiet:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        sim.run()
+    finally:
+        if args.quiet:
+            sys.stdout.close()
+            sys.stdout = stdout
+        report = sim.report()
+        sim.close()
+
+    # The firmware modules main.py loaded stay in sys.modules after the run
+    screens = sys.modules.get('screens')
+    state = sys.modules.get('state')
+    report['widgets'] = dict(screens.widget_stats) if screens else {}
+    report['boot'] = dict((phase, state.boot[phase]) for phase in state.boot_order) if state else {}
+    report['store'] = dict(state.store.stats) if state else {}
+    rules = state.device['rules'] if state else None
+    report['rules'] = dict(rules.stats) if rules is not None else {}
+    print(json.dumps(report, indent=2))
+    if args.screen:
+        print("\n".join(sim.lcd.screen_text()))
+    if args.ppm:
+        sim.lcd.save_ppm(args.ppm)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# Virtual clock for simulated runs.
+# Replaces the MicroPython tick functions and time.time() so main.py sees a
+# deterministic clock that only advances when the firmware sleeps.
+import time
+
+# MicroPython ticks wrap at 2**30 on the ESP32
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+
+
+class VirtualClock:
+    def __init__(self, start_epoch=None, start_ticks=0):
+        self.start_epoch = int(time.time() if start_epoch is None else start_epoch)
+        self.start_ticks = start_ticks
+        self.elapsed_us = 0
+
+    @property
+    def now_ms(self):
+        """Virtual milliseconds since the start of the run"""
+        return self.elapsed_us // 1000
+
+    def advance_ms(self, ms):
+        self.elapsed_us += int(ms * 1000)
+
+    def ticks_ms(self):
+        return (self.start_ticks + self.elapsed_us // 1000) & TICKS_MAX
+
+    def ticks_us(self):
+        return (self.start_ticks * 1000 + self.elapsed_us) & TICKS_MAX
+
+    @staticmethod
+    def ticks_diff(end, start):
+        return ((end - start + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+    @staticmethod
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & TICKS_MAX
+
+    def sleep_ms(self, ms):
+        self.advance_ms(ms)
+
+    def time(self):
+        return self.start_epoch + self.elapsed_us // 1000000
+
+    def install(self):
+        """Patch the time module the way MicroPython provides it"""
+        time.ticks_ms = self.ticks_ms
+        time.ticks_us = self.ticks_us
+        time.ticks_diff = self.ticks_diff
+        time.ticks_add = self.ticks_add
+        time.sleep_ms = self.sleep_ms
+        time.time = self.time
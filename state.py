@@ -0,0 +1,273 @@
+# Shared station state.
+# Configuration, connection status, the latest readings and the data behind
+# every screen live in module-level dicts here, so the firmware modules can
+# share them without importing each other. Nothing in this module touches
+# hardware, which keeps it cheap to import first at boot.
+import time
+from clock import ticks_ms, ticks_diff
+from observable import Store
+
+# Boot phases, recorded by mark_boot() as ticks_ms() - milliseconds since
+# reset on the ESP32 port - so the report includes the firmware start-up
+# before main.py ran
+boot = {}
+boot_order = []
+
+# RTC time when this boot started: no reading taken since carries an older
+# stamp, even from a clock that is not set yet
+boot_time = time.time()
+
+def mark_boot(phase):
+    """Record when a boot phase is first reached and print it"""
+    if phase in boot:
+        return
+    now = ticks_ms()
+    last = boot[boot_order[-1]] if boot_order else now
+    boot[phase] = now
+    boot_order.append(phase)
+    print("Boot: {} at {} ms (+{} ms)".format(phase, now, ticks_diff(now, last)))
+
+# Status enum
+class Status:
+    DISCONNECTED = 0
+    CONNECTING = 1
+    CONNECTED = 2
+    FAILED = 3
+    NO_WIFI = 4
+
+# Status strings (optimized)
+STATUS_STRINGS = ("Disc", "Conn", "OK", "Fail", "NoWiFi")
+
+def status_to_string(status):
+    return STATUS_STRINGS[status] if 0 <= status < len(STATUS_STRINGS) else "Unknown"
+
+# Screen navigation configuration
+screen_navigation = {
+    "status": {"A": "home", "B": "home", "C": "home"},
+    "home": {"A": "forecast", "B": "history", "C": "settings"},
+    "forecast": {"A": "home", "B": "history", "C": "settings"},
+    "history": {"A": "home", "B": "forecast", "C": "settings"},
+    "settings": {"A": "home", "B": "forecast", "C": "history"},
+    "alert": {"A": "", "B": "home", "C": ""}
+}
+
+# Screen currently shown, changed only by screens.navigate_to_screen()
+ui = {
+    'screen': "status"
+}
+
+# Consolidated global objects
+device = {
+    'env3_0': None,
+    'ntp': None,
+    'rtc': None,
+    'wifi_started': None,  # ticks_ms() of the last association attempt
+    'mqtt_session': None,
+    'ntp_sync': None,
+    'send_buffer': None,
+    'batch': None,
+    'timeseries': None,
+    'report_filter': None,
+    'sampler': None,
+    'rate_control': None,
+    'derived': None,
+    'rules': None,
+    'weather_parser': None,
+    'icons': None,
+    'resources': None,
+    'text_cache': None,
+    'heap': None,
+    'profiler': None,
+    'scheduler': None,
+    'backlight': None,
+    'radio': None,
+    'rtc_log': None,
+    'weather_alert': None
+}
+
+# Connection configuration
+config = {
+    'wifi_ssid': "lightsaber",
+    'wifi_password': "skywalker",
+    'mqtt_server': "192.168.137.1",
+    'mqtt_client_id': None,  # None derives a unique id from the chip id
+    'mqtt_keepalive': 60,  # seconds
+    'mqtt_topics_path': "mqtt_topics.txt",  # topics held in the broker's session
+    'ntp_server': "de.pool.ntp.org",
+    'ntp_port': 123,
+    'timezone': 2,  # hours ahead of UTC; NTP sets the RTC to this local time
+    'temperature_unit': "C",
+    # Store-and-forward buffer for readings taken while MQTT is down
+    'buffer_path': "/sd/sensor_buffer.bin",  # None keeps the buffer in RAM only
+    'buffer_ram_records': 64,
+    'buffer_file_records': 8640,
+    'buffer_drain_batch': 10,  # readings sent per drain tick
+    # Batched publishing - 0 publishes every reading as its own message
+    'publish_batch': 0,  # readings per message
+    'publish_batch_ms': 60000,  # publish a partial batch after this long
+    'publish_format': "json",  # batch payload: "json" (columnar) or "binary"
+    'sensor_format': "json",  # single reading payload: "json" or "binary" (10 bytes)
+    # Sampling filter - sliding median of N samples, then an optional EMA
+    'sample_median': 3,
+    'sample_ema': 0.0,  # EMA smoothing factor, 0 disables
+    # Reporting filter per channel (temperature, humidity, pressure); 0 disables
+    'report_deadband': (0.5, 1.0, 1.0),  # absolute change needed to publish
+    'report_deadband_pct': (0, 0, 0),  # change in percent of the last published value
+    'report_swing': (0, 0, 0),  # swinging-door compression deviation
+    'report_min_interval': 0,  # seconds between publishes at most
+    'report_max_silence': 0,  # heartbeat publish after this many seconds (set by the adaptive rate when on)
+    # Adaptive rate - sample faster and shorten the heartbeat while readings
+    # change fast, back off exponentially while they are steady
+    'adaptive_rate': True,
+    'rate_sample_ms': (1000, 10000),  # fastest and slowest sample period
+    'rate_heartbeat': (60, 900),  # shortest and longest heartbeat, seconds
+    'rate_limit': (2.0, 10.0, 1.0),  # change per hour that counts as fast (°C, %, hPa)
+    'rate_noise': (0.3, 2.0, 0.3),  # standard deviation that counts as unsettled
+    'rate_tau': 300,  # seconds the rate and variance are averaged over
+    'rate_backoff': 10,  # calm samples before each doubling
+    # On-device time series - raw samples, 1-minute and 1-hour rollups
+    'history_raw_slots': 360,
+    'history_raw_interval': 10,  # seconds between raw samples
+    'history_minute_slots': 240,
+    'history_hour_slots': 168,
+    # Derived metrics - dew point, absolute humidity, heat index, sea-level
+    # pressure and the 3-hour pressure tendency, shown on Home and added to
+    # JSON publishes
+    'derived_metrics': True,
+    'altitude_m': 0,  # station altitude for the sea-level pressure, 0 publishes station pressure
+    # Local alert rules, loaded over weather/rules and kept on flash
+    'rules_path': "rules.json",
+    # Pre-decoded icons built by tools/build_icons.py, LRU cached up to a byte budget.
+    # Read from the resource bundle when there is one, from icon_dir otherwise.
+    'resource_bundle': "res.bin",
+    'icon_dir': "res/w32",
+    'icon_cache_bytes': 8192,
+    # Heap and GC instrumentation, published on weather/diag
+    'diagnostics': True,
+    'diag_probe': True,  # measure the largest free block for every report
+    'diag_crash_path': "diag_crash.json",  # MemoryError snapshot kept across a reset
+    'gc_threshold_pct': 25,  # heap allocated between automatic collections, % of free
+    'gc_threshold_min': 4096,
+    'gc_low_water': 16384,  # screen changes only collect below this many free bytes
+    # Section timing profiler, switched at runtime over weather/profile
+    'profile': False,  # profile from boot
+    'profile_window': 32,  # durations kept per section for p50/p95
+    # Low-power mode (scheduler runtime): "normal" keeps everything powered,
+    # "light" publishes in bursts and light-sleeps with the screen off,
+    # "deep" deep-sleeps between samples and boots fully only to publish
+    'power_mode': "normal",
+    'power_burst': 30,  # buffered readings that start a publish burst
+    'power_linger_s': 10,  # radio kept up after a burst for incoming messages
+    'power_burst_timeout_s': 60,  # give up on a burst that cannot connect
+    'power_sample_s': 300,  # deep mode: sleep between samples
+    'power_rtc_records': 200,  # deep mode: readings kept in RTC memory (2 KB)
+    'power_wake_pin': 39,  # button A wakes the station from sleep
+    'backlight_levels': (80, 20),  # percent, normal and dimmed
+    'backlight_dim_s': 30,  # idle seconds before dimming, 0 never dims
+    'backlight_off_s': 120,  # idle seconds before switching off, 0 never
+    'runtime': "scheduler"  # or "async" for the uasyncio runtime
+}
+
+# Consolidated status tracking
+status = {
+    'wifi': Status.DISCONNECTED,
+    'env': Status.DISCONNECTED,
+    'mqtt': Status.DISCONNECTED
+}
+
+# Consolidated sensor data
+sensor = {
+    'temp': None,
+    'hum': None,
+    'press': None
+}
+
+# Metrics derived from the sensor values, as ints in tenths (0.1 C, 0.1 g/m3,
+# 0.1 hPa); None until known
+derived = {
+    'dew_point': None,
+    'abs_humidity': None,
+    'heat_index': None,
+    'sea_level': None,
+    'tendency': None  # pressure change over the last 3 hours
+}
+
+# Consolidated weather data
+weather = {
+    'temp': 0.0,
+    'condition': "",
+    'icon': "unknown.png",
+    'description': "",
+    'wind': ""
+}
+
+# Consolidated timing - task periods and jitter budgets for the scheduler (ms)
+timing = {
+    'intervals': {
+        'wifi': 60000,  # connection check, and retry delay after a failed association
+        'wifi_poll': 250,  # association progress while connecting
+        'env': 60000,
+        'mqtt': 1000,
+        'mqtt_poll': 200,
+        'sample': 1000,
+        'ui': 500,
+        'rgb': 100,
+        'drain': 1000,
+        'batch': 1000,
+        'ntp': 500,  # probe step until the first sync succeeds; retries back off
+        'diag': 300000,
+        'power': 1000
+    },
+    'jitter': {
+        'wifi': 100,
+        'env': 1000,
+        'mqtt': 200,
+        'mqtt_poll': 50,
+        'sample': 20,
+        'ui': 100,
+        'rgb': 30,
+        'drain': 200,
+        'batch': 500,
+        'ntp': 100,
+        'diag': 5000,
+        'power': 200
+    },
+    # Network step timeouts and retry backoff
+    'timeouts': {
+        'wifi': 10000,
+        'mqtt': 3000,
+        'ntp': 3000,  # wait for the server's reply to a probe
+        'backoff_min': 1000,
+        'backoff_max': 60000
+    }
+}
+
+# Change notifications for the dicts the screens display. Write watched keys
+# with store.set() so the screens showing them are redrawn on the next frame.
+store = Store({'status': status, 'sensor': sensor, 'derived': derived, 'weather': weather, 'config': config})
+
+# Compact forecast data structure - array of tuples
+forecast_data = [None] * 5  # (day, date, temp, humidity, icon)
+history_data = [None] * 5   # (day, date, temp, humidity %)
+
+# History screen scale, rebuilt by update_history_scale() only when new
+# history arrives. Ranges are (min, max, flat) where flat means every day had
+# the same value; bars holds (temp height, humidity height, temp color,
+# humidity color) per column so drawing the screen computes nothing.
+HISTORY_BAR_HEIGHT = 66
+history_scale = {
+    'temp': (10, 40, False),
+    'humidity': (0, 100, False),
+    'bars': [None] * 5
+}
+
+def get_heap_monitor():
+    if device['heap'] is None:
+        from heap_monitor import HeapMonitor
+        device['heap'] = HeapMonitor(
+            config['gc_threshold_pct'],
+            config['gc_threshold_min'],
+            config['gc_low_water'],
+            config['diag_crash_path']
+        )
+    return device['heap']
@@ -0,0 +1,406 @@
+# Sampling and publishing of the ENV III readings.
+# The sampling stage filters each reading, records it in the local time
+# series and passes what the reporting filter lets through on to MQTT, either
+# one message per reading or in batches. Readings taken while MQTT is down
+# go to the store-and-forward buffer and are drained once it is back.
+import time
+from clock import ticks_ms, ticks_diff
+from state import Status, device, config, status, derived, timing, store, mark_boot
+from connection import set_status, radio_wanted, raise_alert, get_rule_engine, clock_set
+from screens import get_backlight, update_backlight, wake_screen
+from uiflow import wait_ms
+
+# Single JSON readings, built with one format() call each. The derived
+# members follow derived.METRICS; their values are ints in tenths, written
+# as sign, whole and tenth digits so no float is boxed per publish.
+READING_JSON = '{{"timestamp":"{}","temperature":{},"humidity":{},"pressure":{}}}'
+DERIVED_JSON = ('{{"timestamp":"{}","temperature":{},"humidity":{},"pressure":{},'
+                '"dew_point":{}{}.{},"abs_humidity":{}.{},"heat_index":{}{}.{},"sea_level_pressure":{}.{}'
+                '{}{}{}{}}}')
+TENDENCY = ',"pressure_tendency":'
+
+def reading_json(epoch, temperature, humidity, pressure, tendency=None):
+    timestamp = format_timestamp(epoch)
+    if not config['derived_metrics']:
+        return READING_JSON.format(timestamp, temperature, humidity, pressure)
+    from derived import DEW_POINT, ABS_HUMIDITY, HEAT_INDEX, SEA_LEVEL
+    values = get_derived().metrics(temperature, humidity, pressure)
+    dew = values[DEW_POINT]
+    heat = values[HEAT_INDEX]
+    # Humidity and sea-level pressure are never negative; the tendency is
+    # left out (empty fields) for buffered readings
+    if tendency is None:
+        tendency_key = tendency_sign = tendency_value = tendency_tenth = ""
+    else:
+        tendency_key = TENDENCY
+        tendency_sign = "-" if tendency < 0 else ""
+        tendency = -tendency if tendency < 0 else tendency
+        tendency_value = tendency // 10
+        tendency_tenth = ".{}".format(tendency % 10)
+    return DERIVED_JSON.format(
+        timestamp, temperature, humidity, pressure,
+        "-" if dew < 0 else "", abs(dew) // 10, abs(dew) % 10,
+        values[ABS_HUMIDITY] // 10, values[ABS_HUMIDITY] % 10,
+        "-" if heat < 0 else "", abs(heat) // 10, abs(heat) % 10,
+        values[SEA_LEVEL] // 10, values[SEA_LEVEL] % 10,
+        tendency_key, tendency_sign, tendency_value, tendency_tenth)
+
+def publish_reading(epoch, temperature, humidity, pressure, tendency=None):
+    """Publish one reading; tendency only for live ones, the buffered are old"""
+    try:
+        if config['sensor_format'] == "binary":
+            from sensor_payload import encode_reading
+            message = encode_reading(epoch, temperature, humidity, pressure, utc_offset())
+        else:
+            message = reading_json(epoch, temperature, humidity, pressure, tendency)
+        topic = b"weather/sensor_data"
+        
+        if not device['mqtt_session'].publish(topic, message):
+            set_status('mqtt', Status.FAILED)
+            return False
+        mark_boot('first_publish')
+        return True
+    except Exception as e:
+        print("Failed to send MQTT data")
+        return False
+
+def get_send_buffer():
+    if device['send_buffer'] is None:
+        from record_buffer import RecordBuffer
+        device['send_buffer'] = RecordBuffer(
+            config['buffer_ram_records'],
+            config['buffer_path'],
+            config['buffer_file_records'],
+            # Scratch for file records, big enough for a whole batch
+            max(config['buffer_drain_batch'], config['publish_batch'])
+        )
+    return device['send_buffer']
+
+def buffer_reading(epoch, temperature, humidity, pressure):
+    """Keep a reading for later instead of losing it"""
+    get_send_buffer().append(epoch, temperature, humidity, pressure)
+
+def get_batch():
+    if device['batch'] is None:
+        from sensor_payload import Batch
+        device['batch'] = Batch(config['publish_batch'], utc_offset())
+    return device['batch']
+
+def publish_batch():
+    """Publish the collected readings as one message"""
+    batch = device['batch']
+    if batch is None or not batch.count:
+        return True
+    if device['mqtt_session'] is not None and status['mqtt'] == Status.CONNECTED:
+        if config['publish_format'] == "binary":
+            payload = batch.encode_binary()
+        elif config['derived_metrics']:
+            from derived import METRICS
+            payload = batch.encode_json(get_derived().metrics, METRICS)
+        else:
+            payload = batch.encode_json()
+        if device['mqtt_session'].publish(b"weather/sensor_data", payload):
+            print("Sent MQTT batch of {} readings".format(batch.count))
+            mark_boot('first_publish')
+            batch.clear()
+            return True
+        set_status('mqtt', Status.FAILED)
+    
+    # Hand the readings over to the store-and-forward buffer
+    from sensor_payload import from_unix
+    buffer = get_send_buffer()
+    for i in range(batch.count):
+        seconds, temperature, humidity, pressure = batch.reading(i)
+        buffer.append(from_unix(seconds, batch.utc_offset), temperature, humidity, pressure)
+    print("MQTT not connected, buffering batch")
+    batch.clear()
+    return False
+
+def flush_batch():
+    """Publish a partial batch once it is publish_batch_ms old"""
+    batch = device['batch']
+    if batch is not None and batch.count and ticks_diff(ticks_ms(), batch.started) >= config['publish_batch_ms']:
+        publish_batch()
+
+def send_mqtt_data(epoch, temperature, humidity, pressure):
+    if not clock_set():
+        # Held until NTP sets the clock, which restamps the buffer
+        buffer_reading(epoch, temperature, humidity, pressure)
+        return False
+    
+    if config['publish_batch']:
+        batch = get_batch()
+        if not batch.fits(epoch):
+            # Too far from the first reading for one batch: send it as is
+            publish_batch()
+        if batch.add(epoch, temperature, humidity, pressure, ticks_ms()):
+            return publish_batch()
+        return True
+    
+    if device['mqtt_session'] is None or status['mqtt'] != Status.CONNECTED:
+        print("MQTT not connected, buffering data")
+        buffer_reading(epoch, temperature, humidity, pressure)
+        return False
+    
+    if not publish_reading(epoch, temperature, humidity, pressure, derived['tendency']):
+        buffer_reading(epoch, temperature, humidity, pressure)
+        return False
+    print("Sent MQTT data")
+    return True
+
+def drain_send_buffer():
+    """Publish buffered readings in rate-limited batches once MQTT is back"""
+    if status['mqtt'] != Status.CONNECTED or not clock_set():
+        return
+    # Opening the buffer also picks up records spilled before a reboot
+    buffer = get_send_buffer()
+    if not len(buffer):
+        return
+    if config['publish_batch']:
+        # Forward the backlog as full batches while no live batch is pending
+        batch = get_batch()
+        if batch.count:
+            return
+
+        def add(epoch, temperature, humidity, pressure):
+            # A reading too far from the first is left for the next batch
+            if not batch.fits(epoch):
+                return False
+            batch.add(epoch, temperature, humidity, pressure, ticks_ms())
+            return True
+
+        # One drain stops at the end of the file records, so the RAM ones
+        # can still be needed to fill the batch
+        sent = 0
+        while batch.count < batch.size and len(buffer):
+            n = buffer.drain(add, batch.size - batch.count)
+            if not n:
+                break
+            sent += n
+        publish_batch()
+    else:
+        sent = buffer.drain(publish_reading, config['buffer_drain_batch'])
+    if sent:
+        print("Sent {} buffered readings, {} left".format(sent, len(buffer)))
+
+def utc_offset():
+    """Seconds the RTC runs ahead of UTC"""
+    return int(config['timezone'] * 3600)
+
+def format_timestamp(epoch):
+    """Format seconds from time.time() (RTC local time) as ISO 8601 with
+    the UTC offset, so it names the same instant as the Unix seconds in
+    batches and binary payloads"""
+    year, month, day, hour, minute, second = time.localtime(epoch)[:6]
+    offset = utc_offset()
+    return "{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}{}{:02d}:{:02d}".format(
+        year, month, day, hour, minute, second,
+        "-" if offset < 0 else "+", abs(offset) // 3600, abs(offset) % 3600 // 60)
+
+def log_env_data(epoch, temperature, humidity, pressure):
+    try:
+        send_mqtt_data(epoch, temperature, humidity, pressure)
+    except:
+        pass
+
+def get_report_filter():
+    if device['report_filter'] is None:
+        from report_filter import ReportFilter
+        device['report_filter'] = ReportFilter(
+            config['report_deadband'],
+            config['report_deadband_pct'],
+            config['report_swing'],
+            config['report_min_interval'],
+            config['report_max_silence']
+        )
+    return device['report_filter']
+
+def get_timeseries():
+    if device['timeseries'] is None:
+        from timeseries import TimeSeries
+        device['timeseries'] = TimeSeries(
+            config['history_raw_slots'],
+            config['history_raw_interval'],
+            config['history_minute_slots'],
+            config['history_hour_slots']
+        )
+    return device['timeseries']
+
+def get_sampler():
+    if device['sampler'] is None:
+        from sampler import Sampler
+        device['sampler'] = Sampler(config['sample_median'], config['sample_ema'])
+    return device['sampler']
+
+def get_rate_controller():
+    if device['rate_control'] is None:
+        from rate_control import RateController
+        device['rate_control'] = RateController(
+            config['rate_sample_ms'],
+            config['rate_heartbeat'],
+            config['rate_limit'],
+            config['rate_noise'],
+            config['rate_tau'],
+            config['rate_backoff']
+        )
+        get_report_filter().max_silence = device['rate_control'].heartbeat()
+    return device['rate_control']
+
+def adapt_rate(epoch, values):
+    """Retune the sample period and the reporting heartbeat to the signal"""
+    control = get_rate_controller()
+    if not control.update(epoch, values):
+        return
+    period = control.period()
+    timing['intervals']['sample'] = period
+    if device['scheduler'] is not None:
+        device['scheduler'].set_period('sample', period)
+    get_report_filter().max_silence = control.heartbeat()
+    print("Sampling every {} ms, heartbeat {} s".format(period, control.heartbeat()))
+
+def get_derived():
+    if device['derived'] is None:
+        from derived import Derived
+        device['derived'] = Derived(config['altitude_m'])
+    return device['derived']
+
+def pressure_tendency(pressure):
+    """Change since 3 hours ago of a fixed-point pressure (0.1 hPa), None
+    without that history"""
+    from timeseries import PRESSURE
+    series = get_timeseries()
+    if series.minutes.slots > 180:
+        then = series.minutes.fixed_mean(180, PRESSURE)
+    else:
+        then = series.hours.fixed_mean(3, PRESSURE)
+    return None if then is None else pressure - then
+
+def set_derived(fixed):
+    """Derived metrics (in tenths) of the time series' fixed-point sample for
+    the Home screen; None while the sensor is gone"""
+    if fixed is None or not config['derived_metrics']:
+        for key in derived:
+            store.set('derived', key, None)
+        return
+    from derived import DEW_POINT, ABS_HUMIDITY, HEAT_INDEX, SEA_LEVEL
+    from timeseries import PRESSURE
+    values = get_derived().update(fixed)
+    store.set('derived', 'dew_point', values[DEW_POINT])
+    store.set('derived', 'abs_humidity', values[ABS_HUMIDITY])
+    store.set('derived', 'heat_index', values[HEAT_INDEX])
+    store.set('derived', 'sea_level', values[SEA_LEVEL])
+    store.set('derived', 'tendency', pressure_tendency(fixed[PRESSURE]))
+
+def check_rules(epoch):
+    """Raise a local alert as soon as a rule trips, one sample after the change"""
+    engine = get_rule_engine()
+    rule = engine.update(epoch)
+    if rule < 0:
+        return
+    # A more severe alert already on screen stays there
+    current = device['weather_alert']
+    if current is not None:
+        from rules import severity
+        if severity(current.get("level", "info")) > engine.level[rule]:
+            return
+    raise_alert(engine.alert(rule, format_timestamp(epoch)))
+
+def set_reading(temp, humidity, pressure):
+    """Current values shown on the Home screen; None while the sensor is gone"""
+    store.set('sensor', 'temp', temp)
+    store.set('sensor', 'hum', humidity)
+    store.set('sensor', 'press', pressure)
+
+def sample_sensors():
+    """Sampling stage, run at the 'sample' task cadence"""
+    if device['env3_0'] is None:
+        set_reading(None, None, None)
+        set_derived(None)
+        return
+    try:
+        reading = get_sampler().sample(device['env3_0'], time.time())
+    except:
+        # The unit is gone; the env task looks for it again
+        set_reading(None, None, None)
+        set_derived(None)
+        device['env3_0'] = None
+        get_sampler().reset()
+        return
+    epoch = reading.epoch
+    temp = reading.temperature
+    humidity = reading.humidity
+    pressure = reading.pressure
+    
+    values = (temp, humidity, pressure)
+    if config['adaptive_rate']:
+        adapt_rate(epoch, values)
+    
+    # The filter compares against the last published values and may
+    # report the previous reading when compression is enabled
+    report = get_report_filter().update(epoch, values)
+    if report is not None:
+        report_epoch, values = report
+        log_env_data(report_epoch, values[0], values[1], values[2])
+    
+    # Update current values
+    set_reading(temp, humidity, pressure)
+    mark_boot('first_reading')
+    # Not sensor failures: an error here is logged and the unit stays online
+    try:
+        get_timeseries().add(epoch, temp, humidity, pressure)
+        set_derived(get_timeseries().fixed)
+    except Exception as e:
+        print("History update failed: {}".format(e))
+    try:
+        check_rules(epoch)
+    except Exception as e:
+        print("Alert rules failed: {}".format(e))
+
+def get_rtc_log():
+    if device['rtc_log'] is None:
+        import machine
+        from power import RtcLog
+        device['rtc_log'] = RtcLog(machine.RTC(), config['power_rtc_records'])
+    return device['rtc_log']
+
+def restore_rtc_log():
+    """Move the readings logged during deep sleep into the send buffer"""
+    log = get_rtc_log()
+    if not len(log):
+        return
+    buffer = get_send_buffer()
+    for i in range(len(log)):
+        buffer.append(*log.reading(i))
+    print("Restored {} readings from RTC memory".format(len(log)))
+    log.clear()
+
+def enter_deep_sleep():
+    """Keep the unsent readings held in RAM in RTC memory and deep-sleep
+    until the next sample"""
+    from power import deep_sleep
+    log = get_rtc_log()
+    buffer = device['send_buffer']
+    if buffer is not None and buffer.count:
+        # Only the RAM ring is lost in deep sleep; records spilled to the SD
+        # file stay there, older than these, and are sent first after waking
+        buffer.drain_ram(lambda *reading: log.append(*reading) or True, buffer.count)
+    log.save()
+    get_backlight().show(0)
+    print("Deep sleep with {} readings logged".format(len(log)))
+    deep_sleep(config)
+
+def check_power():
+    """Power task: backlight timeout, and in deep mode the way back to sleep"""
+    screen_off = update_backlight()
+    if config['power_mode'] == "deep" and screen_off and not radio_wanted():
+        enter_deep_sleep()
+
+def power_sleep(ms):
+    """Scheduler sleep: light sleep while the screen and the radio are off"""
+    if config['power_mode'] == "normal" or not update_backlight() or status['wifi'] != Status.DISCONNECTED:
+        wait_ms(ms)
+        return
+    import machine
+    machine.lightsleep(ms)
+    if machine.wake_reason() == machine.EXT0_WAKE:
+        wake_screen()
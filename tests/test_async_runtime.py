@@ -0,0 +1,142 @@
+# Run the async runtime against the loopback broker through an outage.
+#
+#     python -m pytest tests
+#
+# WiFi, the broker and the NTP server are all down for a stretch of the run.
+# Rendering has to keep its cadence throughout; afterwards MQTT reconnects,
+# subscribes again to a broker that lost its sessions, and NTP syncs once
+# its server answers. The run takes a few seconds of real time.
+import os
+import socket
+import sys
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from sim.async_harness import Station, Status
+from async_runtime import AsyncRuntime, asyncio
+from clock import ticks_ms, ticks_diff
+from sim.broker import LoopbackBroker
+
+TIMING = {
+    'intervals': {'wifi': 500, 'mqtt_poll': 50, 'sample': 200, 'ui': 100, 'rgb': 100},
+    'timeouts': {'wifi': 2000, 'mqtt': 300, 'ntp': 200, 'backoff_min': 100, 'backoff_max': 800},
+}
+OUTAGE_START = 1000
+OUTAGE_END = 2500
+DURATION = 4500
+
+
+class NtpServer:
+    """UDP responder on localhost that answers NTP queries while up"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.05)
+        self.port = self.sock.getsockname()[1]
+        self.up = False
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while self.running:
+            try:
+                query, addr = self.sock.recvfrom(48)
+            except OSError:
+                continue
+            if self.up:
+                self.sock.sendto(bytes(48), addr)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+class OutageStation(Station):
+    """Harness station whose WiFi can be taken away"""
+
+    def __init__(self, broker, start):
+        super().__init__(broker)
+        self.start = start
+        self.wifi_down = False
+        self.renders = []
+        self.ntp_syncs = []
+
+    def elapsed(self):
+        return ticks_diff(ticks_ms(), self.start)
+
+    def wifi_connected(self):
+        return not self.wifi_down and super().wifi_connected()
+
+    def render(self):
+        super().render()
+        self.renders.append(self.elapsed())
+
+    def ntp_sync(self):
+        self.ntp_syncs.append(self.elapsed())
+        return True
+
+    def hooks(self):
+        hooks = super().hooks()
+        hooks['ntp_sync'] = self.ntp_sync
+        return hooks
+
+
+def run_outage():
+    broker = LoopbackBroker().start()
+    ntp = NtpServer()
+    station = OutageStation(broker, ticks_ms())
+    runtime = AsyncRuntime(station.hooks(), station.status, Status, TIMING,
+                           "127.0.0.1", broker.port, ntp_server="127.0.0.1", ntp_port=ntp.port)
+
+    async def outage():
+        await asyncio.sleep(OUTAGE_START / 1000)
+        broker.down()
+        # A broker restart without persistence: stored sessions are gone
+        broker.sessions.clear()
+        station.wifi_down = True
+        await asyncio.sleep((OUTAGE_END - OUTAGE_START) / 1000)
+        broker.up()
+        station.wifi_down = False
+        ntp.up = True
+        await asyncio.sleep(1)
+        broker.publish("weather/data", '{"current_temp": 17.6}')
+
+    async def run():
+        asyncio.create_task(outage())
+        await runtime.main(DURATION)
+
+    try:
+        asyncio.run(run())
+    finally:
+        broker.close()
+        ntp.close()
+    return station, runtime, broker
+
+
+def test_outage():
+    station, runtime, broker = run_outage()
+
+    # The UI keeps its 100 ms cadence while every network step is failing
+    during = [t for t in station.renders if OUTAGE_START - 200 <= t <= OUTAGE_END + 200]
+    gaps = [b - a for a, b in zip(during, during[1:])]
+    assert len(during) >= (OUTAGE_END - OUTAGE_START) // 100
+    assert max(gaps) < 300
+    assert station.samples >= DURATION // 200 - 2
+
+    # NTP is retried with backoff and syncs only once its server answers
+    assert runtime.stats['ntp_attempts'] >= 2
+    assert len(station.ntp_syncs) == 1
+    assert station.ntp_syncs[0] >= OUTAGE_END
+
+    # MQTT came back on its own and subscribed again to the fresh broker
+    session = station.session
+    assert station.status['mqtt'] == Status.CONNECTED
+    assert session.stats['connects'] >= 2
+    assert session.stats['subscribes'] == 2
+    assert broker.stats['subscribes'] == 2
+    assert (b"weather/data", b'{"current_temp": 17.6}') in station.messages
@@ -0,0 +1,132 @@
+# Step the scheduler runtime's NTP probe on a fake clock.
+#
+#     python -m pytest tests
+#
+# The server is a UDP socket on localhost that the test answers by hand, so
+# whether a reply is waiting at each step is under the test's control. The
+# blocking NTP client is stood in for by sync().
+import os
+import socket
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from ntp_sync import NtpSync
+
+
+class Server:
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(1)
+        self.port = self.sock.getsockname()[1]
+
+    def answer(self):
+        query, addr = self.sock.recvfrom(48)
+        self.sock.sendto(bytes(48), addr)
+        return query
+
+    def close(self):
+        self.sock.close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def make(server, clock, syncs, result=True):
+    def sync():
+        syncs.append(clock.now)
+        return result
+    return NtpSync('127.0.0.1', sync, port=server.port, timeout_ms=3000,
+                   backoff_min_ms=1000, backoff_max_ms=4000, clock=clock)
+
+
+def poll_reply(ntp, syncs):
+    """Poll until sync() has run; the fake clock stands still meanwhile"""
+    for _ in range(100):
+        ntp.poll()
+        if syncs:
+            return
+        time.sleep(0.01)
+
+
+def test_sync_runs_only_after_the_server_answers():
+    server = Server()
+    clock = Clock()
+    syncs = []
+    ntp = make(server, clock, syncs)
+    try:
+        assert not ntp.poll()
+        assert ntp.probing()
+        query = server.answer()
+        assert query[0] == 0x1b
+        assert syncs == []
+        clock.now = 500
+        poll_reply(ntp, syncs)
+        assert syncs == [500]
+        assert ntp.synced and not ntp.probing()
+        # Synced: no more queries
+        clock.now = 60000
+        assert ntp.poll()
+        assert ntp.stats['probes'] == 1
+    finally:
+        server.close()
+
+
+def test_unanswered_probes_back_off():
+    server = Server()
+    clock = Clock()
+    syncs = []
+    ntp = make(server, clock, syncs)
+    try:
+        sent = []
+        while clock.now < 30000:
+            probes = ntp.stats['probes']
+            ntp.poll()
+            if ntp.stats['probes'] > probes:
+                sent.append(clock.now)
+            clock.now += 500
+        # 3 s for the reply, then 1, 2, 4, 4 s until the next query
+        assert sent == [0, 4000, 9000, 16000, 23000]
+        assert ntp.stats['failures'] == 5
+        assert syncs == []
+    finally:
+        server.close()
+
+
+def test_failed_sync_is_retried_with_backoff():
+    server = Server()
+    clock = Clock()
+    syncs = []
+    ntp = make(server, clock, syncs, result=False)
+    try:
+        ntp.poll()
+        server.answer()
+        clock.now = 500
+        poll_reply(ntp, syncs)
+        assert syncs == [500]
+        assert not ntp.synced and not ntp.probing()
+        # Nothing goes out before the backoff delay is over
+        clock.now = 1499
+        ntp.poll()
+        assert ntp.stats['probes'] == 1
+        clock.now = 1500
+        ntp.poll()
+        assert ntp.stats['probes'] == 2
+    finally:
+        server.close()
+
+
+def test_unresolvable_host_fails_without_blocking():
+    clock = Clock()
+    ntp = NtpSync('ntp.invalid', lambda: True, clock=clock)
+    assert not ntp.poll()
+    assert not ntp.probing()
+    assert ntp.stats['failures'] == 1
@@ -0,0 +1,98 @@
+# Change notifications: Store.set(), the watcher queue and screen clears.
+#
+#     python -m pytest tests
+#
+# The last test loads screens.py against the simulated M5GO, so the watches
+# are the ones a real screen makes.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from observable import Store
+
+
+def make_store():
+    return Store({'status': {'wifi': 0, 'mqtt': 0}, 'sensor': {'temp': None}})
+
+
+def test_set_reports_and_counts_only_changes():
+    store = make_store()
+    assert store.set('status', 'wifi', 2)
+    assert store.data['status']['wifi'] == 2
+    assert not store.set('status', 'wifi', 2)
+    # Equal values are not a change either, whatever their identity
+    assert store.set('sensor', 'temp', "21.5")
+    assert not store.set('sensor', 'temp', "".join(["21", ".5"]))
+    # A key that was never there changes from None
+    assert store.set('sensor', 'hum', 40.0)
+    assert store.stats['changes'] == 3
+
+
+def test_watcher_runs_once_per_flush_however_many_keys_changed():
+    store = make_store()
+    runs = []
+    draw = lambda: runs.append(dict(store.data['status']))
+    store.watch("screen", draw, 'status', ('wifi', 'mqtt'))
+    # Watching the same keys again does not add a second entry
+    store.watch("screen", draw, 'status', ('wifi',))
+    store.set('status', 'wifi', 1)
+    store.set('status', 'mqtt', 1)
+    store.set('status', 'wifi', 2)
+    assert runs == []
+    assert store.flush() == 1
+    # It sees the values as of the flush, not of the first change
+    assert runs == [{'wifi': 2, 'mqtt': 1}]
+    assert store.flush() == 0
+    store.set('status', 'mqtt', 2)
+    assert store.flush() == 1
+    assert len(runs) == 2
+    assert store.stats['runs'] == 2
+
+
+def test_watchers_run_in_the_order_they_were_queued():
+    store = make_store()
+    runs = []
+    store.watch("screen", lambda: runs.append('status'), 'status', ('wifi',))
+    store.watch("led", lambda: runs.append('sensor'), 'sensor', ('temp',))
+    store.set('sensor', 'temp', 20.0)
+    store.set('status', 'wifi', 1)
+    store.flush()
+    assert runs == ['sensor', 'status']
+
+
+def test_unwatch_drops_the_owner_and_its_queued_calls():
+    store = make_store()
+    runs = []
+    store.watch("screen", lambda: runs.append('screen'), 'status', ('wifi',))
+    store.watch("led", lambda: runs.append('led'), 'status', ('wifi',))
+    store.set('status', 'wifi', 1)
+    store.unwatch("screen")
+    assert store.flush() == 1
+    assert runs == ['led']
+    store.set('status', 'wifi', 2)
+    store.flush()
+    assert runs == ['led', 'led']
+
+
+def test_clear_screen_drops_the_screen_watches():
+    from sim.harness import Simulation
+    sim = Simulation()
+    sim.install()
+    try:
+        import screens
+        from state import Status, store
+        screens.navigate_to_screen("settings")
+        assert store.watchers['status']['wifi']
+        assert store.watchers['config']['temperature_unit']
+        # A change queued for the old screen must not run after it is gone
+        store.set('status', 'wifi', Status.CONNECTED)
+        assert store.pending
+        screens.clear_screen()
+        assert store.pending == []
+        assert not any(watchers for keys in store.watchers.values() for watchers in keys.values())
+        store.set('status', 'mqtt', Status.CONNECTED)
+        assert store.flush() == 0
+    finally:
+        sim.close()
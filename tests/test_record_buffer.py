@@ -0,0 +1,126 @@
+# Store-and-forward buffer: RAM ring, spill to the ring file, drain order.
+#
+#     python -m pytest tests
+#
+# Readings are numbered by their timestamp, so every check is on which
+# readings survive and in what order they come back.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from record_buffer import RecordBuffer
+
+
+def fill(buffer, first, count):
+    for i in range(first, first + count):
+        buffer.append(i, 20.0 + i / 100, 50.0, 1000.0)
+
+
+def drain_all(buffer, limit=10):
+    out = []
+
+    def send(timestamp, temperature, humidity, pressure):
+        out.append(timestamp)
+        return True
+
+    while buffer.drain(send, limit):
+        pass
+    return out
+
+
+def test_ram_ring_wraps_and_keeps_the_newest():
+    buffer = RecordBuffer(4)
+    fill(buffer, 0, 3)
+    assert drain_all(buffer, 2) == [0, 1, 2]
+    # Head is now mid-ring, so these wrap around the end of the buffer
+    fill(buffer, 3, 4)
+    assert len(buffer) == 4
+    fill(buffer, 7, 2)
+    # Without a file the oldest readings are dropped
+    assert buffer.dropped == 2
+    assert drain_all(buffer) == [5, 6, 7, 8]
+    assert len(buffer) == 0
+
+
+def test_values_survive_the_round_trip():
+    buffer = RecordBuffer(4)
+    buffer.append(1700000000, -12.34, 56.78, 1013.2)
+    out = []
+    buffer.drain(lambda *reading: out.append(reading) or True, 1)
+    assert out == [(1700000000, -12.34, 56.78, 1013.2)]
+
+
+def test_full_ram_ring_spills_to_the_file(tmp_path):
+    buffer = RecordBuffer(4, str(tmp_path / "buffer.bin"), 100)
+    fill(buffer, 0, 10)
+    assert buffer.file.count == 8
+    assert buffer.count == 2
+    assert len(buffer) == 10
+    assert buffer.dropped == 0
+    # File records are older, so they come out first
+    assert drain_all(buffer, 3) == list(range(10))
+    assert len(buffer) == 0
+
+
+def test_oldest_dropped_when_ram_and_file_are_full(tmp_path):
+    buffer = RecordBuffer(4, str(tmp_path / "buffer.bin"), 8)
+    fill(buffer, 0, 20)
+    # The file holds the newest 8 of the 16 spilled, the RAM ring the last 4
+    assert len(buffer) == 12
+    assert drain_all(buffer) == list(range(8, 20))
+
+
+def test_drain_stops_at_a_failed_send_and_keeps_that_reading(tmp_path):
+    buffer = RecordBuffer(4, str(tmp_path / "buffer.bin"), 100)
+    fill(buffer, 0, 6)
+    sent = []
+
+    def send(timestamp, temperature, humidity, pressure):
+        if timestamp == 2:
+            return False
+        sent.append(timestamp)
+        return True
+
+    assert buffer.drain(send, 10) == 2
+    assert sent == [0, 1]
+    assert drain_all(buffer) == [2, 3, 4, 5]
+
+
+def test_drain_ram_leaves_the_file_records(tmp_path):
+    buffer = RecordBuffer(4, str(tmp_path / "buffer.bin"), 100)
+    fill(buffer, 0, 6)
+    out = []
+    assert buffer.drain_ram(lambda *reading: out.append(reading[0]) or True, 10) == 2
+    assert out == [4, 5]
+    assert drain_all(buffer) == [0, 1, 2, 3]
+
+
+def test_file_records_survive_a_reboot(tmp_path):
+    path = str(tmp_path / "buffer.bin")
+    buffer = RecordBuffer(4, path, 8)
+    fill(buffer, 0, 12)
+    sent = []
+    buffer.drain(lambda *reading: sent.append(reading[0]) or True, 3)
+    assert sent == [0, 1, 2]
+    # The RAM ring is lost with the reboot; the file resumes where it was
+    reopened = RecordBuffer(4, path, 8)
+    assert len(reopened) == 5
+    assert drain_all(reopened) == [3, 4, 5, 6, 7]
+
+
+def test_file_with_another_capacity_starts_empty(tmp_path):
+    path = str(tmp_path / "buffer.bin")
+    fill(RecordBuffer(4, path, 8), 0, 12)
+    assert len(RecordBuffer(4, path, 16)) == 0
+
+
+def test_restamp_shifts_only_this_boots_tail(tmp_path):
+    buffer = RecordBuffer(4, str(tmp_path / "buffer.bin"), 100)
+    # Stamped by a set clock before the reboot, then by the unset clock
+    for i in range(5):
+        buffer.append(1700000000 + i, 20.0, 50.0, 1000.0)
+    fill(buffer, 100, 7)
+    assert buffer.restamp(90, 110, 1800000000) == 7
+    assert drain_all(buffer) == [1700000000 + i for i in range(5)] + [1800000100 + i for i in range(7)]
@@ -0,0 +1,59 @@
+# Replay a recorded trace through the reporting filter.
+#
+#     python -m pytest tests
+#
+# data/front_trace.csv is an hour of 5 s readings: 20 quiet minutes, then a
+# front with falling temperature and pressure and rising humidity.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from report_filter import ReportFilter
+from tools.replay_filter import load_trace, replay, max_errors
+
+TRACE = os.path.join(HERE, 'data', 'front_trace.csv')
+QUIET_S = 20 * 60
+
+
+def test_deadband_suppresses_readings_inside_the_band():
+    trace = load_trace(TRACE)
+    band = (0.5, 1.0, 1.0)
+    report_filter = ReportFilter(band)
+    last = None
+    published = 0
+    for epoch, values in trace:
+        report = report_filter.update(epoch, values)
+        outside = last is None or any(abs(values[ch] - last[ch]) > band[ch] for ch in range(3))
+        assert (report is not None) == outside
+        if report is not None:
+            assert report == (epoch, values)
+            last = values
+            published += 1
+    # Only the first reading of the quiet stretch goes out
+    assert [e for e, v in replay(trace, ReportFilter(band)) if e < trace[0][0] + QUIET_S] == [trace[0][0]]
+    assert published < len(trace) / 10
+
+
+def test_swinging_door_reconstruction_error_is_bounded():
+    trace = load_trace(TRACE)
+    swing = (0.2, 1.0, 0.3)
+    reported = replay(trace, ReportFilter((0, 0, 0), swing=swing))
+    assert 2 < len(reported) < len(trace) / 20
+    # Readings after the last archived point are still inside an open door
+    archived = [(epoch, values) for epoch, values in trace if epoch <= reported[-1][0]]
+    # The archived points are real readings, so the line between two of them
+    # can sit up to one deviation off the door: the bound is twice the swing
+    for error, deviation in zip(max_errors(archived, reported), swing):
+        assert error <= 2 * deviation
+
+
+def test_heartbeat_after_max_silence():
+    trace = load_trace(TRACE)
+    start = trace[0][0]
+    reported = replay(trace, ReportFilter((0.5, 1.0, 1.0), max_silence=300))
+    epochs = [epoch for epoch, values in reported]
+    # Nothing crosses the deadband while it is quiet, so only heartbeats go out
+    assert [e - start for e in epochs if e < start + QUIET_S] == [0, 300, 600, 900]
+    assert max(b - a for a, b in zip(epochs, epochs[1:])) <= 300
@@ -0,0 +1,158 @@
+# Run the scheduler on a fake clock.
+#
+#     python -m pytest tests
+#
+# The clock only moves when the scheduler sleeps or a task says it took
+# time, so every deadline, wakeup and late figure is exact.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self, now=0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, ms):
+        self.sleeps.append(ms)
+        self.now += ms
+
+    def busy(self, ms):
+        """A task function that takes ms to run"""
+        def run():
+            self.now += ms
+        return run
+
+
+def run_until(scheduler, clock, end):
+    while clock.now < end:
+        scheduler.run_once()
+
+
+def recorder(clock, runs, cost=0):
+    def run():
+        runs.append(clock.now)
+        clock.now += cost
+    return run
+
+
+def test_cadence_stays_anchored_to_deadlines():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep)
+    runs = []
+    # 30 ms of work every 100 ms must not push the later runs back
+    scheduler.add('sample', recorder(clock, runs, cost=30), 100)
+    run_until(scheduler, clock, 1000)
+    assert runs == list(range(0, 1000, 100))
+    # The loop sleeps until the next deadline instead of spinning
+    assert clock.sleeps == [70] * len(clock.sleeps)
+
+
+def test_late_run_keeps_cadence_and_counts_an_overrun():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep)
+    runs = []
+    # Runs first in the wakeup at 90, which also picks up sample (due at 100)
+    scheduler.add('slow', clock.busy(40), 1000, delay_ms=90)
+    task = scheduler.add('sample', recorder(clock, runs), 100, jitter_ms=10)
+    run_until(scheduler, clock, 400)
+    # The slow task made sample 30 ms late once; the next run is back on 200
+    assert runs == [0, 130, 200, 300]
+    assert task.overruns == 1
+    assert task.max_late == 30
+    assert task.runs == 4
+
+
+def test_task_more_than_a_period_behind_is_rescheduled_from_now():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep)
+    runs = []
+    task = scheduler.add('sample', recorder(clock, runs), 100)
+    scheduler.add('stall', clock.busy(250), 10000, delay_ms=50)
+    run_until(scheduler, clock, 600)
+    # Missed deadlines are not replayed in a burst
+    assert runs == [0, 300, 400, 500]
+    assert task.max_late == 200
+
+
+def test_jitter_budget_coalesces_nearby_deadlines():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep)
+    sample = []
+    poll = []
+    scheduler.add('sample', recorder(clock, sample), 100)
+    # Due 20 ms after sample, within its 30 ms budget: served by the same wakeup
+    scheduler.add('poll', recorder(clock, poll), 100, jitter_ms=30, delay_ms=20)
+    run_until(scheduler, clock, 500)
+    assert sample == [0, 100, 200, 300, 400]
+    assert poll == sample
+    assert all(ms == 100 for ms in clock.sleeps)
+    # Early is not late
+    assert scheduler.get('poll').overruns == 0
+
+
+def test_deadline_outside_jitter_budget_gets_its_own_wakeup():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep)
+    poll = []
+    scheduler.add('sample', lambda: None, 100)
+    scheduler.add('poll', recorder(clock, poll), 100, jitter_ms=10, delay_ms=20)
+    run_until(scheduler, clock, 300)
+    assert poll == [20, 120, 220]
+
+
+def test_set_period_applies_from_the_next_run():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep)
+    runs = []
+    scheduler.add('sample', recorder(clock, runs), 1000)
+    run_until(scheduler, clock, 500)
+    # Longer: the run already due at 1000 stays, then every 3000
+    scheduler.set_period('sample', 3000)
+    run_until(scheduler, clock, 7500)
+    assert runs == [0, 1000, 4000, 7000]
+
+
+def test_shorter_period_pulls_the_next_run_in():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep, max_sleep_ms=10000)
+    runs = []
+    scheduler.add('sample', recorder(clock, runs), 10000)
+    scheduler.run_pending()
+    clock.sleep(500)
+    # A fast change must not wait out the old 10 s period
+    scheduler.set_period('sample', 1000)
+    run_until(scheduler, clock, 3600)
+    assert runs == [0, 1500, 2500, 3500]
+
+
+def test_time_to_next_is_capped_by_max_sleep():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep, max_sleep_ms=1000)
+    scheduler.add('diag', lambda: None, 60000, delay_ms=60000)
+    assert scheduler.time_to_next() == 1000
+    clock.now = 60000
+    assert scheduler.time_to_next() == 0
+
+
+def test_task_error_does_not_stop_the_loop():
+    clock = FakeClock()
+    scheduler = Scheduler(clock, clock.sleep)
+    runs = []
+
+    def broken():
+        raise ValueError("boom")
+
+    scheduler.add('broken', broken, 100)
+    scheduler.add('sample', recorder(clock, runs), 100)
+    run_until(scheduler, clock, 300)
+    assert runs == [0, 100, 200]
+    assert scheduler.get('broken').runs == 3
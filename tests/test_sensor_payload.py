@@ -0,0 +1,96 @@
+# Encode readings and batches and decode them with the reference decoder.
+#
+#     python -m pytest tests
+#
+# Whatever the station publishes, tools/sensor_decoder has to get back the
+# same UTC Unix seconds and the values at the payload's resolution.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import pytest
+
+from sensor_payload import Batch, BATCH_MAX_DELTA, encode_reading, from_unix
+from derived import Derived, METRICS
+from tools.sensor_decoder import decode
+
+START = 1751630400  # 2025-07-04T12:00:00Z
+OFFSET = 2 * 3600
+READINGS = [
+    (START, 21.5, 40.25, 1013.2),
+    (START + 60, -3.07, 99.99, 987.6),
+    (START + 125, 35.0, 0.0, 1050.0),
+]
+
+
+def rtc(seconds):
+    """The station's RTC time for Unix seconds"""
+    return from_unix(seconds, OFFSET)
+
+
+def fill(batch, readings):
+    for seconds, temperature, humidity, pressure in readings:
+        batch.add(rtc(seconds), temperature, humidity, pressure)
+
+
+def assert_readings(decoded, readings):
+    assert len(decoded) == len(readings)
+    for reading, (seconds, temperature, humidity, pressure) in zip(decoded, readings):
+        assert reading['timestamp'] == seconds
+        assert reading['temperature'] == pytest.approx(temperature, abs=0.005)
+        assert reading['humidity'] == pytest.approx(humidity, abs=0.005)
+        assert reading['pressure'] == pytest.approx(pressure, abs=0.05)
+
+
+def test_single_binary_reading_round_trip():
+    for reading in READINGS:
+        payload = encode_reading(rtc(reading[0]), *reading[1:], utc_offset=OFFSET)
+        assert_readings(decode(bytes(payload)), [reading])
+
+
+def test_json_batch_round_trip():
+    batch = Batch(4, OFFSET)
+    fill(batch, READINGS)
+    assert_readings(decode(batch.encode_json()), READINGS)
+
+
+def test_json_batch_carries_the_derived_columns():
+    batch = Batch(4, OFFSET)
+    fill(batch, READINGS)
+    decoded = decode(batch.encode_json(Derived().metrics, METRICS))
+    assert_readings(decoded, READINGS)
+    for name in METRICS:
+        assert all(isinstance(reading[name], float) for reading in decoded)
+
+
+def test_binary_batch_round_trip():
+    batch = Batch(4, OFFSET)
+    fill(batch, READINGS)
+    assert_readings(decode(bytes(batch.encode_binary())), READINGS)
+
+
+def test_reading_past_the_largest_delta_does_not_fit():
+    batch = Batch(4, OFFSET)
+    assert batch.fits(rtc(START))
+    batch.add(rtc(START), 20.0, 50.0, 1000.0)
+    assert batch.fits(rtc(START + BATCH_MAX_DELTA))
+    assert not batch.fits(rtc(START + BATCH_MAX_DELTA + 1))
+    # An older reading cannot be expressed as an unsigned delta either
+    assert not batch.fits(rtc(START - 1))
+
+
+def test_batch_spanning_a_day_is_split_and_decodes_exactly():
+    # Hourly readings over 24 h, as the drain forwards a long backlog
+    readings = [(START + h * 3600, 20.0 + h / 10, 50.0, 1000.0) for h in range(24)]
+    decoded = []
+    batch = Batch(len(readings), OFFSET)
+    for reading in readings:
+        if not batch.fits(rtc(reading[0])):
+            decoded += decode(bytes(batch.encode_binary()))
+            batch.clear()
+        batch.add(rtc(reading[0]), *reading[1:])
+    decoded += decode(bytes(batch.encode_binary()))
+    assert_readings(decoded, readings)
+
@@ -0,0 +1,191 @@
+# On-device time series for the ENV III readings.
+# Raw samples for the last hour plus 1-minute and 1-hour rollups with
+# min/max/mean/count, all kept in preallocated arrays. Appending a sample and
+# updating the open rollup buckets and the rolling window sums is O(1) and
+# allocation-free, so RAM use is fixed by the configured slot counts.
+from array import array
+
+TEMPERATURE = 0
+HUMIDITY = 1
+PRESSURE = 2
+CHANNELS = 3
+
+# Fixed-point scale per channel: 0.01 C, 0.01 %, 0.1 hPa
+SCALE = (100, 100, 10)
+
+
+def to_fixed(value, channel):
+    fixed = int(round(value * SCALE[channel]))
+    return -32768 if fixed < -32768 else (32767 if fixed > 32767 else fixed)
+
+
+class RawRing:
+    """Last slots samples taken every interval_s seconds, with rolling sums"""
+
+    def __init__(self, slots, interval_s):
+        self.slots = slots
+        self.interval = interval_s
+        self.values = array('h', [0]) * (slots * CHANNELS)
+        self.times = array('l', [0]) * slots
+        self.sums = [0] * CHANNELS
+        self.head = 0
+        self.count = 0
+        self.last = None
+
+    def add(self, epoch, fixed):
+        if self.last is not None and epoch - self.last < self.interval:
+            return False
+        self.last = epoch
+        slot = (self.head + self.count) % self.slots
+        base = slot * CHANNELS
+        if self.count == self.slots:
+            # Evict the oldest sample from the rolling sums
+            for ch in range(CHANNELS):
+                self.sums[ch] -= self.values[base + ch]
+            self.head = (self.head + 1) % self.slots
+        else:
+            self.count += 1
+        for ch in range(CHANNELS):
+            self.values[base + ch] = fixed[ch]
+            self.sums[ch] += fixed[ch]
+        self.times[slot] = epoch
+        return True
+
+    def mean(self, channel):
+        """Mean over the whole window, O(1)"""
+        if not self.count:
+            return None
+        return self.sums[channel] / self.count / SCALE[channel]
+
+    def get(self, age):
+        """Sample age steps back from the newest as (epoch, t, h, p)"""
+        if age >= self.count:
+            return None
+        slot = (self.head + self.count - 1 - age) % self.slots
+        base = slot * CHANNELS
+        return (self.times[slot],
+                self.values[base] / SCALE[0],
+                self.values[base + 1] / SCALE[1],
+                self.values[base + 2] / SCALE[2])
+
+
+class Rollup:
+    """Ring of fixed-length buckets holding min/max/mean/count per channel"""
+
+    def __init__(self, slots, period_s):
+        self.slots = slots
+        self.period = period_s
+        self.min = array('h', [0]) * (slots * CHANNELS)
+        self.max = array('h', [0]) * (slots * CHANNELS)
+        self.mean = array('f', [0]) * (slots * CHANNELS)
+        self.count = array('H', [0]) * slots
+        self.head = 0
+        self.bucket = None  # bucket number (epoch // period) of the head slot
+        self.cached_bucket = None  # fixed_mean() result and what it was for
+        self.cached_age = None
+        self.cached_channel = None
+        self.cached_mean = None
+
+    def add(self, epoch, fixed):
+        bucket = epoch // self.period
+        if self.bucket is None:
+            self.bucket = bucket
+        elif bucket > self.bucket:
+            # Open a new bucket, leaving empty slots for any gap
+            for _ in range(min(bucket - self.bucket, self.slots)):
+                self.head = (self.head + 1) % self.slots
+                self.count[self.head] = 0
+            self.bucket = bucket
+        slot = self.head
+        n = self.count[slot]
+        base = slot * CHANNELS
+        for ch in range(CHANNELS):
+            value = fixed[ch]
+            i = base + ch
+            if n == 0:
+                self.min[i] = value
+                self.max[i] = value
+                self.mean[i] = value
+            else:
+                if value < self.min[i]:
+                    self.min[i] = value
+                if value > self.max[i]:
+                    self.max[i] = value
+                self.mean[i] += (value - self.mean[i]) / (n + 1)
+        if n < 65535:
+            self.count[slot] = n + 1
+
+    def get(self, age, channel):
+        """Bucket age steps back from the newest as (start epoch, count, min, max, mean)"""
+        if self.bucket is None or age >= self.slots:
+            return None
+        slot = (self.head - age) % self.slots
+        n = self.count[slot]
+        start = (self.bucket - age) * self.period
+        if not n:
+            return start, 0, None, None, None
+        i = slot * CHANNELS + channel
+        scale = SCALE[channel]
+        return start, n, self.min[i] / scale, self.max[i] / scale, self.mean[i] / scale
+
+    def fixed_mean(self, age, channel):
+        """Fixed-point mean of the closed bucket age (> 0) steps back, None if
+        it is empty. Kept until the next bucket opens, so repeated calls in
+        the meantime cost no allocation."""
+        if self.bucket is None or age >= self.slots:
+            return None
+        if self.cached_bucket != self.bucket or self.cached_age != age or self.cached_channel != channel:
+            slot = (self.head - age) % self.slots
+            self.cached_bucket = self.bucket
+            self.cached_age = age
+            self.cached_channel = channel
+            self.cached_mean = int(round(self.mean[slot * CHANNELS + channel])) if self.count[slot] else None
+        return self.cached_mean
+
+    def aggregate(self, channel, buckets):
+        """Combine the newest buckets into (count, min, max, mean)"""
+        total = 0
+        low = None
+        high = None
+        weighted = 0.0
+        for age in range(min(buckets, self.slots)):
+            bucket = self.get(age, channel)
+            if bucket is None or not bucket[1]:
+                continue
+            _, n, bmin, bmax, bmean = bucket
+            total += n
+            weighted += bmean * n
+            low = bmin if low is None or bmin < low else low
+            high = bmax if high is None or bmax > high else high
+        if not total:
+            return 0, None, None, None
+        return total, low, high, weighted / total
+
+
+class TimeSeries:
+    """Raw ring plus minute and hour rollups fed by every sample"""
+
+    def __init__(self, raw_slots=360, raw_interval_s=10, minute_slots=240, hour_slots=168):
+        self.raw = RawRing(raw_slots, raw_interval_s)
+        self.minutes = Rollup(minute_slots, 60)
+        self.hours = Rollup(hour_slots, 3600)
+        self.fixed = [0] * CHANNELS
+
+    def add(self, epoch, temperature, humidity, pressure):
+        epoch = int(epoch)
+        fixed = self.fixed
+        fixed[TEMPERATURE] = to_fixed(temperature, TEMPERATURE)
+        fixed[HUMIDITY] = to_fixed(humidity, HUMIDITY)
+        fixed[PRESSURE] = to_fixed(pressure, PRESSURE)
+        self.raw.add(epoch, fixed)
+        self.minutes.add(epoch, fixed)
+        self.hours.add(epoch, fixed)
+
+    def stats(self, channel, window_s):
+        """(count, min, max, mean) over the last window_s seconds.
+
+        Uses minute buckets when they cover the window, hour buckets otherwise.
+        """
+        if window_s <= self.minutes.slots * 60:
+            return self.minutes.aggregate(channel, (window_s + 59) // 60)
+        return self.hours.aggregate(channel, (window_s + 3599) // 3600)
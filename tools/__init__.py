@@ -0,0 +1 @@
+# Host-side tools for the weather station. Not deployed to the device.
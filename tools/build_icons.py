@@ -0,0 +1,195 @@
+# Convert the PNG weather icons into RGB565 blobs for icons.py.
+#
+#     python -m tools.build_icons img/w32 -o build/w32
+#     mpremote fs cp build/w32/*.565 :res/w32/
+#
+# Pure Python (zlib only) so no imaging library is needed. Handles
+# non-interlaced PNGs of every color type at 8-bit depth, and palette or
+# grayscale images at lower depths. Pixels with alpha below --threshold
+# become the blob's transparent key; partly transparent ones are blended
+# onto --background, which should match the screen behind the icons.
+import argparse
+import glob
+import os
+import struct
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from icons import EXTENSION, FLAG_KEYED, HEADER, MAGIC
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+class PNGError(ValueError):
+    pass
+
+
+def _chunks(data):
+    if data[:8] != PNG_SIGNATURE:
+        raise PNGError("not a PNG file")
+    pos = 8
+    while pos < len(data):
+        length, kind = struct.unpack_from(">I4s", data, pos)
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def _unfilter(raw, width, height, bpp, stride):
+    """Undo the per-row PNG filters, returning the packed scanlines"""
+    out = bytearray(stride * height)
+    prev = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        kind = raw[pos]
+        line = bytearray(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        for i in range(stride):
+            left = line[i - bpp] if i >= bpp else 0
+            up = prev[i]
+            if kind == 1:
+                line[i] = (line[i] + left) & 0xFF
+            elif kind == 2:
+                line[i] = (line[i] + up) & 0xFF
+            elif kind == 3:
+                line[i] = (line[i] + ((left + up) >> 1)) & 0xFF
+            elif kind == 4:
+                upleft = prev[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + _paeth(left, up, upleft)) & 0xFF
+            elif kind != 0:
+                raise PNGError("bad filter type {}".format(kind))
+        out[y * stride:(y + 1) * stride] = line
+        prev = line
+    return out
+
+
+def decode_png(data):
+    """Decode a PNG into (width, height, [(r, g, b, a), ...])"""
+    header = None
+    palette = b''
+    alpha = b''
+    idat = []
+    for kind, body in _chunks(data):
+        if kind == b'IHDR':
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b'PLTE':
+            palette = body
+        elif kind == b'tRNS':
+            alpha = body
+        elif kind == b'IDAT':
+            idat.append(body)
+        elif kind == b'IEND':
+            break
+    if header is None:
+        raise PNGError("missing IHDR")
+    width, height, depth, color_type, _, _, interlace = header
+    if interlace:
+        raise PNGError("interlaced PNGs are not supported")
+    if color_type not in CHANNELS or (depth != 8 and color_type not in (0, 3)):
+        raise PNGError("unsupported format: color type {}, depth {}".format(color_type, depth))
+    channels = CHANNELS[color_type]
+    stride = (width * channels * depth + 7) // 8
+    bpp = max(1, channels * depth // 8)
+    rows = _unfilter(zlib.decompress(b''.join(idat)), width, height, bpp, stride)
+
+    pixels = []
+    for y in range(height):
+        line = rows[y * stride:(y + 1) * stride]
+        for x in range(width):
+            if depth == 8:
+                v = line[x * channels:(x + 1) * channels]
+            else:
+                bit = x * depth
+                v = ((line[bit >> 3] >> (8 - depth - (bit & 7))) & ((1 << depth) - 1),)
+            if color_type == 3:
+                i = v[0]
+                r, g, b = palette[i * 3:i * 3 + 3]
+                a = alpha[i] if i < len(alpha) else 255
+            elif color_type == 0:
+                r = g = b = v[0] * 255 // ((1 << depth) - 1)
+                a = 255
+                if len(alpha) == 2 and v[0] == struct.unpack(">H", alpha)[0]:
+                    a = 0
+            elif color_type == 4:
+                r = g = b = v[0]
+                a = v[1]
+            elif color_type == 2:
+                r, g, b = v
+                a = 255
+                if len(alpha) == 6 and (r, g, b) == struct.unpack(">HHH", alpha):
+                    a = 0
+            else:
+                r, g, b, a = v
+            pixels.append((r, g, b, a))
+    return width, height, pixels
+
+
+def rgb565(r, g, b):
+    return ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+
+
+def to_blob(width, height, pixels, background=0x111111, threshold=128):
+    """Pack decoded pixels into an icons.py blob"""
+    bg = ((background >> 16) & 0xFF, (background >> 8) & 0xFF, background & 0xFF)
+    values = []
+    for r, g, b, a in pixels:
+        if a < threshold:
+            values.append(None)
+            continue
+        if a < 255:
+            r = (r * a + bg[0] * (255 - a)) // 255
+            g = (g * a + bg[1] * (255 - a)) // 255
+            b = (b * a + bg[2] * (255 - a)) // 255
+        values.append(rgb565(r, g, b))
+    flags = 0
+    key = 0
+    if None in values:
+        used = set(values)
+        # Magenta first, it is the least likely color in a weather icon
+        key = next(k for k in [0xF81F] + list(range(0x10000)) if k not in used)
+        flags = FLAG_KEYED
+    out = bytearray(struct.pack(HEADER, MAGIC, width, height, flags, key))
+    for v in values:
+        out += struct.pack("<H", key if v is None else v)
+    return bytes(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert PNG icons into RGB565 blobs")
+    parser.add_argument('source', nargs='?', default='img/w32', help="directory of PNG icons")
+    parser.add_argument('-o', '--output', default='build/w32', help="output directory")
+    parser.add_argument('--background', type=lambda v: int(v, 0), default=0x111111,
+                        help="screen color partly transparent pixels are blended onto (the screens' 0x111111)")
+    parser.add_argument('--threshold', type=int, default=128,
+                        help="alpha below which a pixel is left undrawn")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    total = 0
+    for path in sorted(glob.glob(os.path.join(args.source, '*.png'))):
+        with open(path, 'rb') as f:
+            width, height, pixels = decode_png(f.read())
+        blob = to_blob(width, height, pixels, args.background, args.threshold)
+        name = os.path.splitext(os.path.basename(path))[0] + EXTENSION
+        with open(os.path.join(args.output, name), 'wb') as f:
+            f.write(blob)
+        total += len(blob)
+        print("{} -> {} ({}x{}, {} bytes)".format(os.path.basename(path), name, width, height, len(blob)))
+    print("{} bytes in {}".format(total, args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# Pack assets into one indexed resource bundle for resources.py.
+#
+#     python -m tools.build_icons img/w32 -o build/w32
+#     python -m tools.pack_resources build/w32=w32 -o build/res.bin
+#     python -m tools.pack_resources --list build/res.bin
+#
+# Each source is DIR[=PREFIX]; every file in DIR is stored as PREFIX/name
+# (just name without a prefix). Fonts or other assets can be added as more
+# sources. Entries are 4-byte aligned and indexed by a hash of their name,
+# which must be unique. Deploy the bundle with deploy_icons.ps1 -Bundle, which
+# copies it under a temporary name and renames it over the old one, so the
+# device never sees a half-written bundle.
+import argparse
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resources import ENTRY, ENTRY_SIZE, HEADER, HEADER_SIZE, MAGIC, VERSION, name_hash, name_check
+
+
+def collect(sources):
+    """(name, path) for every file in the DIR[=PREFIX] sources"""
+    assets = []
+    for source in sources:
+        directory, _, prefix = source.partition('=')
+        for entry in sorted(os.listdir(directory)):
+            path = os.path.join(directory, entry)
+            if os.path.isfile(path):
+                assets.append((prefix + '/' + entry if prefix else entry, path))
+    return assets
+
+
+def pack(assets):
+    """Build a bundle from (name, bytes) pairs"""
+    hashes = {}
+    for name, _ in assets:
+        h = name_hash(name)
+        if h in hashes:
+            raise ValueError("hash collision between {} and {}".format(hashes[h], name))
+        hashes[h] = name
+    assets = sorted(assets, key=lambda a: name_hash(a[0]))
+    offset = HEADER_SIZE + len(assets) * ENTRY_SIZE
+    index = bytearray()
+    data = bytearray()
+    for name, content in assets:
+        pad = -(offset + len(data)) % 4
+        data += bytes(pad)
+        index += struct.pack(ENTRY, name_hash(name), offset + len(data), len(content), name_check(name))
+        data += content
+    names = bytearray()
+    for name, _ in assets:
+        encoded = name.encode()
+        names += struct.pack("<H", len(encoded)) + encoded
+    names_offset = offset + len(data)
+    header = struct.pack(HEADER, MAGIC, VERSION, len(assets), names_offset)
+    return bytes(header + index + data + names)
+
+
+def entries(bundle):
+    """(name, offset, length) for every entry of a bundle"""
+    magic, version, count, names_offset = struct.unpack_from(HEADER, bundle)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a resource bundle")
+    pos = names_offset
+    out = []
+    for i in range(count):
+        _, offset, length, _ = struct.unpack_from(ENTRY, bundle, HEADER_SIZE + i * ENTRY_SIZE)
+        size, = struct.unpack_from("<H", bundle, pos)
+        out.append((bundle[pos + 2:pos + 2 + size].decode(), offset, length))
+        pos += 2 + size
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack assets into a resource bundle")
+    parser.add_argument('sources', nargs='*', help="DIR[=PREFIX] to pack")
+    parser.add_argument('-o', '--output', default='build/res.bin', help="bundle to write")
+    parser.add_argument('--list', metavar='BUNDLE', help="list the contents of a bundle instead")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        with open(args.list, 'rb') as f:
+            for name, offset, length in sorted(entries(f.read())):
+                print("{:<32}{:>8}{:>8}".format(name, offset, length))
+        return 0
+    if not args.sources:
+        parser.error("no sources given")
+
+    assets = []
+    for name, path in collect(args.sources):
+        with open(path, 'rb') as f:
+            assets.append((name, f.read()))
+    bundle = pack(assets)
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'wb') as f:
+        f.write(bundle)
+    print("{} assets, {} bytes in {}".format(len(assets), len(bundle), args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# Replay a recorded sensor trace through the reporting filter.
+#
+#     python -m tools.replay_filter trace.csv --deadband 0.5 1 1 --swing 0.2 1 0.3
+#
+# The trace is CSV with epoch seconds, temperature, humidity and pressure per
+# line (a header line is skipped). The report shows how many readings would
+# be published and the worst error when the published points are linearly
+# interpolated back onto the trace.
+import argparse
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_filter import ReportFilter
+
+CHANNELS = ("temperature", "humidity", "pressure")
+
+
+def load_trace(path):
+    trace = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            try:
+                trace.append((float(row[0]), tuple(float(v) for v in row[1:4])))
+            except (ValueError, IndexError):
+                continue
+    return trace
+
+
+def replay(trace, report_filter):
+    """Run the trace through the filter, return the reported points"""
+    reported = []
+    for epoch, values in trace:
+        report = report_filter.update(epoch, values)
+        if report is not None:
+            reported.append(report)
+    return reported
+
+
+def max_errors(trace, reported):
+    """Worst absolute error per channel of the interpolated reported points"""
+    errors = [0.0] * len(CHANNELS)
+    j = 0
+    for epoch, values in trace:
+        while j + 1 < len(reported) and reported[j + 1][0] <= epoch:
+            j += 1
+        t0, v0 = reported[j]
+        if j + 1 < len(reported):
+            t1, v1 = reported[j + 1]
+        else:
+            # Past the last reported point the subscriber only has that value
+            t1, v1 = t0, v0
+        for ch in range(len(CHANNELS)):
+            if t1 == t0 or epoch <= t0:
+                estimate = v0[ch]
+            else:
+                estimate = v0[ch] + (v1[ch] - v0[ch]) * (epoch - t0) / (t1 - t0)
+            errors[ch] = max(errors[ch], abs(estimate - values[ch]))
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a sensor trace through the reporting filter")
+    parser.add_argument('trace')
+    parser.add_argument('--deadband', type=float, nargs=3, default=(0.5, 1.0, 1.0))
+    parser.add_argument('--deadband-pct', type=float, nargs=3, default=(0, 0, 0))
+    parser.add_argument('--swing', type=float, nargs=3, default=(0, 0, 0))
+    parser.add_argument('--min-interval', type=float, default=0)
+    parser.add_argument('--max-silence', type=float, default=0)
+    args = parser.parse_args(argv)
+
+    trace = load_trace(args.trace)
+    if not trace:
+        parser.error("no readings in {}".format(args.trace))
+    report_filter = ReportFilter(tuple(args.deadband), tuple(args.deadband_pct),
+                                 tuple(args.swing), args.min_interval, args.max_silence)
+    reported = replay(trace, report_filter)
+    errors = max_errors(trace, reported)
+    print("readings: {}  published: {}  ratio: {:.1f}x".format(
+        len(trace), len(reported), len(trace) / len(reported)))
+    for name, error in zip(CHANNELS, errors):
+        print("  {:<12} max error {:.3f}".format(name, error))
+    return reported
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# Reference decoder for weather/sensor_data payloads (CPython, ingest side).
+#
+#     from tools.sensor_decoder import decode
+#     readings = decode(payload)
+#
+# decode() accepts every format the station publishes and returns a list of
+# readings as dicts with timestamp, temperature, humidity and pressure, plus
+# the derived metrics (dew point, heat index, ...) that JSON payloads carry:
+#   - single JSON object with an ISO timestamp string
+#   - single 10-byte binary record
+#   - columnar JSON batch ("v" field)
+#   - packed binary batch
+#
+# Timestamps are UTC throughout. The ISO string of a single JSON reading is
+# the station's local time with its UTC offset ("2025-07-04T12:00:00+02:00");
+# every other format carries Unix seconds, which decode() passes through.
+#
+# Run as a script to decode hex payloads from the command line:
+#
+#     python -m tools.sensor_decoder 01010200e8030000...
+import json
+import struct
+import sys
+
+READING = "<IhHH"
+READING_SIZE = struct.calcsize(READING)
+BATCH_HEADER = "<BBHI"
+BATCH_HEADER_SIZE = struct.calcsize(BATCH_HEADER)
+BATCH_RECORD = "<HhHH"
+BATCH_RECORD_SIZE = struct.calcsize(BATCH_RECORD)
+SUPPORTED_VERSIONS = (1,)
+DERIVED = ('dew_point', 'abs_humidity', 'heat_index', 'sea_level_pressure', 'pressure_tendency')
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def _reading(timestamp, temp, hum, press):
+    return {
+        'timestamp': timestamp,
+        'temperature': temp / 100,
+        'humidity': hum / 100,
+        'pressure': press / 10,
+    }
+
+
+def decode_reading(payload):
+    """Decode a single 10-byte binary reading"""
+    if len(payload) != READING_SIZE:
+        raise DecodeError("binary reading must be {} bytes".format(READING_SIZE))
+    return [_reading(*struct.unpack(READING, payload))]
+
+
+def decode_binary_batch(payload):
+    if len(payload) < BATCH_HEADER_SIZE:
+        raise DecodeError("truncated batch header")
+    version, flags, count, base = struct.unpack_from(BATCH_HEADER, payload)
+    if version not in SUPPORTED_VERSIONS:
+        raise DecodeError("unsupported batch version {}".format(version))
+    if len(payload) != BATCH_HEADER_SIZE + count * BATCH_RECORD_SIZE:
+        raise DecodeError("batch length does not match count {}".format(count))
+    readings = []
+    for i in range(count):
+        delta, temp, hum, press = struct.unpack_from(
+            BATCH_RECORD, payload, BATCH_HEADER_SIZE + i * BATCH_RECORD_SIZE)
+        readings.append(_reading(base + delta, temp, hum, press))
+    return readings
+
+
+def decode_json(payload):
+    data = json.loads(payload)
+    if 'v' not in data:
+        reading = {
+            'timestamp': data.get('timestamp'),
+            'temperature': data.get('temperature'),
+            'humidity': data.get('humidity'),
+            'pressure': data.get('pressure'),
+        }
+        for name in DERIVED:
+            if name in data:
+                reading[name] = data[name]
+        return [reading]
+    if data['v'] not in SUPPORTED_VERSIONS:
+        raise DecodeError("unsupported batch version {}".format(data['v']))
+    columns = zip(data['ts'], data['temperature'], data['humidity'], data['pressure'])
+    readings = [{'timestamp': t, 'temperature': temp, 'humidity': hum, 'pressure': press}
+                for t, temp, hum, press in columns]
+    for name in DERIVED:
+        if name in data:
+            for reading, value in zip(readings, data[name]):
+                reading[name] = value
+    return readings
+
+
+def decode(payload):
+    """Decode any weather/sensor_data payload into a list of readings"""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    payload = bytes(payload)
+    if payload[:1] == b'{':
+        return decode_json(payload)
+    if len(payload) == READING_SIZE:
+        return decode_reading(payload)
+    return decode_binary_batch(payload)
+
+
+def main(argv):
+    for arg in argv:
+        for reading in decode(bytes.fromhex(arg)):
+            print(json.dumps(reading))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,194 @@
+# Weather data for the Home, Forecast and History screens.
+# Temperature formatting, icon lookup, parsing of weather/data messages into
+# the forecast and history slots, and the History screen scale.
+from state import config, device, weather, store, forecast_data, history_data, history_scale, HISTORY_BAR_HEIGHT
+
+# Temperature conversion functions
+def celsius_to_fahrenheit(celsius):
+    """Convert Celsius to Fahrenheit"""
+    return (celsius * 9.0 / 5.0) + 32.0
+
+def fahrenheit_to_celsius(fahrenheit):
+    """Convert Fahrenheit to Celsius"""
+    return (fahrenheit - 32.0) * 5.0 / 9.0
+
+def format_temperature(temp_celsius, show_unit=True):
+    """Format temperature according to current unit setting"""
+    if config['temperature_unit'] == "F":
+        temp_value = temp_celsius * 1.8 + 32.0
+        if show_unit:
+            return "{:.1f}°F".format(temp_value)
+        else:
+            return "{:.1f}".format(temp_value)
+    else:
+        if show_unit:
+            return "{:.1f}°C".format(temp_celsius)
+        else:
+            return "{:.1f}".format(temp_celsius)
+
+def get_temperature_unit_symbol():
+    """Get the current temperature unit symbol"""
+    return "°F" if config['temperature_unit'] == "F" else "°C"
+
+# Weather icon mapping, hashed by OpenWeatherMap icon code
+weather_icon_mapping = {
+    '01d': 'clear.png', '01n': 'nt_clear.png',
+    '02d': 'mostlysunny.png', '02n': 'cloudy.png',
+    '03d': 'cloudy.png', '03n': 'nt_cloudy.png',
+    '04d': 'cloudy.png', '04n': 'nt_cloudy.png',
+    '09d': 'rain.png', '09n': 'nt_rain.png',
+    '10d': 'rain.png', '10n': 'nt_rain.png',
+    '11d': 'tstorms.png', '11n': 'nt_tstorms.png',
+    '13d': 'snow.png', '13n': 'nt_snow.png',
+    '50d': 'fog.png', '50n': 'nt_fog.png'
+}
+
+def get_weather_icon(icon_code):
+    """Get weather icon filename from code"""
+    return weather_icon_mapping.get(icon_code, "unknown.png")
+
+def parse_forecast_data(weather_data):
+    """Parse forecast data from weather JSON and update forecast data structure"""
+    try:
+        if 'forecast' in weather_data:
+            for i, day_data in enumerate(weather_data['forecast'][:5]):
+                temp = day_data.get('temp', 0)
+                humidity = day_data.get('humidity', 0)
+                icon_code = day_data.get('icon', '')
+                
+                forecast_data[i] = (
+                    day_data.get('day', '')[:3],  # Truncate day name
+                    day_data.get('date', ''),
+                    "{}°".format(format_temperature(temp, False)),
+                    "{}%".format(humidity),
+                    get_weather_icon(icon_code)
+                )
+    except:
+        pass
+
+def parse_history_data(weather_data):
+    """Parse historical data from weather JSON and update history data structure"""
+    try:
+        if 'history' in weather_data:
+            for i, day_data in enumerate(weather_data['history'][:5]):
+                temp = day_data.get('temp', 0)
+                humidity = day_data.get('humidity', 0)
+                
+                history_data[i] = (
+                    day_data.get('day', '')[:3],  # Truncate day name
+                    day_data.get('date', ''),
+                    temp,
+                    humidity
+                )
+            update_history_scale()
+    except:
+        pass
+
+def update_history_scale():
+    """Precompute History ranges, bar heights and colors for the current data"""
+    temps = [h[2] for h in history_data if h]
+    # Zero humidity means the day had no reading
+    humidities = [h[3] for h in history_data if h and h[3]]
+    if temps:
+        low, high = min(temps), max(temps)
+        history_scale['temp'] = (low - 3, high + 3, low == high)
+    else:
+        history_scale['temp'] = (10, 40, False)
+    if humidities:
+        low, high = min(humidities), max(humidities)
+        history_scale['humidity'] = (max(0, low - 3), min(100, high + 3), low == high)
+    else:
+        history_scale['humidity'] = (0, 100, False)
+    bars = history_scale['bars']
+    for i, h in enumerate(history_data):
+        if h:
+            bars[i] = (
+                get_bar_height(h[2], "temp", HISTORY_BAR_HEIGHT),
+                get_bar_height(h[3], "humidity", HISTORY_BAR_HEIGHT),
+                get_temp_color_celsius(h[2]),
+                get_humidity_color(h[3])
+            )
+        else:
+            bars[i] = None
+
+def parse_weather_data(data):
+    try:
+        weather['temp'] = data.get("current_temp", 0.0)
+        weather['condition'] = data.get("condition", "")
+        current_icon = data.get("current_icon", "")
+        wind_speed = data.get("wind_speed", "")
+        wind_direction = data.get("wind_direction", "")
+        current_location = data.get("location", "Unknown")
+
+        # Screens watching these keys are redrawn on the next frame
+        store.set('weather', 'description', "O: {}, {}".format(format_temperature(weather['temp'], True), weather['condition']))
+        store.set('weather', 'wind', "Wind: {} m/s, {}".format(wind_speed, wind_direction))
+        store.set('weather', 'icon', get_weather_icon(current_icon))
+        
+        # Update forecast and history data
+        parse_forecast_data(data)
+        parse_history_data(data)
+        store.changed('weather', 'forecast')
+        store.changed('weather', 'history')
+    except:
+        pass
+
+def get_weather_parser():
+    if device['weather_parser'] is None:
+        from weather_parser import WeatherParser
+        device['weather_parser'] = WeatherParser(len(forecast_data))
+    return device['weather_parser']
+
+def get_temp_color(temp):
+    """Calculate color based on dynamic temperature scale with ±3°C buffer"""
+    # Convert temperature to Celsius for consistent color calculation
+    if config['temperature_unit'] == "F":
+        return get_temp_color_celsius(fahrenheit_to_celsius(temp))
+    return get_temp_color_celsius(temp)
+
+def get_temp_color_celsius(temp_celsius):
+    min_temp, max_temp, flat = history_scale['temp']
+    
+    # Clamp and interpolate color
+    if temp_celsius <= min_temp:
+        return 0x9acd32  # Yellow-green
+    elif temp_celsius >= max_temp:
+        return 0xff8c00  # Dark orange
+    else:
+        ratio = (temp_celsius - min_temp) / (max_temp - min_temp)
+        red = int(154 + (255 - 154) * ratio)
+        green = int(205 + (140 - 205) * ratio)
+        blue = int(50 + (0 - 50) * ratio)
+        return (red << 16) | (green << 8) | blue
+
+def get_humidity_color(humidity):
+    """Calculate color based on dynamic humidity scale with ±3% buffer"""
+    min_humidity, max_humidity, flat = history_scale['humidity']
+    
+    # Clamp and interpolate color
+    if humidity <= min_humidity:
+        return 0x87ceeb  # Light blue
+    elif humidity >= max_humidity:
+        return 0x000080  # Deep blue
+    else:
+        ratio = (humidity - min_humidity) / (max_humidity - min_humidity)
+        red = int(135 * (1 - ratio))
+        green = int(206 * (1 - ratio))
+        blue = int(235 * (1 - ratio) + 128 * ratio)
+        return (red << 16) | (green << 8) | blue
+
+def get_bar_height(value, data_type="temp", max_height=40):
+    """Calculate bar height based on value"""
+    # Ranges already include the buffer, see update_history_scale()
+    min_val, max_val, flat = history_scale['temp' if data_type == "temp" else 'humidity']
+    if flat:
+        return max_height // 2
+    
+    # Scale value
+    if value <= min_val:
+        return 5
+    elif value >= max_val:
+        return max_height
+    else:
+        ratio = (value - min_val) / (max_val - min_val)
+        return int(5 + (max_height - 5) * ratio)
@@ -0,0 +1,215 @@
+# Streaming parser for weather/data messages.
+# Walks the raw MQTT payload once and keeps only the fields the screens use,
+# without decoding the message to a str or building the dict tree that
+# ujson.loads() would. Values land in dicts allocated once up front; forecast
+# and history entries past the display slots, and any keys the firmware does
+# not know, are skipped in place. The heap cost of a message is therefore the
+# kept strings only, however large the server makes the payload.
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+QUOTE = 0x22
+BACKSLASH = 0x5C
+COMMA = 0x2C
+COLON = 0x3A
+LBRACE = 0x7B
+RBRACE = 0x7D
+LBRACKET = 0x5B
+RBRACKET = 0x5D
+# Space, tab, CR and LF - nothing else below it can appear outside a string
+SPACE = 0x20
+
+# Top-level fields and their defaults, matching parse_weather_data()
+CURRENT = (
+    ('current_temp', 0.0),
+    ('condition', ""),
+    ('current_icon', ""),
+    ('wind_speed', ""),
+    ('wind_direction', ""),
+    ('location', "Unknown")
+)
+FORECAST = (('day', ""), ('date', ""), ('temp', 0), ('humidity', 0), ('icon', ""))
+HISTORY = (('day', ""), ('date', ""), ('temp', 0), ('humidity', 0))
+
+
+class WeatherParser:
+    """Extract the UI fields of a weather/data message into fixed slots"""
+
+    def __init__(self, slots=5):
+        self.slots = slots
+        self.data = {}
+        self.forecast = [{} for _ in range(slots)]
+        self.history = [{} for _ in range(slots)]
+        self.buf = b''
+        self.pos = 0
+
+    def parse(self, buf):
+        """Parse a message; returns a dict shaped like ujson.loads() output.
+
+        The returned dict and its entries are reused by the next call.
+        Raises ValueError on malformed JSON.
+        """
+        self.buf = buf
+        self.pos = 0
+        data = self.data
+        for key, default in CURRENT:
+            data[key] = default
+        data.pop('forecast', None)
+        data.pop('history', None)
+        try:
+            self._expect(LBRACE)
+            if not self._close(RBRACE):
+                while True:
+                    key = self._string()
+                    self._expect(COLON)
+                    if key == 'forecast':
+                        data[key] = self._entries(self.forecast, FORECAST)
+                    elif key == 'history':
+                        data[key] = self._entries(self.history, HISTORY)
+                    elif key in data:
+                        self._scalar(data, key)
+                    else:
+                        self._skip()
+                    if self._close(RBRACE):
+                        break
+                    self._expect(COMMA)
+        except IndexError:
+            raise ValueError("truncated JSON")
+        finally:
+            self.buf = b''
+        return data
+
+    def _entries(self, slots, fields):
+        """Fill slots from an array of objects, return the filled ones"""
+        if self._peek() != LBRACKET:
+            self._skip()
+            return slots[:0]
+        self.pos += 1
+        count = 0
+        if self._close(RBRACKET):
+            return slots[:0]
+        while True:
+            if count < self.slots and self._peek() == LBRACE:
+                self._object(slots[count], fields)
+                count += 1
+            else:
+                self._skip()
+            if self._close(RBRACKET):
+                return slots[:count]
+            self._expect(COMMA)
+
+    def _object(self, entry, fields):
+        for key, default in fields:
+            entry[key] = default
+        self.pos += 1
+        if self._close(RBRACE):
+            return
+        while True:
+            key = self._string()
+            self._expect(COLON)
+            if key in entry:
+                self._scalar(entry, key)
+            else:
+                self._skip()
+            if self._close(RBRACE):
+                return
+            self._expect(COMMA)
+
+    def _scalar(self, target, key):
+        """Store a string or number; nested values keep the default"""
+        c = self._peek()
+        if c == QUOTE:
+            target[key] = self._string()
+        elif c == LBRACE or c == LBRACKET:
+            self._skip()
+        else:
+            start = self.pos
+            self._skip()
+            token = self.buf[start:self.pos]
+            if token == b'null':
+                return
+            if token == b'true' or token == b'false':
+                target[key] = token == b'true'
+            elif b'.' in token or b'e' in token or b'E' in token:
+                target[key] = float(token.decode())
+            else:
+                target[key] = int(token.decode())
+
+    def _string(self):
+        if self._peek() != QUOTE:
+            raise ValueError("expected string at {}".format(self.pos))
+        buf = self.buf
+        start = self.pos + 1
+        end = self._string_end(start)
+        self.pos = end + 1
+        if buf.find(b'\\', start, end) >= 0:
+            # Rare: let ujson handle the escapes of this one token
+            return json.loads(buf[start - 1:end + 1])
+        return buf[start:end].decode()
+
+    def _string_end(self, i):
+        """Index of the quote closing a string whose body starts at i"""
+        buf = self.buf
+        while True:
+            end = buf.find(b'"', i)
+            if end < 0:
+                raise IndexError
+            # A quote is escaped by an odd number of backslashes before it
+            back = end
+            while buf[back - 1] == BACKSLASH:
+                back -= 1
+            if (end - back) % 2 == 0:
+                return end
+            i = end + 1
+
+    def _skip(self):
+        """Move past one value of any type without keeping it"""
+        buf = self.buf
+        c = self._peek()
+        if c == QUOTE:
+            self.pos = self._string_end(self.pos + 1) + 1
+        elif c == LBRACE or c == LBRACKET:
+            depth = 0
+            i = self.pos
+            while True:
+                c = buf[i]
+                if c == QUOTE:
+                    i = self._string_end(i + 1)
+                elif c == LBRACE or c == LBRACKET:
+                    depth += 1
+                elif c == RBRACE or c == RBRACKET:
+                    depth -= 1
+                    if not depth:
+                        break
+                i += 1
+            self.pos = i + 1
+        else:
+            i = self.pos
+            end = len(buf)
+            while i < end and buf[i] > SPACE and buf[i] not in (COMMA, RBRACE, RBRACKET):
+                i += 1
+            if i == self.pos:
+                raise ValueError("expected value at {}".format(i))
+            self.pos = i
+
+    def _peek(self):
+        buf = self.buf
+        i = self.pos
+        while buf[i] <= SPACE:
+            i += 1
+        self.pos = i
+        return buf[i]
+
+    def _expect(self, c):
+        if self._peek() != c:
+            raise ValueError("expected {} at {}".format(chr(c), self.pos))
+        self.pos += 1
+
+    def _close(self, c):
+        """Consume c if it is next"""
+        if self._peek() == c:
+            self.pos += 1
+            return True
+        return False